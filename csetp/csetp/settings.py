@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,6 +48,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # After authentication: staff may ask for a trace with a header
+    'website.memory_profiler.MemoryProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -78,9 +82,244 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when a transaction starts, so read-modify-write
+            # updates (e.g. exercise analytics) wait instead of failing to upgrade.
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# PRAGMAs applied to every SQLite connection (see website/sqlite_profiles.py):
+# 'baseline', 'wal' or 'tuned'. WAL lets writes (sessions, submission log)
+# commit while student queries are still reading or streaming their results.
+# Compare them with `python manage.py benchmark_sqlite_profiles`. WAL is a
+# property of the database file: it stays on (with db.sqlite3-wal and -shm
+# next to the file while connections are open) until a connection under
+# 'baseline' switches the file back.
+SQLITE_PROFILE = os.environ.get('CSETP_SQLITE_PROFILE', 'tuned')
+
+# Student queries run through a second, read-only connection to the exercise
+# data so they never wait on writes made through 'default' (sessions, custom
+# question sets).
+EXERCISE_DB_ALIAS = 'exercise'
+EXERCISE_DATABASE_PATH = BASE_DIR / 'db.sqlite3'
+
+# Only enable when EXERCISE_DATABASE_PATH points at a file nothing writes to
+# (e.g. a snapshot of the dataset); SQLite then skips locking and change
+# detection entirely.
+EXERCISE_DATASET_FROZEN = False
+
+DATABASES[EXERCISE_DB_ALIAS] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': EXERCISE_DATABASE_PATH.as_uri() + '?mode=ro' + ('&immutable=1' if EXERCISE_DATASET_FROZEN else ''),
+    'TEST': {'MIRROR': 'default'},
+}
+
+# Set CSETP_EXERCISE_DB_BACKEND=postgresql to run student queries against a
+# PostgreSQL copy of the dataset (see README) instead of the SQLite file.
+EXERCISE_DB_BACKEND = os.environ.get('CSETP_EXERCISE_DB_BACKEND', 'sqlite')
+
+if EXERCISE_DB_BACKEND == 'postgresql':
+    DATABASES[EXERCISE_DB_ALIAS] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('CSETP_PG_NAME', 'csetp'),
+        'USER': os.environ.get('CSETP_PG_USER', 'csetp'),
+        'PASSWORD': os.environ.get('CSETP_PG_PASSWORD', ''),
+        'HOST': os.environ.get('CSETP_PG_HOST', 'localhost'),
+        'PORT': os.environ.get('CSETP_PG_PORT', '5432'),
+        # Reuse pooled connections across requests (requires psycopg[pool] and Django >= 5.1)
+        'OPTIONS': {'pool': True},
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Where student queries run: 'memory' uses a per-worker in-memory copy of the
+# employees and projects tables, reloaded when the dataset version changes;
+# 'database' queries the EXERCISE_DB_ALIAS connection directly. 'memory' only
+# applies to the SQLite backend.
+EXERCISE_EXECUTION_MODE = os.environ.get('CSETP_EXERCISE_EXECUTION_MODE', 'memory')
+
+# Per-statement limit for student queries on PostgreSQL, in milliseconds
+EXERCISE_STATEMENT_TIMEOUT_MS = 2000
+
+# Tables student and expected queries may read. On SQLite an authorizer denies
+# everything else (QueryExecutor.get_cursor); exercises can narrow it further
+# (a question set's table selection).
+EXERCISE_TABLES = ('employees', 'projects')
+
+# Rows fetched per round trip when reading results (server-side cursors on PostgreSQL)
+EXERCISE_FETCH_SIZE = 2000
+
+DATABASE_ROUTERS = ['website.routers.ExerciseRouter']
+
+# How often (seconds) each process re-checks the dataset version for changes
+DATASET_VERSION_TTL = 5
+
+# Default time budget for running a student query, in milliseconds
+EXERCISE_TIME_BUDGET_MS = 2000
+
+# Answers that are correct on the real data are re-graded on this many
+# perturbed in-memory copies of it, in parallel, to catch hard-coded results
+# ('memory' execution mode only). The cross-check may add at most
+# CROSS_CHECK_BUDGET_MS to grading; if a copy does not finish in time the
+# answer is not accepted and the student is asked to submit it again.
+CROSS_CHECK_COPIES = 3
+CROSS_CHECK_BUDGET_MS = 500
+CROSS_CHECK_WORKERS = 4
+
+# Example rows shown per side (missing/extra) when a result is wrong
+RESULT_DIFF_EXAMPLES = 5
+
+# How row results of exercises that hide the result are compared: 'database'
+# computes the difference between the student and expected query inside the
+# database (website/comparison.py), 'python' fetches every row and checks it
+# off in the worker. Exercises that show the result always use 'python', as the
+# rows pass through the worker anyway. A QUERY_CONFIGS entry may override it.
+RESULT_COMPARISON = 'database'
+
+# When student queries run on the live database (not the in-memory copy), run
+# the expected query again with every submission, in the same read transaction,
+# so a concurrent dataset change cannot make a correct answer fail. False uses
+# the expected result cached per dataset version instead.
+SNAPSHOT_GRADING = True
+
+# Progress streaming (website/progress.py): submissions sent to the events
+# endpoint run on a pool of PROGRESS_WORKERS threads, report progress every
+# PROGRESS_INTERVAL_MS and fetch at most PROGRESS_QUEUE_BATCHES batches of
+# EXERCISE_FETCH_SIZE rows ahead of what the client has been sent.
+PROGRESS_WORKERS = 8
+PROGRESS_INTERVAL_MS = 250
+PROGRESS_QUEUE_BATCHES = 4
+
+# Bulk question set import (website/question_sets.py): every correct query is
+# test-executed within QUESTION_SET_IMPORT_BUDGET_MS on a pool of
+# QUESTION_SET_IMPORT_WORKERS threads; larger uploads are rejected.
+QUESTION_SET_IMPORT_BUDGET_MS = 2000
+QUESTION_SET_IMPORT_WORKERS = 8
+QUESTION_SET_IMPORT_MAX_BYTES = 20 * 1024 * 1024
+
+# Background jobs (website/jobs.py): JOB_WORKERS threads per serving process
+# run queued jobs; the table is checked every JOB_POLL_INTERVAL seconds (jobs
+# queued by the same process start at once). A failing job is retried up to
+# JOB_MAX_ATTEMPTS times, JOB_RETRY_DELAY * attempt seconds apart, and a job
+# running for longer than JOB_TIMEOUT seconds is assumed lost and queued again.
+JOB_QUEUE_ENABLED = True
+JOB_WORKERS = 2
+JOB_POLL_INTERVAL = 5
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 10
+JOB_TIMEOUT = 600
+# Most recent jobs listed on the dashboard
+JOB_DASHBOARD_ROWS = 10
+
+# Memory profiling (website/memory_profiler.py). With MEMORY_PROFILE_ENABLED
+# (env CSETP_MEMORY_PROFILE=1) a MEMORY_PROFILE_SAMPLE_RATE fraction of requests
+# is traced with tracemalloc, one at a time; staff (anyone with DEBUG) can
+# trace a single request with an "X-Memory-Profile: 1" header. A phase peaking
+# above MEMORY_PROFILE_SNAPSHOT_BYTES dumps a snapshot into
+# MEMORY_PROFILE_DUMP_DIR (env CSETP_MEMORY_PROFILE_DUMP_DIR, in the system temp
+# directory by default; open with tracemalloc.Snapshot.load).
+MEMORY_PROFILE_ENABLED = os.environ.get('CSETP_MEMORY_PROFILE') == '1'
+MEMORY_PROFILE_SAMPLE_RATE = 0.01
+MEMORY_PROFILE_FRAMES = 10
+MEMORY_PROFILE_SNAPSHOT_BYTES = 50 * 1024 * 1024
+MEMORY_PROFILE_DUMP_DIR = Path(
+    os.environ.get('CSETP_MEMORY_PROFILE_DUMP_DIR', Path(tempfile.gettempdir()) / 'csetp-memory-snapshots')
+)
+
+# Request profiling (website/request_profiler.py). With PROFILE_ENABLED (env
+# CSETP_PROFILE=1) a PROFILE_SAMPLE_RATE fraction of grading requests runs
+# under cProfile, one at a time; a request can also ask for it with an
+# X-Profile header from `manage.py profile_report --token`, valid for
+# PROFILE_TOKEN_MAX_AGE seconds. Profiles go to PROFILE_DIR (env
+# CSETP_PROFILE_DIR, in the system temp directory by default), which keeps the
+# newest PROFILE_KEEP of them.
+PROFILE_ENABLED = os.environ.get('CSETP_PROFILE') == '1'
+PROFILE_SAMPLE_RATE = 0.01
+PROFILE_TOKEN_MAX_AGE = 3600
+PROFILE_DIR = Path(os.environ.get('CSETP_PROFILE_DIR', Path(tempfile.gettempdir()) / 'csetp-profiles'))
+PROFILE_KEEP = 200
+
+# Performance feedback (website/performance.py): submissions that ask for it
+# get their execution time and rows returned, as measured while grading them,
+# and the rows scanned and query plan from an EXPLAIN QUERY PLAN run on a pool
+# of PERFORMANCE_WORKERS threads. Built-in exercises offer it when
+# PERFORMANCE_FEEDBACK is set (a QUERY_CONFIGS entry may override it), custom
+# question sets when their performance_feedback box is ticked. A submission may
+# pick one of PERFORMANCE_SCALES (employees in an in-memory copy of the
+# dataset, built on first use) to have the query timed again on it; queries on
+# it are stopped after PERFORMANCE_TIME_LIMIT_MS. A verdict waits at most
+# PERFORMANCE_WAIT_MS for its measurement, which is dropped after that. Every
+# worker process keeps one copy of each scale it has used, shared by its
+# threads, about 160 MB for a million rows, so that scale is only offered
+# when CSETP_PERFORMANCE_LARGE_SCALES=1.
+PERFORMANCE_FEEDBACK = True
+PERFORMANCE_SCALES = {'1k': 1_000, '100k': 100_000}
+if os.environ.get('CSETP_PERFORMANCE_LARGE_SCALES') == '1':
+    PERFORMANCE_SCALES['1m'] = 1_000_000
+PERFORMANCE_WORKERS = 2
+PERFORMANCE_TIME_LIMIT_MS = 5000
+PERFORMANCE_WAIT_MS = 2000
+
+# Session sandboxes (website/sandbox.py): private in-memory copies of the
+# dataset in which students may create indexes. The least recently used are
+# dropped once a worker's sandboxes take more than SANDBOX_MEMORY_BYTES.
+# Statements are stopped after SANDBOX_TIME_LIMIT_MS; the first
+# SANDBOX_MAX_ROWS rows of a result are returned.
+SANDBOX_MEMORY_BYTES = 512 * 1024 * 1024
+SANDBOX_TIME_LIMIT_MS = 5000
+SANDBOX_MAX_ROWS = 100
+
+# Single-flight computations (website/single_flight.py): concurrent requests
+# within a worker for the same expected or predict result share one
+# computation. With SINGLE_FLIGHT_CROSS_PROCESS worker processes also wait for
+# each other's expected results, via lock files and JSON result files (at most
+# SINGLE_FLIGHT_SHARED_MAX_BYTES each) in SINGLE_FLIGHT_DIR, for at most
+# SINGLE_FLIGHT_WAIT seconds; files unused for SINGLE_FLIGHT_FILE_TTL seconds
+# are removed. The directory (env CSETP_SINGLE_FLIGHT_DIR, in the system temp
+# directory by default) must be shared by the workers but not by other sites.
+SINGLE_FLIGHT_CROSS_PROCESS = True
+SINGLE_FLIGHT_DIR = Path(
+    os.environ.get('CSETP_SINGLE_FLIGHT_DIR', Path(tempfile.gettempdir()) / 'csetp-single-flight')
+)
+SINGLE_FLIGHT_WAIT = 30
+SINGLE_FLIGHT_FILE_TTL = 60
+SINGLE_FLIGHT_SHARED_MAX_BYTES = 1024 * 1024
+
+# How long (seconds) a compiled custom question set is trusted before it is
+# reloaded, so edits made in another worker are picked up
+EXERCISE_CACHE_TTL = 60
+
+# Compile exercises and compute expected results in a background thread when a
+# worker starts; /ready/ reports 503 until this has finished
+WARMUP_ON_STARTUP = True
+
+# Background threads (warmup, job worker) only start in processes known to
+# serve requests: runserver, gunicorn, uwsgi or daphne. Set this for any other
+# server so it starts them too.
+SERVES_REQUESTS = os.environ.get('CSETP_SERVES_REQUESTS') == '1'
+
+
+# Graded attempts are buffered in memory and written in batches by a background
+# thread, so grading requests never wait on the SQLite write lock.
+SUBMISSION_LOG_ENABLED = True
+SUBMISSION_LOG_FLUSH_INTERVAL = 2.0  # seconds between flushes
+SUBMISSION_LOG_BATCH_SIZE = 200  # flush early once this many attempts are buffered
+SUBMISSION_LOG_MAX_BUFFER = 10000  # oldest attempts are dropped beyond this
+
+# Every executed query is aggregated per fingerprint in memory (query_log.py).
+# Executions slower than QUERY_LOG_SLOW_MS, or failing, are also kept in a
+# ring buffer of the last QUERY_LOG_RING_SIZE.
+QUERY_LOG_ENABLED = True
+QUERY_LOG_SLOW_MS = 500
+QUERY_LOG_RING_SIZE = 200
+QUERY_LOG_MAX_FINGERPRINTS = 1000
+
+# Distinct wrong-answer fingerprints tracked per exercise (Space-Saving sketch),
+# and how many of them the dashboard shows.
+ANALYTICS_WRONG_ANSWER_CAPACITY = 50
+ANALYTICS_TOP_WRONG_ANSWERS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -1,6 +1,18 @@
 from django.contrib import admin
 
-from .models import Employee
+from .models import Employee, Job, Submission
 
 admin.site.register(Employee)
 
+
+@admin.register(Submission)
+class SubmissionAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'exercise', 'session_key', 'verdict', 'latency_ms')
+    list_filter = ('exercise', 'verdict')
+    search_fields = ('session_key', 'query')
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'kind', 'status', 'attempts', 'finished_at')
+    list_filter = ('kind', 'status')
@@ -0,0 +1,228 @@
+"""
+Exercise Analytics
+Keeps per-exercise dashboard numbers up to date as attempts are logged.
+
+SubmissionLog.flush calls ExerciseAnalytics.apply with each batch it writes, in
+the same transaction, so the dashboard only ever reads precomputed counters:
+attempts, sessions, first-try successes, a time-to-solve histogram (for the
+median) and a Space-Saving top-K sketch of wrong-answer fingerprints.
+"""
+
+import bisect
+from collections import defaultdict
+
+from django.conf import settings
+
+from .models import CustomQuestionSet, ExerciseStats, SessionProgress
+
+
+# Upper bounds (seconds) of the time-to-solve histogram buckets; the last bucket is open-ended
+SOLVE_TIME_BUCKETS = [10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 86400]
+
+
+def median_from_histogram(histogram):
+    """
+    Estimate the median time-to-solve from bucket counts.
+    
+    Args:
+        histogram (list): Counts per bucket of SOLVE_TIME_BUCKETS
+    
+    Returns:
+        float: Median in seconds, interpolated within its bucket, or None if empty
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+    
+    target = total / 2
+    cumulative = 0
+    for index, count in enumerate(histogram):
+        if count and cumulative + count >= target:
+            lower = SOLVE_TIME_BUCKETS[index - 1] if index else 0
+            upper = SOLVE_TIME_BUCKETS[index] if index < len(SOLVE_TIME_BUCKETS) else lower * 2
+            return lower + (target - cumulative) / count * (upper - lower)
+        cumulative += count
+    return None
+
+
+def record_wrong_answer(sketch, fingerprint, capacity):
+    """
+    Count one occurrence of a fingerprint in a Space-Saving sketch.
+    
+    When the sketch is full the least frequent entry is replaced and the new
+    entry inherits its count as an overestimate, which keeps the most frequent
+    fingerprints with bounded memory.
+    
+    Args:
+        sketch (dict): {fingerprint: [count, overestimate]}, updated in place
+        fingerprint (str): Fingerprint of the wrong query
+        capacity (int): Maximum number of tracked fingerprints
+    """
+    if fingerprint in sketch:
+        sketch[fingerprint][0] += 1
+        return
+    
+    if len(sketch) < capacity:
+        sketch[fingerprint] = [1, 0]
+        return
+    
+    evicted = min(sketch, key=lambda key: sketch[key][0])
+    floor = sketch.pop(evicted)[0]
+    sketch[fingerprint] = [floor + 1, floor]
+
+
+def top_wrong_answers(sketch, limit=None):
+    """
+    Return the most frequent wrong-answer fingerprints.
+    
+    Returns:
+        list: (fingerprint, count) tuples, most frequent first
+    """
+    limit = limit or settings.ANALYTICS_TOP_WRONG_ANSWERS
+    ranked = sorted(sketch.items(), key=lambda item: item[1][0], reverse=True)
+    return [(fingerprint, counts[0]) for fingerprint, counts in ranked[:limit]]
+
+
+class ExerciseAnalytics:
+    """Incremental maintenance and read side of ExerciseStats."""
+    
+    @staticmethod
+    def apply(submissions):
+        """
+        Fold a batch of newly logged attempts into the per-exercise counters.
+        
+        Must run inside the transaction that writes the batch.
+        
+        Args:
+            submissions (list): Submission instances, in any order
+        """
+        by_exercise = defaultdict(list)
+        for submission in sorted(submissions, key=lambda s: s.created_at):
+            by_exercise[submission.exercise].append(submission)
+        
+        for exercise, attempts in by_exercise.items():
+            ExerciseAnalytics._apply_exercise(exercise, attempts)
+    
+    @staticmethod
+    def _apply_exercise(exercise, attempts):
+        stats, _ = ExerciseStats.objects.get_or_create(
+            exercise=exercise,
+            defaults={'question_set_id': ExerciseAnalytics._question_set_id(exercise)}
+        )
+        histogram = stats.solve_time_histogram or [0] * (len(SOLVE_TIME_BUCKETS) + 1)
+        
+        progress = {
+            p.session_key: p
+            for p in SessionProgress.objects.filter(
+                exercise=exercise,
+                session_key__in={attempt.session_key for attempt in attempts}
+            )
+        }
+        created = {}
+        
+        for attempt in attempts:
+            session = progress.get(attempt.session_key)
+            if session is None:
+                session = SessionProgress(
+                    exercise=exercise,
+                    session_key=attempt.session_key,
+                    first_attempt_at=attempt.created_at
+                )
+                progress[attempt.session_key] = created[attempt.session_key] = session
+                stats.sessions += 1
+                if attempt.verdict == 'correct':
+                    stats.first_try_correct += 1
+            
+            session.attempts += 1
+            stats.attempts += 1
+            
+            if attempt.verdict != 'correct':
+                record_wrong_answer(
+                    stats.wrong_answers,
+                    attempt.fingerprint,
+                    settings.ANALYTICS_WRONG_ANSWER_CAPACITY
+                )
+            elif session.solved_at is None:
+                session.solved_at = attempt.created_at
+                stats.solved_sessions += 1
+                seconds = (session.solved_at - session.first_attempt_at).total_seconds()
+                histogram[bisect.bisect_left(SOLVE_TIME_BUCKETS, seconds)] += 1
+        
+        SessionProgress.objects.bulk_create(created.values())
+        SessionProgress.objects.bulk_update(
+            [session for key, session in progress.items() if key not in created],
+            ['attempts', 'solved_at']
+        )
+        
+        stats.solve_time_histogram = histogram
+        stats.save()
+    
+    @staticmethod
+    def _question_set_id(exercise):
+        """Return the CustomQuestionSet pk for keys like 'custom:3:make', if it still exists."""
+        if not exercise.startswith('custom:'):
+            return None
+        pk = exercise.split(':')[1]
+        if pk.isdigit() and CustomQuestionSet.objects.filter(pk=pk).exists():
+            return int(pk)
+        return None
+    
+    @staticmethod
+    def summarize(exercise, rows):
+        """
+        Combine one or more ExerciseStats rows into dashboard numbers.
+        
+        Args:
+            exercise (str): Label for the summary
+            rows (list): ExerciseStats instances to combine
+        
+        Returns:
+            dict: Attempts, sessions, first-try rate, median solve time and top wrong answers
+        """
+        histogram = [0] * (len(SOLVE_TIME_BUCKETS) + 1)
+        sketch = {}
+        for row in rows:
+            for index, count in enumerate(row.solve_time_histogram):
+                histogram[index] += count
+            for fingerprint, (count, overestimate) in row.wrong_answers.items():
+                merged = sketch.setdefault(fingerprint, [0, 0])
+                merged[0] += count
+                merged[1] += overestimate
+        
+        sessions = sum(row.sessions for row in rows)
+        first_try_correct = sum(row.first_try_correct for row in rows)
+        
+        return {
+            'exercise': exercise,
+            'attempts': sum(row.attempts for row in rows),
+            'sessions': sessions,
+            'solved_sessions': sum(row.solved_sessions for row in rows),
+            'first_try_rate': first_try_correct / sessions * 100 if sessions else None,
+            'median_solve_seconds': median_from_histogram(histogram),
+            'top_wrong_answers': top_wrong_answers(sketch),
+        }
+    
+    @staticmethod
+    def dashboard():
+        """
+        Read the precomputed stats for the teacher dashboard.
+        
+        Returns:
+            tuple: (exercises, question_sets)
+                  exercises (list): One summary per exercise key
+                  question_sets (list): One summary per CustomQuestionSet, combining
+                                        its exercises, with a 'question_set' key
+        """
+        rows = list(ExerciseStats.objects.select_related('question_set'))
+        exercises = [ExerciseAnalytics.summarize(row.exercise, [row]) for row in rows]
+        
+        grouped = defaultdict(list)
+        for row in rows:
+            if row.question_set is not None:
+                grouped[row.question_set].append(row)
+        question_sets = [
+            dict(ExerciseAnalytics.summarize(question_set.name, set_rows), question_set=question_set)
+            for question_set, set_rows in grouped.items()
+        ]
+        
+        return exercises, question_sets
@@ -1,6 +1,26 @@
+import time
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class WebsiteConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'website'
+
+    def ready(self):
+        # Connect the signal receivers that invalidate cached exercise data
+        # and tune new SQLite connections
+        start = time.perf_counter()
+        from . import dataset, exercises, sqlite_profiles  # noqa: F401
+        from .warmup import serves_requests, should_warm_up, start_warmup, warmup_state
+        warmup_state.record('app imports', time.perf_counter() - start)
+
+        # Database access belongs outside ready(), so warm up in the background
+        if should_warm_up():
+            start_warmup()
+
+        # Pick up jobs queued before this process started
+        if settings.JOB_QUEUE_ENABLED and serves_requests():
+            from .jobs import job_queue
+            job_queue.wake()
@@ -0,0 +1,226 @@
+"""
+In-Database Result Comparison
+Compares a student query with the expected query inside the database.
+
+Both queries are wrapped as common table expressions with positional column
+names, every value is normalized in SQL the way QueryComparator normalizes it
+in Python (text, trimmed, lowercased), and the symmetric difference is computed
+with UNION ALL and GROUP BY counts. Only the verdict, the totals and a few
+sample rows of each side come back, so a large answer is never materialized in
+the worker.
+
+Values are trimmed of the same whitespace as str.strip() and NULL becomes
+'none' like str(None). Two differences to the Python comparison remain:
+SQLite's LOWER() only folds ASCII letters ('É' and 'é' stay different), and
+numbers are turned into text by the database (SQLite writes 1e20 as
+'1.0e+20', Python as '1e+20').
+"""
+
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from .executor import MEMORY_ALIAS, QueryExecutor
+from .query_log import query_log
+
+
+# How row results are compared
+COMPARE_PYTHON = 'python'      # rows fetched and checked off in Python (ResultMatcher)
+COMPARE_DATABASE = 'database'  # symmetric difference computed by the database
+
+# Code points str.strip() removes (every chr(code).isspace())
+WHITESPACE_CODES = (
+    9, 10, 11, 12, 13, 28, 29, 30, 31, 32, 133, 160, 5760, 8192, 8193, 8194, 8195, 8196, 8197,
+    8198, 8199, 8200, 8201, 8202, 8232, 8233, 8239, 8287, 12288,
+)
+
+# The same characters as an SQL string, and the function trimming them
+WHITESPACE_SQL = {
+    'sqlite': f"char({', '.join(map(str, WHITESPACE_CODES))})",
+    'postgresql': ' || '.join(f'chr({code})' for code in WHITESPACE_CODES),
+}
+TRIM_FUNCTION = {'sqlite': 'TRIM', 'postgresql': 'BTRIM'}
+
+
+class DatabaseComparator:
+    """Builds and runs the comparison query."""
+    
+    @staticmethod
+    def strip_query(query):
+        """
+        Drop trailing semicolons and comments so the query can be used as a subquery.
+        
+        Raises:
+            MultipleStatements: If the text holds more than one statement
+        """
+        return QueryExecutor.single_statement(query).strip()
+    
+    @staticmethod
+    def describe(cursor, query):
+        """
+        Return the column names of a query without running it.
+        
+        Args:
+            cursor: Open cursor
+            query (str): SELECT query, without a trailing semicolon
+        
+        Returns:
+            list: Column names
+        """
+        cursor.execute(f"SELECT * FROM (\n{query}\n) AS described LIMIT 0")
+        columns = [col[0] for col in cursor.description]
+        cursor.fetchall()
+        return columns
+    
+    @staticmethod
+    def column_positions(columns, rename_fields=None):
+        """
+        Map normalized column names to their positions.
+        
+        Like a result row dict, a repeated name keeps its last position.
+        
+        Returns:
+            dict: Column name -> position
+        """
+        positions = {}
+        for index, name in enumerate(columns):
+            if rename_fields and name in rename_fields:
+                name = rename_fields[name]
+            positions.pop(name, None)
+            positions[name] = index
+        return positions
+    
+    @staticmethod
+    def build_query(user_query, user_count, expected_query, expected_count, user_positions, expected_positions,
+                    example_rows, vendor='sqlite'):
+        """
+        Build the symmetric difference query.
+        
+        Rows are grouped on their normalized values; each group's balance is
+        (user occurrences - expected occurrences), so groups with a nonzero
+        balance are extra (positive) or missing (negative) rows. Every row of
+        the result carries both totals, and at most example_rows sample rows
+        of each side are returned (at least one, so an empty result always
+        means the results match). vendor ('sqlite' or 'postgresql') picks
+        the SQL dialect.
+        
+        Returns:
+            str: SQL without parameters (student queries may contain '%')
+        """
+        names = list(user_positions)
+        user_columns = ', '.join(f'c{i}' for i in range(user_count))
+        expected_columns = ', '.join(f'c{i}' for i in range(expected_count))
+        keys = ', '.join(f'k{i}' for i in range(len(names)))
+        
+        trim, whitespace = TRIM_FUNCTION[vendor], WHITESPACE_SQL[vendor]
+        
+        def normalized(positions):
+            return ', '.join(
+                f"LOWER({trim}(COALESCE(CAST(c{positions[name]} AS TEXT), 'none'), {whitespace})) AS k{i}"
+                for i, name in enumerate(names)
+            )
+        
+        return (
+            f"WITH user_result({user_columns}) AS (\n{user_query}\n), "
+            f"expected_result({expected_columns}) AS (\n{expected_query}\n), "
+            f"difference AS ("
+            f"SELECT {keys}, SUM(side) AS balance FROM ("
+            f"SELECT {normalized(user_positions)}, 1 AS side FROM user_result "
+            f"UNION ALL "
+            f"SELECT {normalized(expected_positions)}, -1 AS side FROM expected_result"
+            f") AS sides GROUP BY {keys} HAVING SUM(side) <> 0) "
+            f"SELECT * FROM ("
+            f"SELECT {keys}, balance, "
+            f"ROW_NUMBER() OVER (PARTITION BY balance > 0) AS sample, "
+            f"SUM(CASE WHEN balance > 0 THEN balance ELSE 0 END) OVER () AS extra_total, "
+            f"SUM(CASE WHEN balance < 0 THEN -balance ELSE 0 END) OVER () AS missing_total "
+            f"FROM difference) AS ranked WHERE sample <= {max(int(example_rows), 1)}"
+        )
+    
+    @staticmethod
+    def compare(user_query, expected_query, rename_fields=None, using=None, time_limit_ms=None,
+                exercise=None, example_rows=None, tables=None):
+        """
+        Compare two queries' results as multisets of normalized rows.
+        
+        Args:
+            user_query (str): Student query, with table names already rewritten
+            expected_query (str): Query producing the expected result
+            rename_fields (dict): Optional field name mapping, applied to both
+            using (str): Database alias, defaults to QueryExecutor.default_alias()
+            time_limit_ms (int): Optional limit after which the queries are interrupted
+            exercise (str): Exercise key the query runs for, for the query log
+            example_rows (int): Sample rows per side, defaults to RESULT_DIFF_EXAMPLES
+            tables (iterable): Tables the queries may read, see QueryExecutor.get_cursor()
+        
+        Returns:
+            tuple: (success, comparison/error_message)
+                  comparison (dict): 'matches' (bool) and 'diff' in the form of
+                                     ResultMatcher.diff
+        """
+        if example_rows is None:
+            example_rows = settings.RESULT_DIFF_EXAMPLES
+        alias = using or QueryExecutor.default_alias()
+        vendor = 'sqlite' if alias.startswith(MEMORY_ALIAS) else connections[alias].vendor
+        
+        started = time.perf_counter()
+        try:
+            user_query = DatabaseComparator.strip_query(user_query)
+            expected_query = DatabaseComparator.strip_query(expected_query)
+            with QueryExecutor.get_cursor(alias, time_limit_ms, tables=tables) as cursor:
+                user_columns = DatabaseComparator.describe(cursor, user_query)
+                expected_columns = DatabaseComparator.describe(cursor, expected_query)
+                user_positions = DatabaseComparator.column_positions(user_columns, rename_fields)
+                expected_positions = DatabaseComparator.column_positions(expected_columns, rename_fields)
+                
+                if set(user_positions) != set(expected_positions):
+                    comparison = DatabaseComparator._column_mismatch(user_positions, expected_positions)
+                else:
+                    cursor.execute(
+                        DatabaseComparator.build_query(
+                            user_query, len(user_columns), expected_query, len(expected_columns),
+                            user_positions, expected_positions, example_rows, vendor
+                        )
+                    )
+                    comparison = DatabaseComparator._summarize(list(user_positions), cursor.fetchall())
+            
+            query_log.record(user_query, exercise, (time.perf_counter() - started) * 1000)
+            return True, comparison
+        
+        except Exception as e:
+            message = QueryExecutor.error_message(e)
+            query_log.record(user_query, exercise, (time.perf_counter() - started) * 1000, error=message)
+            return False, message
+    
+    @staticmethod
+    def _column_mismatch(user_positions, expected_positions):
+        return {
+            'matches': False,
+            'diff': {
+                'missing_columns': sorted(set(expected_positions) - set(user_positions)),
+                'extra_columns': sorted(set(user_positions) - set(expected_positions)),
+                'missing_count': None,
+                'extra_count': None,
+                'missing_rows': [],
+                'extra_rows': [],
+            },
+        }
+    
+    @staticmethod
+    def _summarize(names, rows):
+        diff = {
+            'missing_columns': [],
+            'extra_columns': [],
+            'missing_count': 0,
+            'extra_count': 0,
+            'missing_rows': [],
+            'extra_rows': [],
+        }
+        for row in rows:
+            values = dict(zip(names, row[:len(names)]))
+            balance, _, extra_total, missing_total = row[len(names):]
+            diff['extra_count'], diff['missing_count'] = int(extra_total), int(missing_total)
+            side = diff['extra_rows'] if balance > 0 else diff['missing_rows']
+            side.append(values)
+        return {'matches': not rows, 'diff': diff}
@@ -0,0 +1,175 @@
+"""
+Cross-Check Grading
+Re-grades answers that are correct on the real data against perturbed copies
+of the dataset, so hard-coded results (SELECT 'John', 'Smith' UNION ...) fail.
+
+The student query and the expected query run on every variant in a shared
+thread pool while the main result is still being graded. A verdict is correct
+only if every variant finished and agreed. The extra wait is capped by the
+exercise's cross_check_budget_ms; a variant that does not finish in time (or
+fails to run) leaves the answer unverified, which is reported as "try again"
+rather than as correct. Variants stop being started once the answer is known
+to be wrong on the real data.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .comparison import DatabaseComparator
+from .executor import MEMORY_ALIAS, QueryExecutor, variant_alias
+from .exercises import GRADING_ROWS, GRADING_SCALAR
+from .validators import QueryComparator
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide cross-check thread pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=settings.CROSS_CHECK_WORKERS,
+                    thread_name_prefix='cross-check'
+                )
+    return _pool
+
+
+class CrossCheck:
+    """Runs one submission on the perturbed dataset variants."""
+    
+    HINT = ("Your query returns the right answer for this data but not for other "
+            "data in the same tables. Avoid hard-coding values from the result.")
+    RETRY_HINT = ("Your answer could not be checked against other data in time because "
+                  "the server is busy. Please submit it again.")
+    
+    def __init__(self, exercise, query):
+        self.exercise = exercise
+        self.query = query
+        self.deadline = time.monotonic() + exercise.cross_check_budget_ms / 1000
+        self.failed = False
+        self.unverified = False
+        self.cancelled = False
+        self.futures = [
+            get_pool().submit(self._check_variant, variant)
+            for variant in range(exercise.cross_check_copies)
+        ]
+    
+    @staticmethod
+    def start(exercise, query):
+        """
+        Start cross-checking a submission, if the exercise uses it.
+        
+        Args:
+            exercise (Exercise): Compiled exercise
+            query (str): Student query, with table names already rewritten
+        
+        Returns:
+            CrossCheck: Running check, or None if not applicable
+        """
+        if (exercise.cross_check_copies <= 0
+                or exercise.expected_sql is None
+                or exercise.grading not in (GRADING_ROWS, GRADING_SCALAR)
+                or QueryExecutor.default_alias() != MEMORY_ALIAS):
+            return None
+        return CrossCheck(exercise, query)
+    
+    @staticmethod
+    def confirm(cross_check, is_correct):
+        """
+        Combine the verdict on the real data with the cross-check.
+        
+        Args:
+            cross_check (CrossCheck): Running check, or None
+            is_correct (bool): Verdict on the real data
+        
+        Returns:
+            bool: True if correct on the real data and on every variant
+        """
+        if cross_check is None:
+            return is_correct
+        if not is_correct:
+            cross_check.cancel()
+            return False
+        return cross_check.passed()
+    
+    def _remaining_ms(self):
+        return (self.deadline - time.monotonic()) * 1000
+    
+    def _check_variant(self, variant):
+        """Return True/False if the variant agrees/disagrees, None if it could not run."""
+        # Pool threads outlive requests, so nothing closes their connections to
+        # 'default' (dataset.current_version) unless the task does
+        close_old_connections()
+        try:
+            return self._compare_variant(variant)
+        finally:
+            close_old_connections()
+    
+    def _compare_variant(self, variant):
+        remaining = self._remaining_ms()
+        if remaining <= 0 or self.cancelled:
+            return None
+        
+        label = f"{self.exercise.key} (cross-check)"
+        alias = variant_alias(variant)
+        if self.exercise.compares_in_database:
+            success, comparison = DatabaseComparator.compare(
+                self.query, self.exercise.expected_sql, self.exercise.rename_fields,
+                alias, remaining, exercise=label, tables=self.exercise.tables
+            )
+            return comparison['matches'] if success else None
+        
+        success, expected = self.exercise.expected_variant(variant, remaining)
+        if not success:
+            return None
+        
+        remaining = self._remaining_ms()
+        if remaining <= 0 or self.cancelled:
+            return None
+        
+        if self.exercise.grading == GRADING_SCALAR:
+            success, result = QueryExecutor.execute_query_single_value(
+                self.query, alias, remaining, exercise=label, tables=self.exercise.tables
+            )
+            return result == expected if success else None
+        
+        success, result = QueryExecutor.execute_query(
+            self.query, alias, remaining, exercise=label, tables=self.exercise.tables
+        )
+        if not success:
+            return None
+        return QueryComparator.fingerprint_result(result, self.exercise.rename_fields) == expected
+    
+    def passed(self):
+        """
+        Wait (at most until the budget runs out) for the variants.
+        
+        Sets failed if a variant disagreed, else unverified if one did not
+        finish in time or could not run.
+        
+        Returns:
+            bool: True only if every variant finished and agreed
+        """
+        done, not_done = wait(self.futures, timeout=max(self._remaining_ms(), 0) / 1000)
+        self.cancel()
+        
+        outcomes = [future.result() for future in done if future.exception() is None]
+        self.failed = False in outcomes
+        self.unverified = not self.failed and (
+            bool(not_done) or len(outcomes) < len(done) or None in outcomes
+        )
+        return not self.failed and not self.unverified
+    
+    def cancel(self):
+        """Drop variants that have not started yet; running ones stop before their next query."""
+        self.cancelled = True
+        for future in self.futures:
+            future.cancel()
@@ -0,0 +1,56 @@
+"""
+Dataset Version
+Tracks changes to the exercise dataset (employees, projects) so cached
+expected results and other derived data can tell when they are stale.
+
+Saving or deleting an Employee or Project bumps a counter stored in the
+database; each process re-reads it at most every DATASET_VERSION_TTL seconds.
+Changes made with raw SQL or bulk queryset methods should call bump_version().
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import DatasetVersion, Employee, Project
+
+
+_cache = {'version': None, 'checked_at': 0.0}
+_lock = threading.Lock()
+
+
+def current_version():
+    """
+    Return the current dataset version.
+    
+    Returns:
+        int: Version number, increasing with every change to the dataset
+    """
+    now = time.monotonic()
+    if _cache['version'] is not None and now - _cache['checked_at'] < settings.DATASET_VERSION_TTL:
+        return _cache['version']
+    
+    with _lock:
+        version = DatasetVersion.objects.filter(pk=1).values_list('version', flat=True).first()
+        _cache['version'] = version or 1
+        _cache['checked_at'] = now
+    return _cache['version']
+
+
+def bump_version():
+    """Mark the dataset as changed for every process."""
+    if not DatasetVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        DatasetVersion.objects.get_or_create(pk=1, defaults={'version': 2})
+    _cache['version'] = None
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def _dataset_changed(sender, **kwargs):
+    bump_version()
@@ -1,37 +1,387 @@
 """
 SQL Query Executor
 Safely executes SQL queries against the database with proper error handling.
+
+All queries run on the read-only exercise connection (settings.EXERCISE_DB_ALIAS)
+so student reads never contend with writes made through the default connection.
+On PostgreSQL each query runs in a READ ONLY transaction with a statement_timeout
+and reads its rows through a named server-side cursor.
+
+Every execution is timed and recorded in the query log (query_log.py) under
+its fingerprint, together with the exercise it ran for.
+
+An optional time limit stops a query that runs too long: SQLite checks it from
+a progress handler, PostgreSQL lowers the statement_timeout.
+
+execute_batch runs several queries in one read transaction (REPEATABLE READ on
+PostgreSQL), so e.g. a student query and the expected query see the same data.
+
+Cursors opened while a submission ticket is active (inflight.py) are
+interrupted when a newer submission for the same exercise supersedes it.
+
+What a query may do is enforced by the database engine: on SQLite every cursor
+gets an authorizer that only lets statements read the exercise's tables
+(settings.EXERCISE_TABLES unless the caller narrows them), so writes, PRAGMAs,
+ATTACH and reads of other tables fail when the statement is prepared. On
+PostgreSQL the READ ONLY transaction rules out writes. Query text holding more
+than one statement is refused before it reaches the driver: psycopg runs every
+statement of a query without parameters, and a COMMIT among them would end
+the READ ONLY transaction.
+
+With settings.EXERCISE_EXECUTION_MODE = 'memory' (SQLite only), queries that do
+not name a database run against the worker's in-memory copy of the dataset
+(memory_dataset.py) instead of the database file.
 """
 
-from django.db import connection
-from contextlib import contextmanager
+import sqlite3
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+from contextlib import ExitStack, contextmanager
+
+from .inflight import SUPERSEDED_MESSAGE, Superseded, current_ticket
+from .memory_dataset import memory_dataset
+from .memory_profiler import memory_phase
+from .query_log import query_log
+from .validators import SQLValidator
+
+
+# Alias that selects the in-memory copy of the dataset; 'memory:<n>' selects
+# perturbed variant n and 'memory:x<rows>' a copy scaled to that many employees
+MEMORY_ALIAS = 'memory'
+
+
+def variant_alias(variant):
+    """Return the alias of a perturbed in-memory dataset variant."""
+    return f"{MEMORY_ALIAS}:{variant}"
+
+
+def scale_alias(rows):
+    """Return the alias of an in-memory dataset copy scaled to a number of employees."""
+    return f"{MEMORY_ALIAS}:x{rows}"
+
+
+class MultipleStatements(ValueError):
+    """Raised for query text that holds more than one SQL statement."""
+
+
+class RowStream:
+    """
+    Lazily fetched result rows.
+    
+    Iterating pulls rows in EXERCISE_FETCH_SIZE batches; the cursor (and on
+    PostgreSQL the read-only transaction) is released once the rows are
+    exhausted or close() is called. The execution is then recorded in the
+    query log, timed over execute and fetch calls only.
+    """
+    
+    def __init__(self, cursor, stack, query=None, exercise=None, elapsed=0.0):
+        self._rows = QueryExecutor.iter_rows(cursor)
+        # Rows are fetched later, outside the ticket's active() block
+        self._ticket = current_ticket()
+        self._stack = stack
+        self._query = query
+        self._exercise = exercise
+        self._elapsed = elapsed
+        self._count = 0
+        self._error = None
+        self._closed = False
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = next(self._rows)
+        except StopIteration:
+            self._elapsed += time.perf_counter() - start
+            self.close()
+            raise
+        except BaseException as e:
+            self._elapsed += time.perf_counter() - start
+            self._error = QueryExecutor.error_message(e, self._ticket)
+            self.close()
+            raise
+        self._elapsed += time.perf_counter() - start
+        self._count += 1
+        return row
+    
+    @property
+    def elapsed_ms(self):
+        """Time spent executing the query and fetching the rows so far."""
+        return self._elapsed * 1000
+    
+    @property
+    def rows_fetched(self):
+        return self._count
+    
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._stack.close()
+        if self._query is not None:
+            query_log.record(self._query, self._exercise, self._elapsed * 1000, self._count, self._error)
 
 
 class QueryExecutor:
     """Executes SQL queries safely with proper error handling."""
     
+    # SQLite virtual machine steps between time limit checks
+    PROGRESS_HANDLER_STEPS = 1000
+    
+    # Authorizer actions allowed besides reading permitted tables: SELECT
+    # itself, SQL functions, recursive CTEs and the BEGIN/ROLLBACK of snapshots
+    ALLOWED_ACTIONS = frozenset({
+        sqlite3.SQLITE_SELECT, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE, sqlite3.SQLITE_TRANSACTION,
+    })
+    
+    @staticmethod
+    def default_alias():
+        """
+        Return the alias student queries run on when none is given.
+        
+        Returns:
+            str: MEMORY_ALIAS in memory mode on SQLite, else settings.EXERCISE_DB_ALIAS
+        """
+        if (settings.EXERCISE_EXECUTION_MODE == 'memory'
+                and connections[settings.EXERCISE_DB_ALIAS].vendor == 'sqlite'):
+            return MEMORY_ALIAS
+        return settings.EXERCISE_DB_ALIAS
+    
     @staticmethod
     @contextmanager
-    def get_cursor():
+    def get_cursor(using=None, time_limit_ms=None, snapshot=False, tables=None):
         """
         Context manager for database cursor with automatic cleanup.
         
+        Args:
+            using (str): Database alias, MEMORY_ALIAS, a variant_alias() or a
+                         scale_alias(), defaults to default_alias()
+            time_limit_ms (int): Optional limit after which queries are interrupted
+            snapshot (bool): Run everything executed on the cursor in one read
+                             transaction, so all queries see the same data
+            tables (iterable): Tables queries may read (SQLite), defaults to
+                               settings.EXERCISE_TABLES
+        
         Yields:
-            cursor: Database cursor object
+            cursor: Cursor on the read-only exercise connection
         """
-        cursor = connection.cursor()
+        alias = using or QueryExecutor.default_alias()
+        
+        if alias == MEMORY_ALIAS or alias.startswith(MEMORY_ALIAS + ':'):
+            variant = alias.partition(':')[2]
+            if variant.startswith('x'):
+                raw_connection = memory_dataset.connection(scale=int(variant[1:]))
+            else:
+                raw_connection = memory_dataset.connection(int(variant) if variant else None)
+            cursor = raw_connection.cursor()
+        else:
+            connection = connections[alias]
+            if connection.vendor == 'postgresql':
+                with QueryExecutor._postgresql_cursor(connection, time_limit_ms, snapshot) as cursor:
+                    with QueryExecutor._interruptible(cursor):
+                        yield cursor
+                return
+            cursor = connection.cursor()
+            raw_connection = connection.connection
+        
+        raw_connection.set_authorizer(QueryExecutor.authorizer(tables))
+        if time_limit_ms:
+            deadline = time.monotonic() + time_limit_ms / 1000
+            raw_connection.set_progress_handler(
+                lambda: time.monotonic() > deadline,
+                QueryExecutor.PROGRESS_HANDLER_STEPS
+            )
+        # SQLite reads inside one transaction share a snapshot (WAL) or hold
+        # off writers until it ends (rollback journal)
+        began = snapshot and not raw_connection.in_transaction
         try:
-            yield cursor
+            if began:
+                cursor.execute('BEGIN')
+            with QueryExecutor._interruptible(cursor):
+                yield cursor
         finally:
             cursor.close()
+            if began:
+                try:
+                    raw_connection.rollback()
+                except sqlite3.ProgrammingError:
+                    pass
+            try:
+                raw_connection.set_authorizer(None)
+                if time_limit_ms:
+                    raw_connection.set_progress_handler(None, 0)
+            except sqlite3.ProgrammingError:
+                # Connection already closed
+                pass
+    
+    @staticmethod
+    @contextmanager
+    def _postgresql_cursor(connection, time_limit_ms, snapshot=False):
+        statement_timeout = settings.EXERCISE_STATEMENT_TIMEOUT_MS
+        if time_limit_ms:
+            statement_timeout = min(statement_timeout, time_limit_ms)
+        
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as setup_cursor:
+                if snapshot:
+                    setup_cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+                else:
+                    setup_cursor.execute('SET TRANSACTION READ ONLY')
+                setup_cursor.execute(
+                    'SET LOCAL statement_timeout = %d' % int(statement_timeout)
+                )
+            # Named server-side cursor, rows are pulled in EXERCISE_FETCH_SIZE batches;
+            # a snapshot runs several queries, which a named cursor cannot
+            cursor = connection.cursor() if snapshot else connection.chunked_cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+    
+    @staticmethod
+    def single_statement(query):
+        """
+        Return the statement to execute for a query, refusing several statements.
+        
+        Called before a student query (or one built around it) is executed.
+        Trailing semicolons and comments are dropped, so every driver accepts
+        what the validator accepts.
+        
+        Args:
+            query (str): SQL text about to be executed
+        
+        Returns:
+            str: The statement, as SQLValidator.single_statement returns it
+        
+        Raises:
+            MultipleStatements: If SQLValidator.single_statement rejects the text
+        """
+        statement = SQLValidator.single_statement(query)
+        if statement is None:
+            raise MultipleStatements(SQLValidator.MULTIPLE_STATEMENTS_MESSAGE)
+        return statement
+    
+    @staticmethod
+    def authorizer(tables=None):
+        """
+        Build a sqlite3 authorizer that only lets statements read some tables.
+        
+        Reads of other tables (sqlite_master included) and every statement
+        other than SELECT are denied when the statement is prepared, which
+        raises sqlite3.DatabaseError('not authorized').
+        
+        Args:
+            tables (iterable): Readable table names, defaults to settings.EXERCISE_TABLES
+        
+        Returns:
+            callable: For sqlite3.Connection.set_authorizer
+        """
+        readable = frozenset(table.lower() for table in (settings.EXERCISE_TABLES if tables is None else tables))
+        
+        def authorize(action, arg1, arg2, database, trigger):
+            if action == sqlite3.SQLITE_READ:
+                # CTEs are read without a database name
+                if database is None or (arg1 and arg1.lower() in readable):
+                    return sqlite3.SQLITE_OK
+                return sqlite3.SQLITE_DENY
+            if action in QueryExecutor.ALLOWED_ACTIONS:
+                return sqlite3.SQLITE_OK
+            return sqlite3.SQLITE_DENY
+        
+        return authorize
+    
+    @staticmethod
+    @contextmanager
+    def _interruptible(cursor):
+        # A newer submission for the same exercise stops this one (inflight.py)
+        ticket = current_ticket()
+        if ticket is None:
+            yield
+            return
+        handle = ticket.attach(lambda: QueryExecutor.interrupt(cursor))
+        try:
+            yield
+        finally:
+            ticket.detach(handle)
+    
+    @staticmethod
+    def error_message(error, ticket=None):
+        """
+        Build the message shown to the student for a failed query.
+        
+        Args:
+            error (Exception): Exception raised while executing the query
+            ticket (SubmissionTicket): Submission the query ran for, defaults
+                                       to the current thread's ticket
+        
+        Returns:
+            str: User-facing error message
+        """
+        ticket = ticket or current_ticket()
+        if isinstance(error, Superseded) or (ticket is not None and ticket.superseded):
+            return SUPERSEDED_MESSAGE
+        if isinstance(error, MultipleStatements):
+            return str(error)
+        if str(error) == 'not authorized':
+            return "❌ Unsafe query detected. Queries may only read the tables of this exercise."
+        if str(error).endswith('is prohibited'):
+            # Authorizer denied a read: 'access to projects.id is prohibited'
+            return f"❌ Queries may only read the tables of this exercise ({error})."
+        if str(error) == 'interrupted' or 'statement timeout' in str(error):
+            return "❌ Query took too long and was stopped. Try a more selective query."
+        return f"❌ SQL Execution Error: {str(error)}"
+    
+    @staticmethod
+    def interrupt(cursor):
+        """
+        Stop the statement executing on a cursor; safe to call from another thread.
+        
+        The interrupted execute() or fetch raises as if the time limit ran out.
+        
+        Args:
+            cursor: Cursor yielded by get_cursor()
+        """
+        # Django wraps the driver's cursor, memory connections hand it out directly
+        raw_connection = getattr(cursor, 'cursor', cursor).connection
+        if isinstance(raw_connection, sqlite3.Connection):
+            raw_connection.interrupt()
+        else:
+            # psycopg sends a cancel request on a separate connection
+            raw_connection.cancel()
+    
+    @staticmethod
+    def iter_rows(cursor):
+        """
+        Yield rows from an executed cursor in EXERCISE_FETCH_SIZE batches.
+        
+        Args:
+            cursor: Cursor that has already executed a query
+        
+        Yields:
+            tuple: One result row
+        """
+        while True:
+            with memory_phase('fetch'):
+                rows = cursor.fetchmany(settings.EXERCISE_FETCH_SIZE)
+            if not rows:
+                return
+            yield from rows
     
     @staticmethod
-    def execute_query(query):
+    def execute_query(query, using=None, time_limit_ms=None, exercise=None, tables=None):
         """
         Execute a SELECT query and return results.
         
         Args:
             query (str): SQL SELECT query to execute
+            using (str): Database alias, defaults to settings.EXERCISE_DB_ALIAS
+            time_limit_ms (int): Optional limit after which the query is interrupted
+            exercise (str): Exercise key the query runs for, for the query log
+            tables (iterable): Tables the query may read, see get_cursor()
         
         Returns:
             tuple: (success, data/error_message)
@@ -39,60 +389,173 @@ class QueryExecutor:
                   data (list): List of dictionaries with results if success
                   error_message (str): Error message if failure
         """
+        started = time.perf_counter()
         try:
-            with QueryExecutor.get_cursor() as cursor:
-                cursor.execute(query)
+            statement = QueryExecutor.single_statement(query)
+            with QueryExecutor.get_cursor(using, time_limit_ms, tables=tables) as cursor:
+                cursor.execute(statement)
                 
                 # Get column names from cursor description
                 columns = [col[0] for col in cursor.description]
                 
-                # Fetch all rows and convert to list of dictionaries
-                rows = cursor.fetchall()
-                results = [dict(zip(columns, row)) for row in rows]
-                
-                return True, results
+                # Fetch rows in batches and convert to list of dictionaries
+                results = []
+                while True:
+                    with memory_phase('fetch'):
+                        rows = cursor.fetchmany(settings.EXERCISE_FETCH_SIZE)
+                    if not rows:
+                        break
+                    with memory_phase('convert'):
+                        results.extend(dict(zip(columns, row)) for row in rows)
+            
+            QueryExecutor._log(query, exercise, started, rows=len(results))
+            return True, results
+        
+        except Exception as e:
+            message = QueryExecutor.error_message(e)
+            QueryExecutor._log(query, exercise, started, error=message)
+            return False, message
+    
+    @staticmethod
+    def execute_batch(queries, using=None, time_limit_ms=None, exercise=None, tables=None):
+        """
+        Execute several SELECT queries on one cursor in a single read transaction.
+        
+        All queries see the same data, even if the dataset changes meanwhile,
+        and share one time limit. A failing query does not stop the others
+        (on PostgreSQL it aborts the transaction, so put the queries that are
+        expected to succeed first).
+        
+        Args:
+            queries (list): SQL SELECT queries to execute, in order
+            using (str): Database alias, defaults to default_alias()
+            time_limit_ms (int): Optional limit for the whole batch
+            exercise (str): Exercise key the queries run for, for the query log
+            tables (iterable): Tables the queries may read, see get_cursor()
+        
+        Returns:
+            tuple: (success, results/error_message)
+                  results (list): (success, (columns, rows)/error_message) per
+                                  query, rows as tuples
+                  error_message (str): If the transaction could not be started
+        """
+        try:
+            with QueryExecutor.get_cursor(using, time_limit_ms, snapshot=True, tables=tables) as cursor:
+                results = []
+                for query in queries:
+                    started = time.perf_counter()
+                    try:
+                        cursor.execute(QueryExecutor.single_statement(query))
+                        columns = [col[0] for col in cursor.description]
+                        rows = list(QueryExecutor.iter_rows(cursor))
+                    except Exception as e:
+                        message = QueryExecutor.error_message(e)
+                        QueryExecutor._log(query, exercise, started, error=message)
+                        results.append((False, message))
+                        continue
+                    QueryExecutor._log(query, exercise, started, rows=len(rows))
+                    results.append((True, (columns, rows)))
+            return True, results
         
         except Exception as e:
-            error_message = f"❌ SQL Execution Error: {str(e)}"
-            return False, error_message
+            return False, QueryExecutor.error_message(e)
     
     @staticmethod
-    def execute_query_single_value(query):
+    def stream_query(query, using=None, time_limit_ms=None, exercise=None, tables=None):
+        """
+        Execute a SELECT query and return its rows lazily.
+        
+        The cursor stays open until the returned row iterator is exhausted
+        or closed, so callers can encode rows as they are fetched.
+        
+        Args:
+            query (str): SQL SELECT query to execute
+            using (str): Database alias, defaults to settings.EXERCISE_DB_ALIAS
+            time_limit_ms (int): Optional limit after which the query is interrupted
+            exercise (str): Exercise key the query runs for, for the query log
+            tables (iterable): Tables the query may read, see get_cursor()
+        
+        Returns:
+            tuple: (success, (columns, rows)/error_message)
+                  columns (list): Column names from the cursor description
+                  rows (RowStream): Result rows as tuples
+        """
+        started = time.perf_counter()
+        stack = ExitStack()
+        try:
+            statement = QueryExecutor.single_statement(query)
+            cursor = stack.enter_context(QueryExecutor.get_cursor(using, time_limit_ms, tables=tables))
+            cursor.execute(statement)
+            columns = [col[0] for col in cursor.description]
+            rows = RowStream(cursor, stack, query, exercise, time.perf_counter() - started)
+            return True, (columns, rows)
+        
+        except Exception as e:
+            stack.close()
+            message = QueryExecutor.error_message(e)
+            QueryExecutor._log(query, exercise, started, error=message)
+            return False, message
+    
+    @staticmethod
+    def execute_query_single_value(query, using=None, time_limit_ms=None, exercise=None, tables=None):
         """
         Execute a query that returns a single value (e.g., COUNT, SUM).
         
         Args:
             query (str): SQL query to execute
+            using (str): Database alias, defaults to settings.EXERCISE_DB_ALIAS
+            time_limit_ms (int): Optional limit after which the query is interrupted
+            exercise (str): Exercise key the query runs for, for the query log
+            tables (iterable): Tables the query may read, see get_cursor()
         
         Returns:
             tuple: (success, value/error_message)
         """
+        started = time.perf_counter()
         try:
-            with QueryExecutor.get_cursor() as cursor:
-                cursor.execute(query)
+            statement = QueryExecutor.single_statement(query)
+            with QueryExecutor.get_cursor(using, time_limit_ms, tables=tables) as cursor:
+                cursor.execute(statement)
                 result = cursor.fetchone()[0]
-                return True, result
+            
+            QueryExecutor._log(query, exercise, started, rows=1)
+            return True, result
         
         except Exception as e:
-            error_message = f"❌ SQL Execution Error: {str(e)}"
-            return False, error_message
+            message = QueryExecutor.error_message(e)
+            QueryExecutor._log(query, exercise, started, error=message)
+            return False, message
     
     @staticmethod
-    def test_query_syntax(query):
+    def test_query_syntax(query, using=None, time_limit_ms=None, exercise=None, tables=None):
         """
         Test if a query has valid syntax without committing results.
         
         Args:
             query (str): SQL query to test
+            using (str): Database alias, defaults to settings.EXERCISE_DB_ALIAS
+            time_limit_ms (int): Optional limit after which the query is interrupted
+            exercise (str): Exercise key the query runs for, for the query log
+            tables (iterable): Tables the query may read, see get_cursor()
         
         Returns:
             tuple: (is_valid, error_message)
         """
+        started = time.perf_counter()
         try:
-            with QueryExecutor.get_cursor() as cursor:
-                cursor.execute(query)
+            statement = QueryExecutor.single_statement(query)
+            with QueryExecutor.get_cursor(using, time_limit_ms, tables=tables) as cursor:
+                cursor.execute(statement)
                 # Don't fetch results, just check if it executes
+            
+            QueryExecutor._log(query, exercise, started)
             return True, None
         
         except Exception as e:
+            QueryExecutor._log(query, exercise, started, error=str(e))
             return False, str(e)
+    
+    @staticmethod
+    def _log(query, exercise, started, rows=None, error=None):
+        """Record an execution that began at time.perf_counter() value started."""
+        query_log.record(query, exercise, (time.perf_counter() - started) * 1000, rows, error)
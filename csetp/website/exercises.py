@@ -0,0 +1,381 @@
+"""
+Exercise Engine
+Compiles every gradable exercise into an immutable Exercise object on first use.
+
+Built-in exercises come from QUERY_CONFIGS; custom question sets contribute a
+'custom:<pk>:modify' and a 'custom:<pk>:make' exercise. Compiling precomputes
+everything that does not depend on the submission (table rewriter, hint matcher,
+expected query text, budgets), and the expected result is fingerprinted once
+per dataset version, so grading a submission only executes and compares.
+The same holds for the expected results on the perturbed dataset variants
+used by the cross-check (cross_check.py).
+"""
+
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import dataset
+from .comparison import COMPARE_DATABASE, COMPARE_PYTHON
+from .executor import MEMORY_ALIAS, QueryExecutor, variant_alias
+from .models import CustomQuestionSet
+from .query_configs import QUERY_CONFIGS
+from .single_flight import FINGERPRINT, PLAIN, query_key, single_flight
+from .validators import QueryComparator
+
+
+# How a submission is graded
+GRADING_ROWS = 'rows'      # result rows compared with the expected rows
+GRADING_SCALAR = 'scalar'  # single value compared with the expected value
+GRADING_QUERY = 'query'    # query text compared with the expected query
+
+
+class TableRewriter:
+    """Replaces user-facing table names with real ones using one precompiled pattern."""
+    
+    def __init__(self, table_mapping):
+        # Identity entries need no rewriting
+        self.mapping = {
+            user_table.lower(): table
+            for user_table, table in (table_mapping or {}).items()
+            if user_table.lower() != table.lower()
+        }
+        self.pattern = None
+        if self.mapping:
+            alternatives = '|'.join(re.escape(name) for name in sorted(self.mapping, key=len, reverse=True))
+            self.pattern = re.compile(r'\b(' + alternatives + r')\b', re.IGNORECASE)
+    
+    def __call__(self, query):
+        if self.pattern is None:
+            return query
+        return self.pattern.sub(lambda match: self.mapping[match.group(1).lower()], query)
+
+
+class HintMatcher:
+    """Returns the hint for the first expected keyword missing from a query."""
+    
+    DEFAULT_HINT = "Check your query syntax and conditions."
+    
+    def __init__(self, hint_keywords):
+        self.keywords = tuple((keyword.lower(), hint) for keyword, hint in hint_keywords.items())
+    
+    def __call__(self, query):
+        query_lower = query.lower()
+        for keyword, hint in self.keywords:
+            if keyword not in query_lower:
+                return hint
+        return self.DEFAULT_HINT
+
+
+class ExpectedCache:
+    """Holds an exercise's expected result for the dataset version it was computed on."""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.value = None
+        self.variants_version = None
+        self.variants = {}
+
+
+@dataclass(frozen=True)
+class Exercise:
+    """Everything needed to grade submissions for one exercise."""
+    
+    key: str
+    grading: str
+    show_result: bool
+    rewrite_tables: TableRewriter
+    hint_for: HintMatcher = None
+    rename_fields: dict = None
+    expected_query: str = None  # normalized text, GRADING_QUERY only
+    expected_sql: str = None    # SQL producing the expected result
+    load_expected: callable = None  # ORM callable producing the expected result (built-ins)
+    time_budget_ms: int = None
+    cross_check_copies: int = 0  # perturbed dataset variants a correct answer must also match
+    cross_check_budget_ms: int = None
+    comparison: str = COMPARE_PYTHON  # how row results are compared (comparison.py)
+    tables: frozenset = None  # tables queries may read, None for settings.EXERCISE_TABLES
+    performance_feedback: bool = False  # submissions may ask for timing and the query plan (performance.py)
+    expected_cache: ExpectedCache = field(default_factory=ExpectedCache, compare=False, repr=False)
+    
+    @property
+    def grades_in_snapshot(self):
+        """
+        Whether the expected result is recomputed with every submission, in the
+        same read transaction (QueryExecutor.execute_batch).
+        
+        Only needed when queries run on the live database, which can change
+        between computing the expected result and running the submission; an
+        in-memory copy never changes under a query, so there the cached
+        expected result is used.
+        """
+        return (settings.SNAPSHOT_GRADING and self.expected_sql is not None
+                and self.grading in (GRADING_ROWS, GRADING_SCALAR)
+                and QueryExecutor.default_alias() != MEMORY_ALIAS)
+    
+    def expected_from_rows(self, columns, rows):
+        """
+        Turn rows of the expected query into the form expected() returns.
+        
+        Args:
+            columns (list): Column names
+            rows (list): Row tuples
+        
+        Returns:
+            Counter or value: Fingerprint for GRADING_ROWS, first value for GRADING_SCALAR
+        """
+        if self.grading == GRADING_SCALAR:
+            return rows[0][0] if rows else None
+        return QueryComparator.fingerprint_result(
+            [dict(zip(columns, row)) for row in rows], self.rename_fields
+        )
+    
+    @property
+    def compares_in_database(self):
+        """Whether row results are compared by the database rather than fetched."""
+        return (self.grading == GRADING_ROWS and self.comparison == COMPARE_DATABASE
+                and not self.show_result and self.expected_sql is not None)
+    
+    def expected(self):
+        """
+        Return the expected result for the current dataset version.
+        
+        Rows are returned as a fingerprint (QueryComparator.fingerprint_result),
+        scalars as the value itself. Computed once per dataset version, and
+        once for all worker processes that need it at the same time.
+        
+        Returns:
+            tuple: (success, expected/error_message)
+        """
+        version = dataset.current_version()
+        cache = self.expected_cache
+        if cache.version == version:
+            return True, cache.value
+        
+        with cache.lock:
+            if cache.version != version:
+                success, value = single_flight.do(
+                    query_key(self.key, self.expected_sql or '', version), self._compute_expected,
+                    shared=(FINGERPRINT if self.grading == GRADING_ROWS else PLAIN).result()
+                )
+                if not success:
+                    return False, value
+                cache.value, cache.version = value, version
+        return True, cache.value
+    
+    def expected_variant(self, variant, time_limit_ms=None):
+        """
+        Return the expected result on a perturbed dataset variant, in the same
+        form as expected(). Computed once per dataset version and variant.
+        
+        Args:
+            variant (int): Variant number (memory_dataset.perturb)
+            time_limit_ms (int): Optional limit for computing it
+        
+        Returns:
+            tuple: (success, expected/error_message)
+        """
+        version = dataset.current_version()
+        cache = self.expected_cache
+        if cache.variants_version == version and variant in cache.variants:
+            return True, cache.variants[variant]
+        
+        success, value = single_flight.do(
+            query_key(f"{self.key}:variant{variant}", self.expected_sql, version),
+            # Variants are in-memory copies private to each process, so not shared
+            lambda: self._run_expected_sql(variant_alias(variant), time_limit_ms),
+        )
+        if not success:
+            return False, value
+        with cache.lock:
+            if cache.variants_version != version:
+                cache.variants, cache.variants_version = {}, version
+            cache.variants[variant] = value
+        return True, value
+    
+    def _compute_expected(self):
+        if self.load_expected is not None:
+            value = self.load_expected()
+            if self.grading == GRADING_ROWS:
+                value = QueryComparator.fingerprint_result(value, self.rename_fields)
+            return True, value
+        return self._run_expected_sql()
+    
+    def _run_expected_sql(self, using=None, time_limit_ms=None):
+        if self.grading == GRADING_SCALAR:
+            success, value = QueryExecutor.execute_query_single_value(
+                self.expected_sql, using, time_limit_ms, exercise=self.key, tables=self.tables
+            )
+        else:
+            success, value = QueryExecutor.execute_query(
+                self.expected_sql, using, time_limit_ms, exercise=self.key, tables=self.tables
+            )
+        if not success:
+            return False, f"❌ Expected query failed: {value}"
+        
+        if self.grading == GRADING_ROWS:
+            value = QueryComparator.fingerprint_result(value, self.rename_fields)
+        return True, value
+
+
+def compile_config(key, config):
+    """
+    Compile a QUERY_CONFIGS entry.
+    
+    Args:
+        key (str): Key of the entry in QUERY_CONFIGS
+        config (dict): The entry itself
+    
+    Returns:
+        Exercise: Compiled exercise
+    """
+    grading = config['grading']
+    hint_keywords = config.get('hint_keywords')
+    expected_query = config.get('expected_query')
+    expected_sql = config.get('expected_sql')
+    
+    return Exercise(
+        key=key,
+        grading=grading,
+        show_result=config.get('show_result', True),
+        rewrite_tables=TableRewriter(config['table_mapping']),
+        hint_for=HintMatcher(hint_keywords) if hint_keywords else None,
+        rename_fields=config.get('rename_fields'),
+        expected_query=QueryComparator.normalize_query(expected_query) if expected_query else None,
+        expected_sql=expected_sql,
+        load_expected=config.get('get_expected_result'),
+        time_budget_ms=config.get('time_budget_ms', settings.EXERCISE_TIME_BUDGET_MS),
+        cross_check_copies=config.get('cross_check_copies', settings.CROSS_CHECK_COPIES) if expected_sql else 0,
+        cross_check_budget_ms=config.get('cross_check_budget_ms', settings.CROSS_CHECK_BUDGET_MS),
+        comparison=config.get('comparison', settings.RESULT_COMPARISON) if expected_sql else COMPARE_PYTHON,
+        tables=frozenset(config['table_mapping'].values()),
+        performance_feedback=config.get('performance_feedback', settings.PERFORMANCE_FEEDBACK),
+    )
+
+
+def compile_question_set(question_set, section):
+    """
+    Compile the modify or make section of a custom question set.
+    
+    Args:
+        question_set (CustomQuestionSet): The question set
+        section (str): 'modify' or 'make'
+    
+    Returns:
+        Exercise: Compiled exercise
+    """
+    if section == 'modify':
+        expected_sql = question_set.modify_correct_query
+    else:
+        expected_sql = question_set.make_correct_query
+    
+    return Exercise(
+        key=f"custom:{question_set.pk}:{section}",
+        grading=GRADING_ROWS,
+        show_result=(section == 'modify'),
+        rewrite_tables=TableRewriter(None),
+        expected_sql=expected_sql,
+        time_budget_ms=settings.EXERCISE_TIME_BUDGET_MS,
+        cross_check_copies=settings.CROSS_CHECK_COPIES,
+        cross_check_budget_ms=settings.CROSS_CHECK_BUDGET_MS,
+        comparison=settings.RESULT_COMPARISON,
+        tables=question_set.tables,
+        performance_feedback=question_set.performance_feedback,
+    )
+
+
+class ExerciseRegistry:
+    """Compiles exercises on first use and keeps them for reuse by later requests."""
+    
+    def __init__(self):
+        self._exercises = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """
+        Return the compiled exercise for a key.
+        
+        Args:
+            key (str): QUERY_CONFIGS key or 'custom:<pk>:<modify|make>'
+        
+        Returns:
+            Exercise: Compiled exercise
+        
+        Raises:
+            KeyError: If no such exercise exists
+        """
+        entry = self._exercises.get(key)
+        if entry is not None and (entry[1] is None or time.monotonic() < entry[1]):
+            return entry[0]
+        
+        with self._lock:
+            entry = self._exercises.get(key)
+            if entry is None or (entry[1] is not None and time.monotonic() >= entry[1]):
+                entry = self._exercises[key] = self._compile(key, entry)
+        return entry[0]
+    
+    def keys(self):
+        """
+        List the keys of every exercise that currently exists.
+        
+        Returns:
+            list: QUERY_CONFIGS keys followed by the custom question set keys
+        """
+        keys = list(QUERY_CONFIGS)
+        for pk in CustomQuestionSet.objects.order_by('pk').values_list('pk', flat=True):
+            keys.extend([f"custom:{pk}:modify", f"custom:{pk}:make"])
+        return keys
+    
+    def invalidate(self, prefix=''):
+        """Drop compiled exercises whose key starts with prefix (all by default)."""
+        with self._lock:
+            for key in [key for key in self._exercises if key.startswith(prefix)]:
+                del self._exercises[key]
+    
+    def _compile(self, key, previous=None):
+        """
+        Compile an exercise, or renew a custom one whose question set is unchanged.
+        
+        Args:
+            key (str): Exercise key
+            previous (tuple): Expired (exercise, expires, updated_at) entry for the key
+        
+        Returns:
+            tuple: (exercise, expires, updated_at); expires and updated_at are None
+                   for QUERY_CONFIGS exercises, which never change
+        
+        Raises:
+            KeyError: If no such exercise exists
+        """
+        if key in QUERY_CONFIGS:
+            return compile_config(key, QUERY_CONFIGS[key]), None, None
+        
+        parts = key.split(':')
+        if len(parts) != 3 or parts[0] != 'custom' or not parts[1].isdigit() or parts[2] not in ('modify', 'make'):
+            raise KeyError(key)
+        try:
+            question_set = CustomQuestionSet.objects.get(pk=int(parts[1]))
+        except CustomQuestionSet.DoesNotExist:
+            raise KeyError(key)
+        
+        # Custom sets can be edited by another worker, so only trust them for a
+        # while; an unchanged set keeps its exercise and the expected results cached on it
+        expires = time.monotonic() + settings.EXERCISE_CACHE_TTL
+        if previous is not None and previous[2] == question_set.updated_at:
+            return previous[0], expires, previous[2]
+        return compile_question_set(question_set, parts[2]), expires, question_set.updated_at
+
+
+exercise_registry = ExerciseRegistry()
+
+
+@receiver(post_save, sender=CustomQuestionSet)
+@receiver(post_delete, sender=CustomQuestionSet)
+def _question_set_changed(sender, instance, **kwargs):
+    exercise_registry.invalidate(f"custom:{instance.pk}:")
@@ -0,0 +1,176 @@
+"""
+In-Flight Submissions
+Lets a new submission stop the one it replaces.
+
+Students tend to click Run again before the previous result has arrived. Each
+graded submission holds a ticket for its (session, exercise) pair until its
+response has been sent, streamed bodies included. A new ticket for the same
+pair supersedes the old one: the statements the old one is running are
+interrupted (QueryExecutor.interrupt) so the worker stops spending time on a
+result nobody will read, and its response is replaced by SUPERSEDED_RESPONSE.
+Superseded submissions are not logged as attempts; the query log counts them
+per exercise.
+
+QueryExecutor.get_cursor() attaches the cursors it opens to the ticket active
+in the current thread (see SubmissionTicket.active()), the same way
+memory_phase() finds the traced request; other work can attach a stop callback
+directly. Streamed bodies are sent after active() has ended, so they are handed
+the ticket itself (streaming.iter_json_result) to tell a supersession from a
+timeout.
+
+The registry is per worker process. A resubmission handled by another worker
+(or another server) does not stop the earlier one; both run to the end and
+both are logged.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from .query_log import query_log
+
+
+SUPERSEDED_MESSAGE = "⏹ Replaced by a newer submission."
+SUPERSEDED_RESPONSE = {"error": SUPERSEDED_MESSAGE, "correct": False, "superseded": True}
+
+_local = threading.local()
+
+
+class Superseded(Exception):
+    """Raised when work starts for a submission that has already been superseded."""
+
+
+def current_ticket():
+    """Return the ticket active in this thread, or None."""
+    return getattr(_local, 'ticket', None)
+
+
+@contextmanager
+def detached():
+    """
+    Run work that other submissions also wait for outside the current ticket,
+    so superseding this submission does not stop it for them.
+    """
+    previous = current_ticket()
+    _local.ticket = None
+    try:
+        yield
+    finally:
+        _local.ticket = previous
+
+
+class SubmissionTicket:
+    """One submission's claim on its (session, exercise) pair."""
+    
+    def __init__(self, registry, key):
+        self.registry = registry
+        self.key = key
+        self.superseded = False
+        self._stops = {}
+        self._lock = threading.Lock()
+    
+    def attach(self, stop):
+        """
+        Register a callable that stops running work if this ticket is superseded.
+        
+        Returns:
+            object: Handle for detach()
+        
+        Raises:
+            Superseded: If the ticket already is
+        """
+        handle = object()
+        with self._lock:
+            if self.superseded:
+                raise Superseded(SUPERSEDED_MESSAGE)
+            self._stops[handle] = stop
+        return handle
+    
+    def detach(self, handle):
+        with self._lock:
+            self._stops.pop(handle, None)
+    
+    def supersede(self):
+        """Mark the ticket superseded and stop everything attached to it."""
+        with self._lock:
+            self.superseded = True
+            stops = list(self._stops.values())
+            self._stops.clear()
+        for stop in stops:
+            stop()
+    
+    @contextmanager
+    def active(self):
+        """Make this the current thread's ticket, for the cursors it opens."""
+        previous = current_ticket()
+        _local.ticket = self
+        try:
+            yield self
+        finally:
+            _local.ticket = previous
+    
+    def finish(self):
+        """Release the pair, unless a newer submission has taken it."""
+        self.registry.release(self)
+    
+    def track(self, response):
+        """
+        Finish the ticket once a response has been sent.
+        
+        Args:
+            response: Response returned for the submission
+        
+        Returns:
+            The response, with a streamed body wrapped to finish afterwards
+        """
+        if not response.streaming:
+            self.finish()
+            return response
+        response.streaming_content = self._finish_after(response.streaming_content)
+        return response
+    
+    def _finish_after(self, chunks):
+        try:
+            yield from chunks
+        finally:
+            self.finish()
+
+
+class InFlightRegistry:
+    """The latest ticket of every (session, exercise) pair with a submission running."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tickets = {}
+    
+    def begin(self, session_key, exercise):
+        """
+        Take the pair for a new submission, superseding the one running for it.
+        
+        Args:
+            session_key (str): Session of the student
+            exercise (str): Exercise key
+        
+        Returns:
+            SubmissionTicket: To be finished (or tracked) when the response is done
+        """
+        key = (session_key, exercise)
+        ticket = SubmissionTicket(self, key)
+        with self._lock:
+            previous = self._tickets.get(key)
+            self._tickets[key] = ticket
+        if previous is not None:
+            previous.supersede()
+            query_log.record_superseded(exercise)
+        return ticket
+    
+    def release(self, ticket):
+        with self._lock:
+            if self._tickets.get(ticket.key) is ticket:
+                del self._tickets[ticket.key]
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._tickets)
+
+
+in_flight = InFlightRegistry()
@@ -0,0 +1,275 @@
+"""
+Background Jobs
+Runs authoring-time work off the request thread.
+
+A job is a row in the jobs table (models.Job) naming a handler in JOB_HANDLERS
+and its JSON payload. Each process runs a dispatcher thread that claims due
+jobs with a conditional UPDATE (so several processes can share the table) and
+runs them on a pool of JOB_WORKERS threads. The dispatcher wakes up when this
+process enqueues a job and otherwise checks the table every
+JOB_POLL_INTERVAL seconds, which also picks up jobs enqueued elsewhere or left
+behind by a restart. A job that raises is retried with a growing delay until
+it has failed max_attempts times; one still running after JOB_TIMEOUT seconds
+is assumed lost with its process and queued again.
+
+`python manage.py jobs` lists, retries and runs jobs from the command line.
+"""
+
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+from .warmup import serves_requests
+
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """
+    Register a function as the handler of a job kind.
+    
+    The handler is called with the job's payload and returns a JSON-serializable
+    result; raising an exception fails the attempt.
+    """
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+@job_handler('validate_question_set')
+def _validate_question_set(payload):
+    from .models import CustomQuestionSet
+    from .question_sets import check_question_set
+    
+    question_set = CustomQuestionSet.objects.get(pk=payload['pk'])
+    return {'errors': check_question_set(question_set)}
+
+
+@job_handler('fingerprint_expected')
+def _fingerprint_expected(payload):
+    from .exercises import exercise_registry
+    
+    success, value = exercise_registry.get(payload['key']).expected()
+    if not success:
+        raise RuntimeError(value)
+    return {'key': payload['key']}
+
+
+@job_handler('warm_caches')
+def _warm_caches(payload):
+    from .warmup import WarmupState, run_warmup
+    
+    report = run_warmup(WarmupState()).as_dict()
+    if not report['ready']:
+        raise RuntimeError(report['error'])
+    return {'total_ms': report['total_ms'], 'warnings': report['warnings']}
+
+
+@job_handler('rebuild_dataset')
+def _rebuild_dataset(payload):
+    from . import dataset
+    from .memory_dataset import memory_dataset
+    
+    dataset.bump_version()
+    version = dataset.current_version()
+    memory_dataset.load(version)
+    return {'version': version}
+
+
+class JobQueue:
+    """Enqueues jobs and runs due ones on a per-process thread pool."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pool = None
+        self._in_flight = 0
+    
+    def enqueue(self, kind, payload=None, max_attempts=None):
+        """
+        Queue a job. In a serving process it starts once the current
+        transaction commits; elsewhere it waits for a serving process (or
+        `manage.py jobs --run`) to pick it up.
+        
+        Args:
+            kind (str): Key of JOB_HANDLERS
+            payload (dict): JSON-serializable arguments for the handler
+            max_attempts (int): Attempts before giving up, defaults to JOB_MAX_ATTEMPTS
+        
+        Returns:
+            Job: The queued job
+        
+        Raises:
+            ValueError: If no handler is registered for kind
+        """
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        
+        job = Job.objects.create(
+            kind=kind,
+            payload=payload or {},
+            max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        )
+        if settings.JOB_QUEUE_ENABLED and serves_requests():
+            transaction.on_commit(self.wake)
+        return job
+    
+    def wake(self):
+        """Make the dispatcher look for due jobs now."""
+        self._ensure_thread()
+        self._wakeup.set()
+    
+    def claim(self, limit):
+        """
+        Mark up to limit due jobs as running for this process.
+        
+        Returns:
+            list: Primary keys of the claimed jobs
+        """
+        if limit <= 0:
+            return []
+        now = timezone.now()
+        candidates = (
+            Job.objects.filter(status=Job.QUEUED, run_after__lte=now)
+            .order_by('run_after', 'pk')
+            .values_list('pk', flat=True)[:limit]
+        )
+        claimed = []
+        for pk in list(candidates):
+            # Another process may have claimed it since the SELECT
+            if Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+                status=Job.RUNNING, started_at=now, attempts=F('attempts') + 1
+            ):
+                claimed.append(pk)
+        return claimed
+    
+    def requeue_lost(self):
+        """
+        Queue again the jobs that have been running for longer than JOB_TIMEOUT.
+        
+        Returns:
+            int: Number of jobs queued again
+        """
+        cutoff = timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT)
+        lost = Job.objects.filter(status=Job.RUNNING, started_at__lt=cutoff)
+        failed = lost.filter(attempts__gte=F('max_attempts')).update(
+            status=Job.FAILED, error="Timed out", finished_at=timezone.now()
+        )
+        return lost.update(status=Job.QUEUED, run_after=timezone.now()) + failed
+    
+    def run_job(self, pk):
+        """
+        Run a claimed job and record its outcome.
+        
+        Args:
+            pk (int): Primary key of a job claimed by this process
+        """
+        job = Job.objects.get(pk=pk)
+        try:
+            result = JOB_HANDLERS[job.kind](job.payload)
+        except Exception as e:
+            logger.warning("Job %s failed (attempt %d of %d)", job, job.attempts, job.max_attempts)
+            job.error = f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+            if job.attempts < job.max_attempts:
+                job.status = Job.QUEUED
+                job.run_after = timezone.now() + timedelta(seconds=settings.JOB_RETRY_DELAY * job.attempts)
+            else:
+                job.status = Job.FAILED
+                job.finished_at = timezone.now()
+            job.save(update_fields=['status', 'error', 'run_after', 'finished_at'])
+            return
+        
+        job.status = Job.SUCCEEDED
+        job.result = result
+        job.error = ''
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'result', 'error', 'finished_at'])
+    
+    def run_due(self):
+        """
+        Run due jobs in the calling thread until none is left.
+        
+        Returns:
+            int: Number of jobs run
+        """
+        count = 0
+        self.requeue_lost()
+        while True:
+            claimed = self.claim(1)
+            if not claimed:
+                return count
+            self.run_job(claimed[0])
+            count += 1
+    
+    def retry(self, pk):
+        """
+        Queue a failed job again with a fresh set of attempts.
+        
+        Returns:
+            bool: False if the job is not in the failed state
+        """
+        retried = Job.objects.filter(pk=pk, status=Job.FAILED).update(
+            status=Job.QUEUED, attempts=0, run_after=timezone.now(), finished_at=None
+        )
+        if retried and settings.JOB_QUEUE_ENABLED and serves_requests():
+            self.wake()
+        return bool(retried)
+    
+    def _dispatch(self):
+        self.requeue_lost()
+        with self._lock:
+            free = settings.JOB_WORKERS - self._in_flight
+        for pk in self.claim(free):
+            with self._lock:
+                self._in_flight += 1
+            self._pool.submit(self._work, pk)
+    
+    def _work(self, pk):
+        try:
+            self.run_job(pk)
+        except Exception:
+            logger.exception("Could not record the outcome of job %s", pk)
+        finally:
+            close_old_connections()
+            with self._lock:
+                self._in_flight -= 1
+            # A worker is free again
+            self._wakeup.set()
+    
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=settings.JOB_WORKERS, thread_name_prefix='job'
+                    )
+                self._thread = threading.Thread(target=self._run, name='job-dispatcher', daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        while True:
+            self._wakeup.wait(settings.JOB_POLL_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self._dispatch()
+            except Exception:
+                logger.exception("Job dispatch failed")
+            close_old_connections()
+
+
+job_queue = JobQueue()
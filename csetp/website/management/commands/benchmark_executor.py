@@ -0,0 +1,94 @@
+"""
+Executor Benchmark
+Times QueryExecutor against a database alias so SQLite and PostgreSQL
+backends can be compared on the same workload.
+
+Usage:
+    python manage.py benchmark_executor
+    CSETP_EXERCISE_DB_BACKEND=postgresql python manage.py benchmark_executor
+    python manage.py benchmark_executor --database memory
+    python manage.py benchmark_executor --database default --iterations 500
+"""
+
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from website.executor import MEMORY_ALIAS, QueryExecutor
+
+
+# Representative student workload, from a point lookup to a large result set
+BENCHMARK_QUERIES = {
+    'filter': "SELECT first_name, last_name, email FROM employees WHERE department = 'IT'",
+    'aggregate': "SELECT SUM(salary) FROM employees WHERE department = 'Marketing'",
+    'join': (
+        "SELECT employees.first_name, employees.last_name, projects.project_name "
+        "FROM employees INNER JOIN projects ON employees.id = projects.employee_id"
+    ),
+    'left_join': (
+        "SELECT employees.first_name, employees.last_name FROM employees "
+        "LEFT JOIN projects ON employees.id = projects.employee_id "
+        "WHERE projects.employee_id IS NULL"
+    ),
+    'large_result': (
+        "SELECT e1.first_name, e2.last_name, e3.email "
+        "FROM employees e1 CROSS JOIN employees e2 CROSS JOIN employees e3"
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = "Benchmark QueryExecutor latency against a database alias."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default=settings.EXERCISE_DB_ALIAS,
+            help=f"Database alias to benchmark, or '{MEMORY_ALIAS}' for the in-memory "
+                 "dataset copy (default: the exercise alias).",
+        )
+        parser.add_argument(
+            '--iterations', type=int, default=200,
+            help="Timed executions per query.",
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=10,
+            help="Untimed executions per query before measuring.",
+        )
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias == MEMORY_ALIAS:
+            vendor = 'sqlite, in memory'
+        elif alias in connections:
+            vendor = connections[alias].vendor
+        else:
+            raise CommandError(f"Unknown database alias '{alias}'.")
+        self.stdout.write(
+            f"Benchmarking alias '{alias}' ({vendor}), "
+            f"{options['iterations']} iterations per query\n"
+        )
+        self.stdout.write(f"{'query':<14}{'rows':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+
+        for name, query in BENCHMARK_QUERIES.items():
+            for _ in range(options['warmup']):
+                QueryExecutor.execute_query(query, using=alias)
+
+            timings = []
+            rows = 0
+            for _ in range(options['iterations']):
+                start = time.perf_counter()
+                success, result = QueryExecutor.execute_query(query, using=alias)
+                timings.append((time.perf_counter() - start) * 1000)
+                if not success:
+                    raise CommandError(f"{name}: {result}")
+                rows = len(result)
+
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(
+                f"{name:<14}{rows:>8}{statistics.mean(timings):>10.2f}"
+                f"{statistics.median(timings):>10.2f}{p95:>10.2f}{timings[-1]:>10.2f}"
+            )
@@ -0,0 +1,171 @@
+"""
+SQLite Profile Benchmark
+Compares the connection profiles in website/sqlite_profiles.py under the load
+of a class: student readers running exercise queries while teachers (and the
+submission log) write at the same time.
+
+Each profile runs against its own copy of the database in a temporary
+directory, so the real database file and its journal mode are never touched.
+
+Usage:
+    python manage.py benchmark_sqlite_profiles
+    python manage.py benchmark_sqlite_profiles --readers 16 --writers 2 --seconds 10
+    python manage.py benchmark_sqlite_profiles --profiles wal tuned
+"""
+
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from website.management.commands.benchmark_executor import BENCHMARK_QUERIES
+from website.sqlite_profiles import SQLITE_PROFILES, apply_profile
+
+
+# One simulated teacher write: a batch like the ones SubmissionLog flushes
+WRITE_SQL = (
+    "INSERT INTO submissions (exercise, session_key, query, verdict, latency_ms, created_at) "
+    "VALUES ('benchmark', ?, 'select 1', 'correct', 1.0, datetime('now'))"
+)
+
+
+def percentile(timings, fraction):
+    if not timings:
+        return 0.0
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Benchmark the SQLite connection profiles with concurrent readers and writers."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profiles', nargs='+', default=list(SQLITE_PROFILES),
+            help="Profiles to compare (default: all).",
+        )
+        parser.add_argument('--readers', type=int, default=8, help="Concurrent student reader threads.")
+        parser.add_argument('--writers', type=int, default=1, help="Concurrent teacher writer threads.")
+        parser.add_argument('--seconds', type=float, default=5.0, help="Duration of each run.")
+        parser.add_argument(
+            '--batch', type=int, default=50,
+            help="Rows inserted per write transaction.",
+        )
+        parser.add_argument(
+            '--write-interval', type=float, default=0.05,
+            help="Pause between a writer's transactions, in seconds.",
+        )
+
+    def handle(self, *args, **options):
+        unknown = [name for name in options['profiles'] if name not in SQLITE_PROFILES]
+        if unknown:
+            raise CommandError(f"Unknown profile(s): {', '.join(unknown)}")
+
+        source = Path(settings.DATABASES['default']['NAME'])
+        if not source.exists():
+            raise CommandError(f"Database file {source} does not exist; run migrate first.")
+
+        self.stdout.write(
+            f"{options['readers']} readers, {options['writers']} writers, "
+            f"{options['seconds']}s per profile\n"
+        )
+        self.stdout.write(
+            f"{'profile':<10}{'reads/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+            f"{'writes/s':>10}{'w p95 ms':>10}{'errors':>8}"
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            for name in options['profiles']:
+                path = Path(directory) / f"{name}.sqlite3"
+                self.copy_database(source, path, name)
+                reads, writes, errors = self.run_profile(path, name, options)
+
+                reads.sort()
+                writes.sort()
+                seconds = options['seconds']
+                self.stdout.write(
+                    f"{name:<10}{len(reads) / seconds:>10.0f}{percentile(reads, 0.5):>9.2f}"
+                    f"{percentile(reads, 0.95):>9.2f}{percentile(reads, 0.99):>9.2f}"
+                    f"{len(writes) / seconds:>10.1f}{percentile(writes, 0.95):>10.2f}{errors:>8}"
+                )
+
+    def copy_database(self, source, path, profile):
+        """Copy the database with the backup API and switch it to the profile's journal mode."""
+        source_connection = sqlite3.connect(source)
+        copy = sqlite3.connect(path)
+        try:
+            source_connection.backup(copy)
+            apply_profile(copy, profile)
+        finally:
+            source_connection.close()
+            copy.close()
+
+    def run_profile(self, path, profile, options):
+        """
+        Run readers and writers against one copy until the time is up.
+
+        Returns:
+            tuple: (read latencies ms, write latencies ms, number of failed operations)
+        """
+        stop = threading.Event()
+        lock = threading.Lock()
+        reads, writes = [], []
+        errors = [0]
+
+        def reader(index):
+            connection = sqlite3.connect(f"{path.as_uri()}?mode=ro", uri=True, check_same_thread=False)
+            apply_profile(connection, profile, read_only=True)
+            queries = list(BENCHMARK_QUERIES.values())
+            timings, failed = [], 0
+            position = index
+            while not stop.is_set():
+                query = queries[position % len(queries)]
+                position += 1
+                start = time.perf_counter()
+                try:
+                    connection.execute(query).fetchall()
+                except sqlite3.OperationalError:
+                    failed += 1
+                    continue
+                timings.append((time.perf_counter() - start) * 1000)
+            connection.close()
+            with lock:
+                reads.extend(timings)
+                errors[0] += failed
+
+        def writer(index):
+            connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            apply_profile(connection, profile)
+            timings, failed = [], 0
+            rows = [(f"benchmark-{index}",)] * options['batch']
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    connection.execute('BEGIN IMMEDIATE')
+                    connection.executemany(WRITE_SQL, rows)
+                    connection.execute('COMMIT')
+                except sqlite3.OperationalError:
+                    failed += 1
+                    if connection.in_transaction:
+                        connection.execute('ROLLBACK')
+                else:
+                    timings.append((time.perf_counter() - start) * 1000)
+                stop.wait(options['write_interval'])
+            connection.close()
+            with lock:
+                writes.extend(timings)
+                errors[0] += failed
+
+        threads = [threading.Thread(target=reader, args=(i,)) for i in range(options['readers'])]
+        threads += [threading.Thread(target=writer, args=(i,)) for i in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        return reads, writes, errors[0]
@@ -0,0 +1,50 @@
+"""
+Export Question Sets
+Writes custom question sets to a JSONL file or a ZIP archive that
+import_question_sets (or the dashboard import) reads back.
+
+Usage:
+    python manage.py export_question_sets > question_sets.jsonl
+    python manage.py export_question_sets --output question_sets.zip
+    python manage.py export_question_sets --ids 3 4 7 --output some.jsonl
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from website.models import CustomQuestionSet
+from website.question_sets import iter_jsonl, write_zip
+
+
+class Command(BaseCommand):
+    help = "Export custom question sets as JSONL or ZIP."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', '-o',
+            help="File to write; a .zip name writes a ZIP archive (default: JSONL to stdout).",
+        )
+        parser.add_argument('--ids', type=int, nargs='+', help="Only export these question sets.")
+
+    def handle(self, *args, **options):
+        queryset = CustomQuestionSet.objects.all()
+        if options['ids']:
+            queryset = queryset.filter(pk__in=options['ids'])
+        count = queryset.count()
+
+        output = options['output']
+        if output is None:
+            for line in iter_jsonl(queryset):
+                self.stdout.write(line, ending='')
+            return
+
+        try:
+            if output.endswith('.zip'):
+                with open(output, 'wb') as file:
+                    write_zip(file, queryset)
+            else:
+                with open(output, 'w', encoding='utf-8') as file:
+                    file.writelines(iter_jsonl(queryset))
+        except OSError as e:
+            raise CommandError(f"Could not write {output}: {e}")
+
+        self.stderr.write(self.style.SUCCESS(f"Exported {count} question set(s) to {output}."))
@@ -0,0 +1,59 @@
+"""
+Import Question Sets
+Creates custom question sets from a JSONL file or ZIP archive written by
+export_question_sets.
+
+Every set is validated and its predict, modify and make queries are
+test-executed in parallel, each within --budget-ms; valid sets are created
+with one bulk insert and invalid ones are listed with the line they came from.
+
+Usage:
+    python manage.py import_question_sets question_sets.jsonl
+    python manage.py import_question_sets question_sets.zip --dry-run
+    python manage.py import_question_sets big.jsonl --workers 16 --budget-ms 500
+"""
+
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from website.question_sets import QuestionSetImporter, read_entries
+
+
+class Command(BaseCommand):
+    help = "Import custom question sets from JSONL or ZIP, validating them in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="JSONL file or ZIP archive to import.")
+        parser.add_argument('--dry-run', action='store_true', help="Only validate, create nothing.")
+        parser.add_argument('--budget-ms', type=int, help="Time budget per test-executed query.")
+        parser.add_argument('--workers', type=int, help="Threads test-executing queries.")
+        parser.add_argument(
+            '--strict', action='store_true',
+            help="Exit with an error if any set is invalid.",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        try:
+            entries = read_entries(path.read_bytes(), path.name)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        importer = QuestionSetImporter(options['budget_ms'], options['workers'])
+        report = importer.run(entries, dry_run=options['dry_run']).as_dict()
+
+        for entry in report['invalid']:
+            self.stdout.write(self.style.WARNING(f"{entry['source']} ({entry['name'] or 'unnamed'}):"))
+            for error in entry['errors']:
+                self.stdout.write(f"    {error}")
+
+        verb = "would be created" if report['dry_run'] else "created"
+        created = report['valid'] if report['dry_run'] else len(report['created'])
+        self.stdout.write(
+            f"{report['total']} set(s) read, {created} {verb}, "
+            f"{len(report['invalid'])} invalid, in {report['elapsed_ms']:.0f} ms"
+        )
+
+        if options['strict'] and report['invalid']:
+            raise CommandError("Some question sets are invalid.")
@@ -0,0 +1,64 @@
+"""
+Jobs
+Lists, queues, retries and runs background jobs (website/jobs.py).
+
+Running jobs here is useful where no serving process runs the job threads,
+e.g. from cron, or to drain the queue before a deploy.
+
+Usage:
+    python manage.py jobs
+    python manage.py jobs --status failed
+    python manage.py jobs --retry 12
+    python manage.py jobs --enqueue rebuild_dataset
+    python manage.py jobs --enqueue validate_question_set --payload '{"pk": 3}'
+    python manage.py jobs --run
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from website.jobs import JOB_HANDLERS, job_queue
+from website.models import Job
+
+
+class Command(BaseCommand):
+    help = "List, queue, retry and run background jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', choices=[choice for choice, _ in Job.STATUS_CHOICES], help="Only list jobs in this state.")
+        parser.add_argument('--limit', type=int, default=20, help="Jobs to list (default: 20).")
+        parser.add_argument('--retry', type=int, metavar='ID', help="Queue a failed job again.")
+        parser.add_argument('--enqueue', choices=sorted(JOB_HANDLERS), help="Queue a new job of this kind.")
+        parser.add_argument('--payload', default='{}', help="JSON payload for --enqueue.")
+        parser.add_argument('--run', action='store_true', help="Run due jobs in the foreground until none is left.")
+
+    def handle(self, *args, **options):
+        if options['retry'] is not None:
+            if not job_queue.retry(options['retry']):
+                raise CommandError(f"Job {options['retry']} does not exist or has not failed.")
+            self.stdout.write(f"Job {options['retry']} queued again.")
+
+        if options['enqueue']:
+            try:
+                payload = json.loads(options['payload'])
+            except json.JSONDecodeError as e:
+                raise CommandError(f"Invalid --payload: {e}")
+            job = job_queue.enqueue(options['enqueue'], payload)
+            self.stdout.write(f"Queued {job}.")
+
+        if options['run']:
+            count = job_queue.run_due()
+            self.stdout.write(self.style.SUCCESS(f"Ran {count} job(s)."))
+
+        jobs = Job.objects.all()
+        if options['status']:
+            jobs = jobs.filter(status=options['status'])
+
+        self.stdout.write(f"{'id':>6}  {'kind':<24}{'status':<11}{'attempts':>9}  outcome")
+        for job in jobs[:options['limit']]:
+            outcome = job.error.splitlines()[0] if job.error else json.dumps(job.result)
+            self.stdout.write(
+                f"{job.pk:>6}  {job.kind:<24}{job.status:<11}"
+                f"{f'{job.attempts}/{job.max_attempts}':>9}  {outcome[:80]}"
+            )
@@ -0,0 +1,61 @@
+"""
+Profile Report
+Adds up the request profiles in PROFILE_DIR (website/request_profiler.py) and
+prints the functions the grading views spend the most time in.
+
+Usage:
+    python manage.py profile_report
+    python manage.py profile_report --exercise primm3_modify --sort tottime --limit 40
+    python manage.py profile_report --slowest 5
+    python manage.py profile_report --token
+"""
+
+import io
+import pstats
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from website.request_profiler import PROFILE_HEADER, list_profiles, make_token
+
+
+SORT_KEYS = ('cumulative', 'tottime', 'calls')
+
+
+class Command(BaseCommand):
+    help = "Aggregate request profiles into a top-functions report."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exercise', help="Only profiles of this exercise key.")
+        parser.add_argument('--sort', choices=SORT_KEYS, default='cumulative', help="Order of the functions (default: cumulative).")
+        parser.add_argument('--limit', type=int, default=25, help="Functions to list (default: 25).")
+        parser.add_argument('--slowest', type=int, metavar='N', help="Only the N slowest requests.")
+        parser.add_argument('--token', action='store_true', help=f"Print an {PROFILE_HEADER} header value that profiles one request.")
+
+    def handle(self, *args, **options):
+        if options['token']:
+            self.stdout.write(f"{PROFILE_HEADER}: {make_token()}")
+            self.stdout.write(f"Valid for {settings.PROFILE_TOKEN_MAX_AGE} seconds.")
+            return
+
+        profiles = list_profiles(options['exercise'])
+        if options['slowest']:
+            profiles = sorted(profiles, key=lambda p: p[2], reverse=True)[:options['slowest']]
+        if not profiles:
+            raise CommandError(f"No profiles in {settings.PROFILE_DIR}.")
+
+        latencies = sorted(latency for _, _, latency in profiles)
+        self.stdout.write(
+            f"{len(profiles)} profile(s) from {settings.PROFILE_DIR}: "
+            f"median {latencies[len(latencies) // 2]} ms, max {latencies[-1]} ms"
+        )
+        exercises = {}
+        for _, exercise, latency in profiles:
+            exercises.setdefault(exercise, []).append(latency)
+        for exercise, values in sorted(exercises.items(), key=lambda item: -sum(item[1])):
+            self.stdout.write(f"  {exercise:<30}{len(values):>5} request(s), {sum(values) / len(values):>8.0f} ms mean")
+
+        output = io.StringIO()
+        stats = pstats.Stats(*(str(path) for path, _, _ in profiles), stream=output)
+        stats.strip_dirs().sort_stats(options['sort']).print_stats(options['limit'])
+        self.stdout.write(output.getvalue())
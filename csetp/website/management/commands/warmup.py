@@ -0,0 +1,34 @@
+"""
+Warmup
+Runs the worker warmup in the foreground and prints how long each step took.
+
+Useful as a deploy pre-start check: it exits with an error if warmup fails,
+and lists exercises whose expected result could not be computed.
+
+Usage:
+    python manage.py warmup
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from website.warmup import run_warmup
+
+
+class Command(BaseCommand):
+    help = "Precompute exercise artifacts and report startup timings."
+
+    def handle(self, *args, **options):
+        report = run_warmup().as_dict()
+
+        self.stdout.write(f"{'step':<28}{'ms':>10}")
+        for step in report['steps']:
+            self.stdout.write(f"{step['step']:<28}{step['ms']:>10.1f}")
+        if report['total_ms'] is not None:
+            self.stdout.write(f"{'total':<28}{report['total_ms']:>10.1f}")
+
+        for warning in report['warnings']:
+            self.stdout.write(self.style.WARNING(warning))
+
+        if not report['ready']:
+            raise CommandError(f"Warmup failed: {report['error']}")
+        self.stdout.write(self.style.SUCCESS("Warmup complete."))
@@ -0,0 +1,330 @@
+"""
+In-Memory Dataset
+Keeps one in-memory SQLite copy of the exercise tables per worker process.
+
+The employees and projects tables (settings.EXERCISE_TABLES) are copied out of
+the exercise database once per dataset version: the database file is attached
+to an empty in-memory database and only those tables and their indexes are
+copied over, so the copy never carries the sessions, submissions or job tables
+stored next to the dataset. The copy lives in SQLite's memdb VFS under a
+process-unique name, so every thread connects to the same database instead of
+holding a copy of its own; with memory mapping enabled the connections read
+its pages in place rather than caching them again. Student queries therefore
+never touch the database file, its locks or the other tables.
+
+Used by QueryExecutor when settings.EXERCISE_EXECUTION_MODE is 'memory'.
+
+Numbered variants are perturbed copies of the same tables (values shuffled and
+jittered with a fixed seed per variant), used to cross-check that a query which
+is correct on the real data is not just hard-coding its answer.
+
+Scaled copies repeat the same rows until the employees table holds a given
+number of rows (projects grow in proportion), so students can time their
+queries on realistic table sizes (performance.py).
+"""
+
+import itertools
+import random
+import threading
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.sqlite3 import base as sqlite_base
+from django.db.backends.sqlite3._functions import register as register_functions
+
+from . import dataset
+from .models import Employee, Project
+
+
+# Same column type conversions as Django's SQLite connections (dates, decimals)
+DETECT_TYPES = sqlite_base.Database.PARSE_DECLTYPES | sqlite_base.Database.PARSE_COLNAMES
+
+# Readers map the shared database's pages instead of copying them into their
+# own page cache; memdb databases are not files, so this maps no file
+MMAP_SIZE = 1 << 30
+
+
+class SharedDatabase:
+    """An in-memory database that every thread of this process can connect to."""
+    
+    _names = itertools.count()
+    
+    def __init__(self, image):
+        """
+        Args:
+            image (bytes): Serialized database to load
+        """
+        self.uri = f"file:/csetp-dataset-{next(self._names)}?vfs=memdb"
+        self._lock = threading.Lock()
+        # Keeps the database alive; it is freed with the last connection to it
+        self._holder = sqlite_base.Database.connect(self.uri, uri=True, check_same_thread=False)
+        loader = sqlite_base.Database.connect(':memory:')
+        try:
+            loader.deserialize(image)
+            loader.backup(self._holder)
+        finally:
+            loader.close()
+    
+    def connect(self):
+        """Open a read-only connection to the database."""
+        connection = sqlite_base.Database.connect(self.uri, uri=True, detect_types=DETECT_TYPES)
+        connection.execute('PRAGMA query_only = ON')
+        connection.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        register_functions(connection)
+        return connection
+    
+    def serialize(self):
+        """Return a serialized copy, e.g. to build a private writable copy from."""
+        with self._lock:
+            return self._holder.serialize()
+
+
+class InMemoryDataset:
+    """The shared in-memory copies of the dataset tables, connected to once per thread."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Building a large scaled copy takes seconds; done outside _lock, one at a time
+        self._scale_lock = threading.Lock()
+        self._databases = {}
+        self._version = None
+        self._local = threading.local()
+    
+    @staticmethod
+    def tables():
+        """Return the names of the tables copied into memory."""
+        return [Employee._meta.db_table, Project._meta.db_table]
+    
+    def load(self, version, variant=None):
+        """
+        Return the shared copy of the dataset for a version, copying it if needed.
+        
+        Args:
+            version (int): Dataset version (dataset.current_version())
+            variant (int): Perturbed variant number, None for the real data
+        
+        Returns:
+            SharedDatabase: Database holding only the dataset tables
+        """
+        database = self._databases.get(variant) if self._version == version else None
+        if database is not None:
+            return database
+        
+        with self._lock:
+            self._switch_version(version)
+            if None not in self._databases:
+                self._databases[None] = SharedDatabase(self._copy())
+            if variant not in self._databases:
+                self._databases[variant] = SharedDatabase(perturb(self._databases[None].serialize(), variant))
+            return self._databases[variant]
+    
+    def load_scaled(self, version, rows):
+        """
+        Return the shared copy of the dataset scaled to a number of employees, building it if needed.
+        
+        Args:
+            version (int): Dataset version (dataset.current_version())
+            rows (int): Rows in the employees table of the copy
+        
+        Returns:
+            SharedDatabase: Database holding the scaled dataset tables
+        """
+        key = ('scale', rows)
+        base = self.load(version)
+        database = self._databases.get(key) if self._version == version else None
+        if database is not None:
+            return database
+        
+        with self._scale_lock:
+            database = self._databases.get(key) if self._version == version else None
+            if database is None:
+                database = SharedDatabase(scale_up(base.serialize(), rows))
+                with self._lock:
+                    if self._version == version:
+                        self._databases[key] = database
+        return database
+    
+    def image(self, version, variant=None):
+        """Return a serialized copy of the dataset for a version (see load())."""
+        return self.load(version, variant).serialize()
+    
+    def scaled_image(self, version, rows):
+        """Return a serialized copy of the scaled dataset (see load_scaled())."""
+        return self.load_scaled(version, rows).serialize()
+    
+    def _switch_version(self, version):
+        """
+        Forget the copies of an older dataset version; called with _lock held.
+        
+        A copy is freed once nothing refers to it and no connection to it is
+        left, so a thread that is about to connect to it still can.
+        """
+        if self._version != version:
+            self._databases = {}
+            self._version = version
+    
+    def _copy(self):
+        source = connections[settings.EXERCISE_DB_ALIAS]
+        
+        memory = sqlite_base.Database.connect(':memory:', uri=True)
+        try:
+            # Same URI (read-only, possibly immutable) the exercise alias opens
+            memory.execute('ATTACH DATABASE ? AS source', (str(source.settings_dict['NAME']),))
+            for table in settings.EXERCISE_TABLES:
+                # The table first, then its indexes
+                schema = memory.execute(
+                    "SELECT sql FROM source.sqlite_master "
+                    "WHERE tbl_name = ? AND sql IS NOT NULL ORDER BY type != 'table'",
+                    (table,)
+                ).fetchall()
+                if not schema:
+                    raise LookupError(f"Dataset table {table} does not exist")
+                memory.execute(schema[0][0])
+                memory.execute(f'INSERT INTO main."{table}" SELECT * FROM source."{table}"')
+                for (sql,) in schema[1:]:
+                    memory.execute(sql)
+            memory.commit()
+            memory.execute('DETACH DATABASE source')
+            return memory.serialize()
+        finally:
+            memory.close()
+    
+    def connection(self, variant=None, scale=None):
+        """
+        Return this thread's read-only connection to the current version's shared copy.
+        
+        Args:
+            variant (int): Perturbed variant number, None for the real data
+            scale (int): Employees in a scaled copy (load_scaled), None for the real data
+        
+        Returns:
+            sqlite3.Connection: Connection holding the dataset tables
+        """
+        version = dataset.current_version()
+        connections_by_variant = getattr(self._local, 'connections', None)
+        if connections_by_variant is None:
+            connections_by_variant = self._local.connections = {}
+        
+        key = variant if scale is None else ('scale', scale)
+        entry = connections_by_variant.get(key)
+        if entry is None or entry[0] != version:
+            database = self.load(version, variant) if scale is None else self.load_scaled(version, scale)
+            # The previous connection is closed once no open cursor still uses it
+            entry = connections_by_variant[key] = (version, database.connect())
+        return entry[1]
+
+
+def perturb(image, variant):
+    """
+    Build a perturbed copy of a dataset image.
+    
+    Every variant number always produces the same changes to the same data:
+    departments and job titles are redrawn from the existing values, salaries
+    are scaled by up to 25% (kept to whole thousands), names move between
+    employees, projects are reassigned and their dates shifted. Correct
+    queries still run unchanged, but their results differ from the real data.
+    
+    Args:
+        image (bytes): Serialized dataset from InMemoryDataset.image
+        variant (int): Variant number, used as the random seed
+    
+    Returns:
+        bytes: Serialized perturbed dataset
+    """
+    rng = random.Random(f"csetp-variant-{variant}")
+    employees_table, projects_table = InMemoryDataset.tables()
+    
+    memory = sqlite_base.Database.connect(':memory:')
+    try:
+        memory.deserialize(image)
+        employees = memory.execute(
+            f'SELECT id, first_name, last_name, email, department, job_title, salary '
+            f'FROM "{employees_table}" ORDER BY id'
+        ).fetchall()
+        employee_ids = [row[0] for row in employees]
+        departments = [row[4] for row in employees]
+        job_titles = [row[5] for row in employees]
+        identities = [row[1:4] for row in employees]
+        rng.shuffle(identities)
+        
+        # Clear the unique emails first so the shuffled ones can be written back
+        memory.execute(f'UPDATE "{employees_table}" SET email = \'tmp-\' || id')
+        memory.executemany(
+            f'UPDATE "{employees_table}" SET first_name = ?, last_name = ?, email = ?, '
+            f'department = ?, job_title = ?, salary = ? WHERE id = ?',
+            [
+                (*identity, rng.choice(departments), rng.choice(job_titles),
+                 round(float(row[6]) * rng.uniform(0.75, 1.25), -3), row[0])
+                for row, identity in zip(employees, identities)
+            ]
+        )
+        
+        projects = memory.execute(f'SELECT id FROM "{projects_table}" ORDER BY id').fetchall()
+        memory.executemany(
+            f'UPDATE "{projects_table}" SET employee_id = ?, '
+            f'start_date = date(start_date, ?), end_date = date(end_date, ?) WHERE id = ?',
+            [
+                (rng.choice(employee_ids), f'{shift:+d} days', f'{shift:+d} days', project_id)
+                for (project_id,), shift in ((project, rng.randint(-365, 365)) for project in projects)
+            ]
+        )
+        memory.commit()
+        return memory.serialize()
+    finally:
+        memory.close()
+
+
+def scale_up(image, rows):
+    """
+    Build a copy of a dataset image with more rows.
+    
+    The employees are repeated, with new ids and emails, until the table holds
+    the given number of rows; projects are repeated in the same proportion
+    and assigned to the matching repeated employees. Indexes are kept, so
+    query plans are the same as on the real data.
+    
+    Args:
+        image (bytes): Serialized dataset from InMemoryDataset.image
+        rows (int): Rows in the employees table of the copy
+    
+    Returns:
+        bytes: Serialized scaled dataset
+    """
+    employees_table, projects_table = InMemoryDataset.tables()
+    
+    memory = sqlite_base.Database.connect(':memory:')
+    try:
+        memory.deserialize(image)
+        employees, max_employee_id = memory.execute(
+            f'SELECT count(*), coalesce(max(id), 0) FROM "{employees_table}"'
+        ).fetchone()
+        projects, max_project_id = memory.execute(
+            f'SELECT count(*), coalesce(max(id), 0) FROM "{projects_table}"'
+        ).fetchone()
+        if not employees or rows <= employees:
+            return image
+        
+        project_rows = round(rows * projects / employees)
+        memory.execute(
+            f'INSERT INTO "{employees_table}" '
+            f'(id, first_name, last_name, email, phone_number, job_title, department, salary) '
+            f'WITH RECURSIVE copy(k) AS (SELECT 1 UNION ALL SELECT k + 1 FROM copy WHERE k < ?) '
+            f'SELECT id + k * ?, first_name, last_name, k || \'.\' || email, phone_number, job_title, '
+            f'department, salary FROM copy, "{employees_table}" ORDER BY k, id LIMIT ?',
+            (-(-rows // employees), max_employee_id, rows - employees)
+        )
+        if projects and project_rows > projects:
+            memory.execute(
+                f'INSERT INTO "{projects_table}" (id, project_name, start_date, end_date, employee_id) '
+                f'WITH RECURSIVE copy(k) AS (SELECT 1 UNION ALL SELECT k + 1 FROM copy WHERE k < ?) '
+                f'SELECT id + k * ?, project_name, start_date, end_date, employee_id + k * ? '
+                f'FROM copy, "{projects_table}" ORDER BY k, id LIMIT ?',
+                (-(-project_rows // projects), max_project_id, max_employee_id, project_rows - projects)
+            )
+        memory.commit()
+        return memory.serialize()
+    finally:
+        memory.close()
+
+
+memory_dataset = InMemoryDataset()
@@ -0,0 +1,283 @@
+"""
+Memory Profiler
+Measures where a request's memory goes, using tracemalloc.
+
+MemoryProfileMiddleware traces a sample of requests (MEMORY_PROFILE_ENABLED,
+MEMORY_PROFILE_SAMPLE_RATE) and any request from staff (or with DEBUG) that
+sends an "X-Memory-Profile: 1" header. Code on the request path marks its
+phases with memory_phase(), which costs one thread-local lookup when the
+request is not traced:
+
+    fetch      rows read from the cursor (QueryExecutor)
+    convert    row tuples turned into dicts (QueryExecutor.execute_query)
+    normalize  results normalized or fingerprinted (QueryComparator)
+    encode     rows encoded as JSON (streaming responses)
+
+For each phase the peak (highest allocation above the level at its start) and
+the net allocation (still allocated at its end) are recorded; the 'request'
+entry covers the whole request, including the streamed body. Results are
+aggregated per endpoint in memory_stats. A phase peaking above
+MEMORY_PROFILE_SNAPSHOT_BYTES dumps a tracemalloc snapshot into
+MEMORY_PROFILE_DUMP_DIR and logs its top allocation sites.
+
+tracemalloc counts allocations of every thread, so only one request is traced
+at a time (others are skipped) and numbers for concurrent traffic are
+approximate. Tracing is started and stopped around each traced request, so
+untraced requests run at full speed.
+"""
+
+import logging
+import random
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import nullcontext
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Memory-Profile'
+
+# Allocation sites logged when a snapshot is dumped
+SNAPSHOT_TOP_LINES = 10
+
+_local = threading.local()
+_tracing_lock = threading.Lock()
+_no_phase = nullcontext()
+
+
+def memory_phase(name):
+    """
+    Return a context manager that attributes allocations to a phase.
+    
+    Args:
+        name (str): Phase name, e.g. 'fetch'
+    
+    Returns:
+        Context manager; a shared no-op when the current request is not traced
+    """
+    profile = getattr(_local, 'profile', None)
+    if profile is None:
+        return _no_phase
+    return _Phase(profile, name)
+
+
+class _Phase:
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+    
+    def __enter__(self):
+        self.profile.enter()
+    
+    def __exit__(self, *exc_info):
+        self.profile.exit(self.name)
+
+
+class MemoryProfile:
+    """Peak and net allocation per phase of one traced request."""
+    
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.phases = {}
+        self.snapshot_path = None
+        self._frames = []  # [allocated at start, highest peak seen] per open phase
+        self._started_tracing = False
+    
+    def start(self):
+        """Start tracing and make this the current thread's profile."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(settings.MEMORY_PROFILE_FRAMES)
+            self._started_tracing = True
+        _local.profile = self
+        self.enter()
+    
+    def finish(self):
+        """
+        Close the request phase, stop tracing and detach from the thread.
+        
+        Returns:
+            dict: Phase name -> {'count', 'peak', 'net'} in bytes
+        """
+        try:
+            self.exit('request')
+        finally:
+            _local.profile = None
+            if self._started_tracing:
+                tracemalloc.stop()
+        return self.phases
+    
+    def enter(self):
+        current, peak = tracemalloc.get_traced_memory()
+        if self._frames:
+            parent = self._frames[-1]
+            parent[1] = max(parent[1], peak)
+        self._frames.append([current, current])
+        tracemalloc.reset_peak()
+    
+    def exit(self, name):
+        current, peak = tracemalloc.get_traced_memory()
+        start, highest = self._frames.pop()
+        highest = max(highest, peak)
+        if self._frames:
+            parent = self._frames[-1]
+            parent[1] = max(parent[1], highest)
+        
+        phase = self.phases.setdefault(name, {'count': 0, 'peak': 0, 'net': 0})
+        phase['count'] += 1
+        phase['peak'] = max(phase['peak'], highest - start)
+        phase['net'] += current - start
+        
+        if highest - start >= settings.MEMORY_PROFILE_SNAPSHOT_BYTES and self.snapshot_path is None:
+            self._dump_snapshot(name, highest - start)
+    
+    def _dump_snapshot(self, phase, peak):
+        """Dump the allocations still alive at the end of an oversized phase."""
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ])
+        directory = settings.MEMORY_PROFILE_DUMP_DIR
+        directory.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r'[^\w.-]+', '_', self.endpoint).strip('_') or 'root'
+        self.snapshot_path = directory / f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{phase}.tracemalloc"
+        snapshot.dump(str(self.snapshot_path))
+        
+        top = '\n'.join(str(stat) for stat in snapshot.statistics('lineno')[:SNAPSHOT_TOP_LINES])
+        logger.warning(
+            "%s: phase '%s' peaked at %.1f MB, snapshot written to %s\n%s",
+            self.endpoint, phase, peak / 2**20, self.snapshot_path, top
+        )
+
+
+class MemoryStats:
+    """Per-endpoint aggregate of traced requests."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self.snapshots = []
+    
+    def record(self, profile):
+        """Add a finished MemoryProfile to its endpoint's totals."""
+        with self._lock:
+            endpoint = self._endpoints.setdefault(profile.endpoint, {'requests': 0, 'phases': {}})
+            endpoint['requests'] += 1
+            for name, phase in profile.phases.items():
+                total = endpoint['phases'].setdefault(
+                    name, {'count': 0, 'peak_max': 0, 'peak_total': 0, 'net_total': 0}
+                )
+                total['count'] += phase['count']
+                total['peak_max'] = max(total['peak_max'], phase['peak'])
+                total['peak_total'] += phase['peak']
+                total['net_total'] += phase['net']
+            if profile.snapshot_path is not None:
+                self.snapshots.append(str(profile.snapshot_path))
+    
+    def export(self):
+        """
+        Return the aggregates, worst request peak first.
+        
+        Returns:
+            dict: 'endpoints' (list of per-endpoint dicts with per-phase
+                  'peak_max', 'peak_mean' and 'net_mean' in bytes, means per
+                  traced request) and the 'snapshots' dumped so far
+        """
+        with self._lock:
+            endpoints = []
+            for name, endpoint in self._endpoints.items():
+                requests = endpoint['requests']
+                phases = {
+                    phase: {
+                        'count': total['count'],
+                        'peak_max': total['peak_max'],
+                        'peak_mean': round(total['peak_total'] / requests),
+                        'net_mean': round(total['net_total'] / requests),
+                    }
+                    for phase, total in endpoint['phases'].items()
+                }
+                endpoints.append({'endpoint': name, 'requests': requests, 'phases': phases})
+            snapshots = list(self.snapshots)
+        
+        endpoints.sort(key=lambda e: e['phases'].get('request', {}).get('peak_max', 0), reverse=True)
+        return {'endpoints': endpoints, 'snapshots': snapshots}
+    
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+            self.snapshots = []
+
+
+memory_stats = MemoryStats()
+
+
+class MemoryProfileMiddleware:
+    """Traces sampled or explicitly requested requests; see the module docstring."""
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        if not self._wanted(request) or not _tracing_lock.acquire(blocking=False):
+            return self.get_response(request)
+        
+        profile = MemoryProfile(request.path)
+        try:
+            profile.start()
+            response = self.get_response(request)
+        except BaseException:
+            self._finish(profile, request)
+            raise
+        
+        # An async body (ASGI event stream) is sent from other threads, so only
+        # the view is traced for it
+        if response.streaming and not response.is_async:
+            # The body is encoded while it is sent, after this returns
+            response.streaming_content = TracedStream(self, profile, request, response.streaming_content)
+        else:
+            self._finish(profile, request)
+        return response
+    
+    def _wanted(self, request):
+        if request.headers.get(PROFILE_HEADER) == '1':
+            user = getattr(request, 'user', None)
+            if settings.DEBUG or (user is not None and user.is_staff):
+                return True
+        return settings.MEMORY_PROFILE_ENABLED and random.random() < settings.MEMORY_PROFILE_SAMPLE_RATE
+    
+    def _finish(self, profile, request):
+        try:
+            match = request.resolver_match
+            if match is not None and match.view_name:
+                profile.endpoint = match.view_name
+            profile.finish()
+            memory_stats.record(profile)
+        finally:
+            _tracing_lock.release()
+
+
+class TracedStream:
+    """
+    Streamed response body whose sending is traced as part of its request.
+    
+    Django calls close() when the response finishes, even if the body was never
+    iterated, so tracing always stops and the lock is always released. The
+    wrapped body was registered for closing first, so it is closed before this.
+    """
+    
+    def __init__(self, middleware, profile, request, chunks):
+        self.middleware = middleware
+        self.profile = profile
+        self.request = request
+        self.chunks = chunks
+        self.finished = False
+    
+    def __iter__(self):
+        return iter(self.chunks)
+    
+    def close(self):
+        if not self.finished:
+            self.finished = True
+            self.middleware._finish(self.profile, self.request)
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:45
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0002_customquestionset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Submission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('exercise', models.CharField(help_text='Exercise key, e.g. primm1_modify or custom:3:make', max_length=100)),
+                ('session_key', models.CharField(max_length=40)),
+                ('query', models.TextField(help_text='Normalized query text')),
+                ('verdict', models.CharField(choices=[('correct', 'Correct'), ('incorrect', 'Incorrect'), ('invalid', 'Rejected by validator'), ('error', 'Execution error')], max_length=20)),
+                ('latency_ms', models.FloatField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'submissions',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['exercise', 'session_key', 'created_at'], name='submissions_exercis_6e8de4_idx')],
+            },
+        ),
+    ]
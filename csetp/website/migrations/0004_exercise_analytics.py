@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0003_submission'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExerciseStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('exercise', models.CharField(max_length=100, unique=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('sessions', models.IntegerField(default=0, help_text='Sessions that attempted the exercise')),
+                ('first_try_correct', models.IntegerField(default=0)),
+                ('solved_sessions', models.IntegerField(default=0)),
+                ('solve_time_histogram', models.JSONField(default=list)),
+                ('wrong_answers', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('question_set', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='website.customquestionset')),
+            ],
+            options={
+                'db_table': 'exercise_stats',
+                'ordering': ['exercise'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SessionProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('exercise', models.CharField(max_length=100)),
+                ('session_key', models.CharField(max_length=40)),
+                ('attempts', models.IntegerField(default=0)),
+                ('first_attempt_at', models.DateTimeField()),
+                ('solved_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'session_progress',
+                'unique_together': {('exercise', 'session_key')},
+            },
+        ),
+    ]
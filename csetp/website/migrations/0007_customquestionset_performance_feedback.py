@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0006_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customquestionset',
+            name='performance_feedback',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0007_customquestionset_performance_feedback'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customquestionset',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
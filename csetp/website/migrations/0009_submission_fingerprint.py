@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0008_customquestionset_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='fingerprint',
+            field=models.TextField(blank=True, help_text='Query with its literals stripped, for grouping attempts'),
+        ),
+        migrations.AlterField(
+            model_name='submission',
+            name='query',
+            field=models.TextField(help_text='Query as submitted'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class Employee(models.Model):
@@ -9,10 +10,10 @@ class Employee(models.Model):
     job_title = models.CharField(max_length=100)
     department = models.CharField(max_length=100)
     salary = models.DecimalField(max_digits=10, decimal_places=2)
-
+    
     class Meta:
         db_table = 'employees'
-
+    
     def __str__(self):
         return f"{self.first_name} {self.last_name} - {self.job_title}"
 
@@ -21,26 +22,31 @@ class Project(models.Model):
     start_date = models.DateField()
     end_date = models.DateField(null=True, blank=True)
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE) 
-
-
+    
+    
     class Meta:
         db_table = 'projects'
-
+    
     def __str__(self):
         return f"{self.project_name} - {self.employee.first_name} {self.employee.last_name}"
-    
+
 
 
 class CustomQuestionSet(models.Model):
-    
+
     name = models.CharField(max_length=200, help_text="Question set name")
     created_at = models.DateTimeField(auto_now_add=True)
+    # Tells workers whether their compiled exercises for this set are still current
+    updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey('auth.User', on_delete=models.CASCADE, null=True, blank=True)
     
     # Table Selection
     uses_employees = models.BooleanField(default=True)
     uses_projects = models.BooleanField(default=False)
     
+    # Let students see the timing and query plan of their submissions
+    performance_feedback = models.BooleanField(default=False)
+    
     # Predict and Run Section
     predict_query = models.TextField(help_text="SQL query for predict section")
     predict_option1 = models.CharField(max_length=500)
@@ -72,3 +78,134 @@ class CustomQuestionSet(models.Model):
     
     def __str__(self):
         return self.name
+    
+    @property
+    def tables(self):
+        """Tables the set's queries may read, from its table selection."""
+        return frozenset(
+            table for table, used in (('employees', self.uses_employees), ('projects', self.uses_projects))
+            if used
+        )
+
+
+class Submission(models.Model):
+    """One graded attempt at an exercise, written in batches by SubmissionLog."""
+    
+    VERDICT_CHOICES = [
+        ('correct', 'Correct'),
+        ('incorrect', 'Incorrect'),
+        ('invalid', 'Rejected by validator'),
+        ('error', 'Execution error'),
+    ]
+    
+    exercise = models.CharField(max_length=100, help_text="Exercise key, e.g. primm1_modify or custom:3:make")
+    session_key = models.CharField(max_length=40)
+    query = models.TextField(help_text="Query as submitted")
+    fingerprint = models.TextField(blank=True, help_text="Query with its literals stripped, for grouping attempts")
+    verdict = models.CharField(max_length=20, choices=VERDICT_CHOICES)
+    latency_ms = models.FloatField()
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'submissions'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['exercise', 'session_key', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.exercise} ({self.verdict})"
+
+
+class SessionProgress(models.Model):
+    """Per-session state for one exercise, used to maintain ExerciseStats incrementally."""
+    
+    exercise = models.CharField(max_length=100)
+    session_key = models.CharField(max_length=40)
+    attempts = models.IntegerField(default=0)
+    first_attempt_at = models.DateTimeField()
+    solved_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'session_progress'
+        unique_together = [('exercise', 'session_key')]
+    
+    def __str__(self):
+        return f"{self.exercise} - {self.session_key}"
+
+
+class ExerciseStats(models.Model):
+    """Precomputed dashboard numbers for one exercise, updated as attempts are logged."""
+    
+    exercise = models.CharField(max_length=100, unique=True)
+    question_set = models.ForeignKey(CustomQuestionSet, on_delete=models.CASCADE, null=True, blank=True)
+    
+    attempts = models.IntegerField(default=0)
+    sessions = models.IntegerField(default=0, help_text="Sessions that attempted the exercise")
+    first_try_correct = models.IntegerField(default=0)
+    solved_sessions = models.IntegerField(default=0)
+    
+    # Counts of time-to-solve per bucket of analytics.SOLVE_TIME_BUCKETS
+    solve_time_histogram = models.JSONField(default=list)
+    # Space-Saving top-K sketch: {fingerprint: [count, overestimate]}
+    wrong_answers = models.JSONField(default=dict)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'exercise_stats'
+        ordering = ['exercise']
+    
+    def __str__(self):
+        return self.exercise
+
+
+class DatasetVersion(models.Model):
+    """Single-row counter bumped whenever the exercise dataset changes."""
+    
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'dataset_version'
+    
+    def __str__(self):
+        return f"Dataset v{self.version}"
+
+
+class Job(models.Model):
+    """A unit of background work run by website.jobs, with its status and result."""
+    
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+    
+    kind = models.CharField(max_length=50, help_text="Key of jobs.JOB_HANDLERS")
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(default=timezone.now)
+    run_after = models.DateTimeField(default=timezone.now, help_text="Not started before this time (retry backoff)")
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'jobs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
@@ -0,0 +1,335 @@
+"""
+Performance Feedback
+Shows students how their query performs: execution time, rows scanned versus
+rows returned and the query plan.
+
+A submission that asks for it ({"performance": true}, optionally with a
+"scale" from settings.PERFORMANCE_SCALES) on an exercise that offers it
+(Exercise.performance_feedback) gets a "performance" key next to its verdict.
+The query is not run again for it: the execution time and rows returned are
+those of the grading run (PerformanceProbe.record), and only the plan (EXPLAIN
+QUERY PLAN) is asked for, on a pool of PERFORMANCE_WORKERS threads while the
+submission is graded. Grading that does not fetch the student's rows on their
+own (query text comparison, in-database result comparison) reports the plan
+only. With a scale the query is timed on an in-memory copy of the dataset
+grown to that many employees (memory_dataset.scale_up); the first request for
+a scale builds the copy, which takes a few seconds for a million rows. A
+verdict waits at most PERFORMANCE_WAIT_MS for its measurement; a measurement
+still running then is dropped, its statement interrupted. A copy still being
+built is finished regardless, and the verdict says so, so asking again later
+gets a measurement.
+
+Rows scanned is estimated from the plan: every full scan of a table (SCAN,
+as opposed to an index SEARCH) counts the table's rows once.
+"""
+
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from . import dataset
+from .executor import MEMORY_ALIAS, QueryExecutor, scale_alias
+from .inflight import Superseded, SubmissionTicket, current_ticket
+from .memory_dataset import memory_dataset
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+DROPPED_MESSAGE = "❌ Measuring took too long and was stopped. Try again, or a smaller scale."
+BUILDING_MESSAGE = ("⏳ The {scale} dataset is still being built. "
+                    "Submit again in a few seconds to time your query on it.")
+
+# Row counts per alias, for the dataset version in _table_rows_version only
+_table_rows = {}
+_table_rows_version = None
+_table_rows_lock = threading.Lock()
+
+# Plan steps that read a whole table: 'SCAN employees', 'SCAN TABLE e' (older SQLite)
+SCAN_STEP = re.compile(r'^SCAN (?:TABLE )?"?(\w+)"?')
+
+# Table names and aliases after FROM/JOIN, to map plan steps to tables
+TABLE_REFERENCE = re.compile(r'\b(?:FROM|JOIN)\s+"?(\w+)"?(?:\s+(?:AS\s+)?"?(\w+)"?)?', re.IGNORECASE)
+
+# Words that can follow a table name without being its alias
+NOT_ALIASES = {
+    'where', 'join', 'inner', 'left', 'right', 'full', 'cross', 'natural', 'outer', 'on', 'using',
+    'group', 'order', 'limit', 'union', 'except', 'intersect', 'having', 'window',
+}
+
+
+def get_pool():
+    """Return the process-wide performance feedback thread pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=settings.PERFORMANCE_WORKERS,
+                    thread_name_prefix='performance'
+                )
+    return _pool
+
+
+class PerformanceProbe:
+    """Plans one submission next to its grading, or times it on a scaled dataset."""
+    
+    def __init__(self, query, scale, using, time_limit_ms, tables):
+        self.scale = scale
+        self.measured = {'elapsed_ms': None, 'rows_returned': None}
+        # Set once the scaled copy (if any) exists and the query can be timed on it
+        self.built = threading.Event()
+        if scale is None:
+            self.built.set()
+        # Never registered: stops the probe's statements when it is dropped
+        self.ticket = SubmissionTicket(None, None)
+        submission = current_ticket()
+        try:
+            if submission is not None:
+                # Superseding the submission also stops its probe
+                submission.attach(self.ticket.supersede)
+        except Superseded:
+            self.ticket.supersede()
+        self.future = get_pool().submit(self._run, query, using, time_limit_ms, tables)
+    
+    @staticmethod
+    def start(exercise, query, data):
+        """
+        Start measuring a submission, if it asks for it and the exercise offers it.
+        
+        Args:
+            exercise (Exercise): Compiled exercise
+            query (str): Student query, with table names already rewritten
+            data (dict): Request body
+        
+        Returns:
+            PerformanceProbe: Running probe, or None
+        """
+        if not exercise.performance_feedback or not data.get('performance'):
+            return None
+        
+        scale = data.get('scale') or None
+        if scale is None:
+            return PerformanceProbe(query, None, None, exercise.time_budget_ms, exercise.tables)
+        if scale not in settings.PERFORMANCE_SCALES:
+            return UnavailableProbe(scale, f"❌ Unknown scale. Choose one of {', '.join(settings.PERFORMANCE_SCALES)}.")
+        if QueryExecutor.default_alias() != MEMORY_ALIAS:
+            return UnavailableProbe(scale, "❌ Scaled datasets need the in-memory dataset (SQLite).")
+        return PerformanceProbe(
+            query, scale, scale_alias(settings.PERFORMANCE_SCALES[scale]),
+            settings.PERFORMANCE_TIME_LIMIT_MS, exercise.tables
+        )
+    
+    def record(self, elapsed_ms, rows_returned):
+        """
+        Report the timing of the grading run, shown when no scale was asked for.
+        
+        Args:
+            elapsed_ms (float): Time spent executing the query and fetching its rows, or None
+            rows_returned (int): Rows the query returned, or None if they were not all fetched
+        """
+        self.measured = {
+            'elapsed_ms': round(elapsed_ms, 2) if elapsed_ms is not None else None,
+            'rows_returned': rows_returned,
+        }
+    
+    def result(self):
+        """
+        Wait for the measurement, at most PERFORMANCE_WAIT_MS.
+        
+        Returns:
+            dict: scale, tables (row counts), elapsed_ms, rows_returned,
+                  rows_scanned and plan, or error
+        """
+        try:
+            measurement = self.future.result(timeout=settings.PERFORMANCE_WAIT_MS / 1000)
+        except TimeoutError:
+            self.drop()
+            if not self.built.is_set():
+                return {'scale': self.scale, 'error': BUILDING_MESSAGE.format(scale=self.scale)}
+            return {'scale': self.scale, 'error': DROPPED_MESSAGE}
+        if self.scale is None and 'error' not in measurement:
+            measurement = {**measurement, **self.measured}
+        return {'scale': self.scale, **measurement}
+    
+    def drop(self):
+        """Stop the measurement: dequeue it, or interrupt its statement."""
+        self.future.cancel()
+        self.ticket.supersede()
+    
+    def _run(self, query, using, time_limit_ms, tables):
+        # Pool threads outlive requests, so nothing else closes the connections
+        # a measurement opens ('default' for the dataset version, the exercise database)
+        close_old_connections()
+        try:
+            if self.scale is not None:
+                # Built even if the probe is dropped meanwhile, for the next request
+                memory_dataset.load_scaled(dataset.current_version(), settings.PERFORMANCE_SCALES[self.scale])
+                self.built.set()
+            with self.ticket.active():
+                if self.scale is None:
+                    return plan(query, using, time_limit_ms, tables)
+                return measure(query, using, time_limit_ms, tables)
+        finally:
+            close_old_connections()
+
+
+class UnavailableProbe:
+    """Stands in for a probe that cannot run, reporting why."""
+    
+    def __init__(self, scale, error):
+        self.scale = scale
+        self.error = error
+    
+    def record(self, elapsed_ms, rows_returned):
+        pass
+    
+    def result(self):
+        return {'scale': self.scale, 'error': self.error}
+
+
+def plan(query, using=None, time_limit_ms=None, tables=None):
+    """
+    Plan a query without running it.
+    
+    Args:
+        query (str): SQL SELECT query, already validated
+        using (str): Database alias, see QueryExecutor.get_cursor()
+        time_limit_ms (int): Optional limit after which planning is interrupted
+        tables (iterable): Tables the query may read
+    
+    Returns:
+        dict: tables, rows_scanned and plan, or error
+    """
+    return _measure(query, using, time_limit_ms, tables, timed=False)
+
+
+def measure(query, using=None, time_limit_ms=None, tables=None):
+    """
+    Plan and time a query, fetching (and discarding) all of its rows.
+    
+    Args:
+        query (str): SQL SELECT query, already validated
+        using (str): Database alias, see QueryExecutor.get_cursor()
+        time_limit_ms (int): Optional limit after which the query is interrupted
+        tables (iterable): Tables the query may read
+    
+    Returns:
+        dict: tables, elapsed_ms, rows_returned, rows_scanned and plan, or error
+    """
+    return _measure(query, using, time_limit_ms, tables, timed=True)
+
+
+def _measure(query, using, time_limit_ms, tables, timed):
+    alias = using or QueryExecutor.default_alias()
+    tables = sorted(settings.EXERCISE_TABLES if tables is None else tables)
+    is_sqlite = alias.startswith(MEMORY_ALIAS) or connections[alias].vendor == 'sqlite'
+    timing = {}
+    try:
+        query = QueryExecutor.single_statement(query)
+        with QueryExecutor.get_cursor(alias, time_limit_ms, snapshot=True, tables=tables) as cursor:
+            sizes = table_rows(cursor, alias, tables)
+            if is_sqlite:
+                cursor.execute(f"EXPLAIN QUERY PLAN {query}")
+                steps = plan_tree(cursor.fetchall())
+            else:
+                cursor.execute(f"EXPLAIN {query}")
+                steps = [{'detail': line, 'children': []} for (line,) in cursor.fetchall()]
+            
+            if timed:
+                started = time.perf_counter()
+                cursor.execute(query)
+                rows_returned = 0
+                while True:
+                    rows = cursor.fetchmany(settings.EXERCISE_FETCH_SIZE)
+                    if not rows:
+                        break
+                    rows_returned += len(rows)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                timing = {'elapsed_ms': round(elapsed_ms, 2), 'rows_returned': rows_returned}
+    except Exception as e:
+        return {'error': QueryExecutor.error_message(e)}
+    
+    return {
+        'tables': sizes,
+        **timing,
+        'rows_scanned': rows_scanned(steps, query, sizes) if is_sqlite else None,
+        'plan': steps,
+    }
+
+
+def table_rows(cursor, alias, tables):
+    """Return the row count of each table, counted once per alias and dataset version."""
+    global _table_rows, _table_rows_version
+    version = dataset.current_version()
+    with _table_rows_lock:
+        if _table_rows_version != version:
+            # Counts for older versions are not needed again
+            _table_rows, _table_rows_version = {}, version
+        counts = dict(_table_rows.get(alias, {}))
+    
+    missing = [table for table in tables if table not in counts]
+    for table in missing:
+        cursor.execute(f'SELECT count(*) FROM "{table}"')
+        counts[table] = cursor.fetchone()[0]
+    if missing:
+        with _table_rows_lock:
+            if _table_rows_version == version:
+                _table_rows.setdefault(alias, {}).update(counts)
+    return {table: counts[table] for table in tables}
+
+
+def plan_tree(rows):
+    """
+    Turn EXPLAIN QUERY PLAN rows into a tree.
+    
+    Args:
+        rows (list): (id, parent, notused, detail) tuples
+    
+    Returns:
+        list: Top-level steps, each a dict with detail and children
+    """
+    root = {'children': []}
+    steps = {0: root}
+    for step_id, parent, _, detail in rows:
+        step = steps[step_id] = {'detail': detail, 'children': []}
+        steps.get(parent, root)['children'].append(step)
+    return root['children']
+
+
+def rows_scanned(plan, query, sizes):
+    """
+    Estimate the rows a query reads: the size of every fully scanned table.
+    
+    Also records the estimate on each scanning step as 'rows'.
+    
+    Args:
+        plan (list): Tree from plan_tree()
+        query (str): The planned query, to resolve table aliases
+        sizes (dict): Row count of each table
+    
+    Returns:
+        int: Estimated rows scanned
+    """
+    aliases = {}
+    for table, alias in TABLE_REFERENCE.findall(query):
+        if table.lower() in sizes:
+            aliases[table.lower()] = table.lower()
+            if alias and alias.lower() not in NOT_ALIASES:
+                aliases[alias.lower()] = table.lower()
+    
+    total = 0
+    pending = list(plan)
+    while pending:
+        step = pending.pop()
+        pending.extend(step['children'])
+        match = SCAN_STEP.match(step['detail'])
+        table = aliases.get(match[1].lower()) if match else None
+        if table is not None:
+            step['rows'] = sizes[table]
+            total += sizes[table]
+    return total
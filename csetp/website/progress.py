@@ -0,0 +1,253 @@
+"""
+Query Progress
+Runs a submission on a worker thread and reports on it as server-sent events,
+so a student watching a slow query sees it advance and can stop it.
+
+A QueryRun executes the query on a pool of PROGRESS_WORKERS threads and hands
+the fetched rows to the request thread in EXERCISE_FETCH_SIZE batches, at most
+PROGRESS_QUEUE_BATCHES ahead of what has been sent. QueryRun.events() turns
+that into a 'progress' item (rows fetched so far, elapsed time) every
+PROGRESS_INTERVAL_MS and a 'rows' item per batch; the view adds the verdict.
+
+cancel() interrupts the statement that is running (sqlite3
+Connection.interrupt(), a cancel request on PostgreSQL), so the worker is
+free again at once instead of when the time limit runs out. The cancel
+endpoint calls it for the session that started the run, and a client that
+closes the stream early cancels its run the same way.
+
+Under ASGI the response body must be an async iterator, or Django collects
+the whole stream before sending it; event_stream_response() takes care of it.
+"""
+
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.http import StreamingHttpResponse
+
+from .executor import QueryExecutor
+from .query_log import query_log
+from .streaming import ENCODER
+
+
+CANCELLED_MESSAGE = "⏹ Query stopped."
+
+# Seconds a blocked worker waits before checking whether its run was cancelled
+POLL_SECONDS = 0.1
+
+_pool = None
+_pool_lock = threading.Lock()
+
+_runs = {}
+_runs_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide progress thread pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=settings.PROGRESS_WORKERS,
+                    thread_name_prefix='progress'
+                )
+    return _pool
+
+
+def format_event(event, data):
+    """
+    Encode one server-sent event.
+    
+    Args:
+        event (str): Event name
+        data: JSON-serializable payload
+    
+    Returns:
+        str: The event, terminated by a blank line
+    """
+    return f"event: {event}\ndata: {ENCODER.encode(data)}\n\n"
+
+
+async def _aiter(iterator):
+    # Each step blocks while waiting for rows, so it runs on a thread of its own
+    # rather than the thread shared by all sync code (thread_sensitive=True)
+    step = sync_to_async(next, thread_sensitive=False)
+    done = object()
+    try:
+        while True:
+            item = await step(iterator, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        await sync_to_async(iterator.close, thread_sensitive=False)()
+
+
+def event_stream_response(request, events):
+    """
+    Build a text/event-stream response that sends each event as it is produced.
+    
+    Args:
+        request: Django request object (ASGI or WSGI)
+        events (generator): Encoded events, see format_event()
+    
+    Returns:
+        StreamingHttpResponse
+    """
+    content = _aiter(events) if isinstance(request, ASGIRequest) else events
+    response = StreamingHttpResponse(content, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies (nginx) from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class QueryRun:
+    """One submission executing on the progress pool."""
+    
+    def __init__(self, session_key, query, using=None, time_limit_ms=None, exercise=None, tables=None):
+        self.id = uuid.uuid4().hex
+        self.session_key = session_key
+        self.query = query
+        self.using = using
+        self.time_limit_ms = time_limit_ms
+        self.exercise = exercise
+        self.tables = tables
+        self.columns = None
+        self.rows_fetched = 0
+        # Time from the start of the execution until the last row, once finished
+        self.elapsed_ms = None
+        self.error = None
+        self.cancelled = threading.Event()
+        self._batches = queue.Queue(maxsize=settings.PROGRESS_QUEUE_BATCHES)
+        self._cursor = None
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+    
+    @staticmethod
+    def find(run_id, session_key):
+        """
+        Return an active run started by a session.
+        
+        Args:
+            run_id (str): QueryRun.id
+            session_key (str): Session the caller belongs to
+        
+        Returns:
+            QueryRun|None: None if there is no such run or it belongs to another session
+        """
+        with _runs_lock:
+            run = _runs.get(run_id)
+        if run is None or run.session_key != session_key:
+            return None
+        return run
+    
+    def start(self):
+        """Register the run and queue it on the progress pool."""
+        with _runs_lock:
+            _runs[self.id] = self
+        get_pool().submit(self._execute)
+        return self
+    
+    def cancel(self):
+        """Stop the run, interrupting its statement if one is executing."""
+        with self._lock:
+            self.cancelled.set()
+            if self._cursor is not None:
+                QueryExecutor.interrupt(self._cursor)
+    
+    def close(self):
+        """Cancel the run if it is still going and forget it."""
+        self.cancel()
+        with _runs_lock:
+            _runs.pop(self.id, None)
+    
+    def progress(self):
+        return {
+            'rows': self.rows_fetched,
+            'elapsed_ms': round((time.perf_counter() - self._started) * 1000),
+        }
+    
+    def events(self):
+        """
+        Wait for the run to finish, reporting on it along the way.
+        
+        Yields:
+            tuple: ('progress', dict) every PROGRESS_INTERVAL_MS and
+                   ('rows', list of row tuples) for each fetched batch; the
+                   columns are in self.columns. Afterwards self.error or
+                   self.cancelled tells how the run ended.
+        """
+        interval = settings.PROGRESS_INTERVAL_MS / 1000
+        next_progress = time.monotonic() + interval
+        while not self.cancelled.is_set():
+            timeout = next_progress - time.monotonic()
+            if timeout <= 0:
+                yield 'progress', self.progress()
+                next_progress = time.monotonic() + interval
+                continue
+            try:
+                batch = self._batches.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            if batch is None:
+                yield 'progress', self.progress()
+                return
+            yield 'rows', batch
+    
+    def _put(self, item):
+        # Blocks while the reader is behind, unless the run is cancelled
+        while not self.cancelled.is_set():
+            try:
+                self._batches.put(item, timeout=POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    def _execute(self):
+        # Pool threads outlive requests, so nothing else closes the connections
+        # their runs open (the exercise database, 'default' for the dataset version)
+        close_old_connections()
+        started = time.perf_counter()
+        try:
+            statement = QueryExecutor.single_statement(self.query)
+            with QueryExecutor.get_cursor(self.using, self.time_limit_ms, tables=self.tables) as cursor:
+                with self._lock:
+                    if self.cancelled.is_set():
+                        return
+                    self._cursor = cursor
+                try:
+                    cursor.execute(statement)
+                    self.columns = [col[0] for col in cursor.description]
+                    while not self.cancelled.is_set():
+                        rows = cursor.fetchmany(settings.EXERCISE_FETCH_SIZE)
+                        if not rows:
+                            break
+                        self.rows_fetched += len(rows)
+                        if not self._put(rows):
+                            break
+                finally:
+                    with self._lock:
+                        self._cursor = None
+        
+        except Exception as e:
+            if self.cancelled.is_set():
+                self.error = CANCELLED_MESSAGE
+            else:
+                self.error = QueryExecutor.error_message(e)
+        
+        finally:
+            close_old_connections()
+            if self.cancelled.is_set() and self.error is None:
+                self.error = CANCELLED_MESSAGE
+            self.elapsed_ms = (time.perf_counter() - started) * 1000
+            query_log.record(self.query, self.exercise, self.elapsed_ms, self.rows_fetched, self.error)
+            self._put(None)
@@ -1,6 +1,15 @@
 """
 Query Configurations
 Centralizes expected results, table mappings, and hint keywords for all exercises.
+
+Each entry is compiled once into an Exercise by website.exercises. 'grading'
+selects how submissions are checked ('rows', 'scalar' or 'query') and
+'show_result' whether the student's result is sent back. 'expected_sql' is the
+SQL equivalent of 'get_expected_result', run on the perturbed dataset copies
+that catch hard-coded answers ('cross_check_copies', default
+settings.CROSS_CHECK_COPIES; 0 disables), and lets 'rows' exercises that hide
+the result be compared inside the database ('comparison', default
+settings.RESULT_COMPARISON).
 """
 
 from django.db.models import Sum, F
@@ -22,15 +31,20 @@ QUERY_CONFIGS = {
     # PRIMM 1 - Basic SELECT Queries
     # ========================================================================
     'primm1_modify': {
+        'grading': 'rows',
+        'show_result': True,
         'table_mapping': EMPLOYEE_TABLE_MAPPING,
         'get_expected_result': lambda: list(
             Employee.objects.filter(department="IT")
             .values("first_name", "last_name", "email")
         ),
+        'expected_sql': "SELECT first_name, last_name, email FROM employees WHERE department = 'IT'",
         'rename_fields': None
     },
     
     'primm1_make': {
+        'grading': 'query',
+        'show_result': False,
         'table_mapping': EMPLOYEE_TABLE_MAPPING,
         'expected_query': 'select * from employees where salary < 80000;',
         'hint_keywords': {  
@@ -46,17 +60,23 @@ QUERY_CONFIGS = {
     # PRIMM 2 - Aggregate Functions
     # ========================================================================
     'primm2_modify': {
+        'grading': 'scalar',
+        'show_result': True,
         'table_mapping': EMPLOYEE_TABLE_MAPPING,
         'get_expected_result': lambda: Employee.objects.filter(
             job_title="Data Scientist"
-        ).count()
+        ).count(),
+        'expected_sql': "SELECT COUNT(*) FROM employees WHERE job_title = 'Data Scientist'"
     },
     
     'primm2_make': {
+        'grading': 'scalar',
+        'show_result': False,
         'table_mapping': EMPLOYEE_TABLE_MAPPING,
         'get_expected_result': lambda: Employee.objects.filter(
             department="Marketing"
         ).aggregate(Sum("salary"))["salary__sum"],
+        'expected_sql': "SELECT SUM(salary) FROM employees WHERE department = 'Marketing'",
         'hint_keywords': {
             'sum': "You need to use the SUM() aggregate function to calculate total salaries.",
             'salary': "Are you summing the correct column?",
@@ -69,6 +89,8 @@ QUERY_CONFIGS = {
     # PRIMM 3 - JOIN Queries
     # ========================================================================
     'primm3_modify': {
+        'grading': 'rows',
+        'show_result': True,
         'table_mapping': PROJECT_TABLE_MAPPING,
         'get_expected_result': lambda: list(
             Project.objects.filter(start_date__gt="2023-01-01")
@@ -78,15 +100,28 @@ QUERY_CONFIGS = {
                 expected_project_name=F("project_name")
             )
         ),
+        'expected_sql': (
+            "SELECT employees.first_name, employees.last_name, "
+            "projects.project_name AS expected_project_name "
+            "FROM projects INNER JOIN employees ON employees.id = projects.employee_id "
+            "WHERE projects.start_date > '2023-01-01'"
+        ),
         'rename_fields': {'expected_project_name': 'project_name'}
     },
     
     'primm3_make': {
+        'grading': 'rows',
+        'show_result': True,
         'table_mapping': PROJECT_TABLE_MAPPING,
         'get_expected_result': lambda: list(
             Employee.objects.filter(project__isnull=True)
             .values("first_name", "last_name")
         ),
+        'expected_sql': (
+            "SELECT employees.first_name, employees.last_name FROM employees "
+            "LEFT JOIN projects ON employees.id = projects.employee_id "
+            "WHERE projects.employee_id IS NULL"
+        ),
         'rename_fields': None,
         'hint_keywords': {
             'LEFT JOIN': "You need a LEFT JOIN to include employees without projects. INNER JOIN will exclude them.",
@@ -0,0 +1,182 @@
+"""
+Query Log
+Per-worker statistics of every query QueryExecutor runs, grouped by fingerprint.
+
+Each execution is reduced to its QueryNormalizer.fingerprint (literals stripped,
+whitespace and case folded) and folded into a stats entry holding count,
+latency, rows and errors per exercise. Executions slower than
+QUERY_LOG_SLOW_MS, and those that fail, are also kept in a ring buffer of the
+most recent QUERY_LOG_RING_SIZE slow queries.
+
+Both structures are bounded: at most QUERY_LOG_MAX_FINGERPRINTS fingerprints
+are tracked, evicting the least recently seen. Stats are held in memory and
+describe the worker that serves the request.
+"""
+
+import threading
+from collections import Counter, OrderedDict, deque
+
+from django.conf import settings
+from django.utils import timezone
+
+from .validators import QueryNormalizer
+
+
+# Orderings accepted by QueryLog.top
+TOP_ORDERINGS = ('total_ms', 'max_ms', 'mean_ms', 'count', 'error_rate', 'max_rows')
+
+
+class QueryStats:
+    """Aggregated executions of one query fingerprint."""
+    
+    __slots__ = ('fingerprint', 'example', 'count', 'errors', 'total_ms', 'max_ms', 'max_rows',
+                 'exercises', 'last_seen')
+    
+    def __init__(self, fingerprint, example):
+        self.fingerprint = fingerprint
+        self.example = example
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.max_rows = 0
+        self.exercises = Counter()
+        self.last_seen = None
+    
+    def as_dict(self):
+        return {
+            'fingerprint': self.fingerprint,
+            'example': self.example,
+            'count': self.count,
+            'total_ms': round(self.total_ms, 2),
+            'mean_ms': round(self.total_ms / self.count, 2) if self.count else 0.0,
+            'max_ms': round(self.max_ms, 2),
+            'max_rows': self.max_rows,
+            'error_rate': self.errors / self.count if self.count else 0.0,
+            'exercises': dict(self.exercises.most_common()),
+            'last_seen': self.last_seen,
+        }
+
+
+class QueryLog:
+    """Bounded fingerprint stats plus a ring buffer of recent slow queries."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = OrderedDict()
+        self._slow = deque(maxlen=settings.QUERY_LOG_RING_SIZE)
+        self._superseded = Counter()
+        self.started_at = timezone.now()
+    
+    def record(self, query, exercise, elapsed_ms, rows=None, error=None):
+        """
+        Fold one execution into the stats.
+        
+        Args:
+            query (str): Executed SQL text
+            exercise (str): Key of the exercise the query ran for, or None
+            elapsed_ms (float): Time spent executing and fetching
+            rows (int): Rows fetched, if known
+            error (str): Error message if the query failed
+        """
+        if not settings.QUERY_LOG_ENABLED:
+            return
+        
+        fingerprint = QueryNormalizer.fingerprint(query)
+        now = timezone.now()
+        
+        with self._lock:
+            stats = self._stats.get(fingerprint)
+            if stats is None:
+                stats = self._stats[fingerprint] = QueryStats(fingerprint, QueryNormalizer.normalize(query))
+                if len(self._stats) > settings.QUERY_LOG_MAX_FINGERPRINTS:
+                    self._stats.popitem(last=False)
+            else:
+                self._stats.move_to_end(fingerprint)
+            
+            stats.count += 1
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            stats.max_rows = max(stats.max_rows, rows or 0)
+            stats.exercises[exercise or '-'] += 1
+            stats.last_seen = now
+            if error is not None:
+                stats.errors += 1
+            
+            if error is not None or elapsed_ms >= settings.QUERY_LOG_SLOW_MS:
+                self._slow.append({
+                    'at': now,
+                    'fingerprint': fingerprint,
+                    'query': QueryNormalizer.normalize(query),
+                    'exercise': exercise,
+                    'elapsed_ms': round(elapsed_ms, 2),
+                    'rows': rows,
+                    'error': error,
+                })
+    
+    def record_superseded(self, exercise):
+        """Count a submission stopped because a newer one for the same exercise arrived."""
+        with self._lock:
+            self._superseded[exercise] += 1
+    
+    def superseded(self):
+        """Return the superseded submission count, in total and per exercise."""
+        with self._lock:
+            return {
+                'total': sum(self._superseded.values()),
+                'exercises': dict(self._superseded.most_common()),
+            }
+    
+    def top(self, order_by='total_ms', limit=20):
+        """
+        Return the worst fingerprints.
+        
+        Args:
+            order_by (str): One of TOP_ORDERINGS
+            limit (int): Maximum number of entries
+        
+        Returns:
+            list: QueryStats.as_dict() entries, worst first
+        """
+        if order_by not in TOP_ORDERINGS:
+            raise ValueError(f"order_by must be one of {', '.join(TOP_ORDERINGS)}")
+        with self._lock:
+            entries = [stats.as_dict() for stats in self._stats.values()]
+        entries.sort(key=lambda entry: entry[order_by], reverse=True)
+        return entries[:limit]
+    
+    def slow_queries(self):
+        """Return the recent slow or failed executions, newest first."""
+        with self._lock:
+            return list(reversed(self._slow))
+    
+    def reset(self):
+        """Forget all stats and slow queries."""
+        with self._lock:
+            self._stats.clear()
+            self._slow.clear()
+            self._superseded.clear()
+            self.started_at = timezone.now()
+    
+    def export(self, order_by='total_ms', limit=20):
+        """
+        Build the JSON export of the log.
+        
+        Returns:
+            dict: Collection start, thresholds, top fingerprints, slow queries
+                  and superseded submission counts
+        """
+        with self._lock:
+            since, fingerprints = self.started_at, len(self._stats)
+        return {
+            'since': since,
+            'slow_ms': settings.QUERY_LOG_SLOW_MS,
+            'fingerprints': fingerprints,
+            'order_by': order_by,
+            'top': self.top(order_by, limit),
+            'slow_queries': self.slow_queries(),
+            'superseded': self.superseded(),
+        }
+
+
+query_log = QueryLog()
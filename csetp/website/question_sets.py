@@ -0,0 +1,333 @@
+"""
+Question Set Import/Export
+Moves custom question sets between instances as JSONL or ZIP files.
+
+An export is one JSON object per question set with the fields in EXPORT_FIELDS,
+either as JSON Lines or as a ZIP archive with one pretty-printed JSON file per
+set (easier to edit by hand). An import accepts either form: every record is
+checked with the model's field validation, then its predict, modify and make
+queries are validated and test-executed in a thread pool, each with its own
+time budget, and the sets that pass are inserted with a single bulk_create.
+Bad sets are reported with the file and line they came from instead of
+aborting the whole import.
+"""
+
+import io
+import json
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections, transaction
+from django.utils.text import slugify
+
+from .executor import QueryExecutor
+from .models import CustomQuestionSet
+from .validators import SQLValidator
+
+
+# Fields written to and read from an export, in this order
+EXPORT_FIELDS = [
+    'name',
+    'uses_employees', 'uses_projects',
+    'performance_feedback',
+    'predict_query',
+    'predict_option1', 'predict_option2', 'predict_option3', 'predict_option4',
+    'predict_correct_answer',
+    'investigate_q1', 'investigate_a1',
+    'investigate_q2', 'investigate_a2',
+    'investigate_q3', 'investigate_a3',
+    'modify_task', 'modify_initial_query', 'modify_correct_query',
+    'make_task', 'make_correct_query',
+]
+
+# Free text the add_question_set form lets teachers leave empty
+OPTIONAL_FIELDS = [
+    'investigate_q1', 'investigate_a1',
+    'investigate_q2', 'investigate_a2',
+    'investigate_q3', 'investigate_a3',
+    'modify_task', 'modify_initial_query', 'make_task',
+]
+
+# Queries that must run for a set to be imported
+CHECKED_QUERIES = ['predict_query', 'modify_correct_query', 'make_correct_query']
+
+# Name of the JSON Lines file and of the directory in a ZIP export
+EXPORT_NAME = 'question_sets'
+
+
+def export_records(queryset=None):
+    """
+    Yield question sets as plain dicts of EXPORT_FIELDS.
+    
+    Args:
+        queryset: Optional CustomQuestionSet queryset, defaults to all sets
+    
+    Yields:
+        dict: One question set
+    """
+    if queryset is None:
+        queryset = CustomQuestionSet.objects.all()
+    yield from queryset.order_by('pk').values('pk', *EXPORT_FIELDS).iterator()
+
+
+def iter_jsonl(queryset=None):
+    """Yield an export as JSON Lines, one line per question set."""
+    for record in export_records(queryset):
+        record.pop('pk')
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def write_zip(file, queryset=None):
+    """
+    Write an export as a ZIP archive with one JSON file per question set.
+    
+    Args:
+        file: Binary file object to write to
+        queryset: Optional CustomQuestionSet queryset, defaults to all sets
+    """
+    with zipfile.ZipFile(file, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for record in export_records(queryset):
+            pk = record.pop('pk')
+            name = f"{EXPORT_NAME}/{pk:05d}-{slugify(record['name'])[:50] or 'set'}.json"
+            archive.writestr(name, json.dumps(record, ensure_ascii=False, indent=2))
+
+
+@dataclass
+class ImportEntry:
+    """One record of an import and what was found wrong with it."""
+    
+    source: str  # '<file>:<line>' the record came from
+    record: dict = None
+    errors: list = field(default_factory=list)
+    instance: CustomQuestionSet = None
+    
+    @property
+    def name(self):
+        if isinstance(self.record, dict):
+            return self.record.get('name')
+        return None
+
+
+@dataclass
+class ImportReport:
+    """Outcome of an import."""
+    
+    entries: list
+    created: list = field(default_factory=list)
+    dry_run: bool = False
+    elapsed_ms: float = 0.0
+    
+    @property
+    def invalid(self):
+        return [entry for entry in self.entries if entry.errors]
+    
+    def as_dict(self):
+        """
+        Return the report in the form sent by the import endpoint.
+        
+        Returns:
+            dict: 'total', 'valid', 'created', 'dry_run', 'elapsed_ms', and
+                  'invalid' entries with their source, name and errors
+        """
+        invalid = self.invalid
+        return {
+            'total': len(self.entries),
+            'valid': len(self.entries) - len(invalid),
+            'created': [{'id': instance.pk, 'name': instance.name} for instance in self.created],
+            'dry_run': self.dry_run,
+            'elapsed_ms': round(self.elapsed_ms, 1),
+            'invalid': [
+                {'source': entry.source, 'name': entry.name, 'errors': entry.errors}
+                for entry in invalid
+            ],
+        }
+
+
+def read_entries(data, filename='upload'):
+    """
+    Parse an uploaded export into import entries.
+    
+    Args:
+        data (bytes): Contents of a JSONL file or of a ZIP archive of .json/.jsonl files
+        filename (str): Name used in error sources
+    
+    Returns:
+        list: ImportEntry objects, with parse errors already recorded
+    
+    Raises:
+        ValueError: If the data is neither a ZIP archive nor UTF-8 text
+    """
+    if zipfile.is_zipfile(io.BytesIO(data)):
+        entries = []
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for member in sorted(archive.namelist()):
+                if member.endswith('.jsonl'):
+                    entries.extend(_read_jsonl(archive.read(member), member))
+                elif member.endswith('.json'):
+                    entries.append(_read_json(archive.read(member), member))
+        return entries
+    return _read_jsonl(data, filename)
+
+
+def _decode(data, source):
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ValueError(f"{source} is neither a ZIP archive nor UTF-8 text")
+
+
+def _read_json(data, source):
+    try:
+        return ImportEntry(source, record=json.loads(_decode(data, source)))
+    except (ValueError, json.JSONDecodeError) as e:
+        return ImportEntry(source, errors=[f"Invalid JSON: {e}"])
+
+
+def _read_jsonl(data, source):
+    entries = []
+    for number, line in enumerate(_decode(data, source).splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            entries.append(ImportEntry(f"{source}:{number}", record=json.loads(line)))
+        except json.JSONDecodeError as e:
+            entries.append(ImportEntry(f"{source}:{number}", errors=[f"Invalid JSON: {e}"]))
+    return entries
+
+
+def check_query(query, budget_ms=None, label='question set import', tables=None):
+    """
+    Validate a question set query and run it to completion within a budget.
+    
+    Args:
+        query (str): Predict, modify or make correct query
+        budget_ms (int): Time limit, defaults to QUESTION_SET_IMPORT_BUDGET_MS
+        label (str): Name the execution is recorded under in the query log
+        tables (iterable): Tables the query may read, defaults to settings.EXERCISE_TABLES
+    
+    Returns:
+        str: Error message, or None if the query is fine
+    """
+    is_valid, error_message = SQLValidator(query).validate()
+    if not is_valid:
+        return error_message
+    
+    budget_ms = budget_ms or settings.QUESTION_SET_IMPORT_BUDGET_MS
+    success, result = QueryExecutor.stream_query(query, time_limit_ms=budget_ms, exercise=label, tables=tables)
+    if not success:
+        return result
+    
+    _, rows = result
+    try:
+        for _ in rows:
+            pass
+    except Exception as e:
+        return QueryExecutor.error_message(e)
+    finally:
+        rows.close()
+    return None
+
+
+def _check_query_in_pool(query, budget_ms, tables):
+    """Run check_query on an import pool thread, then close the thread's connections."""
+    try:
+        return check_query(query, budget_ms, tables=tables)
+    finally:
+        # The pool's threads end with the import; their connections (to
+        # 'default' for dataset.current_version, and the exercise database)
+        # would otherwise stay open until garbage collected
+        connections.close_all()
+
+
+def check_question_set(question_set, budget_ms=None):
+    """
+    Check every query of a saved question set, one after the other.
+    
+    Returns:
+        list: '<field>: <error>' messages, empty if all queries run
+    """
+    errors = []
+    for name in CHECKED_QUERIES:
+        error = check_query(
+            getattr(question_set, name), budget_ms, f"custom:{question_set.pk}:check", question_set.tables
+        )
+        if error:
+            errors.append(f"{name}: {error}")
+    return errors
+
+
+class QuestionSetImporter:
+    """Validates import entries in parallel and bulk-creates the valid ones."""
+    
+    def __init__(self, budget_ms=None, workers=None):
+        self.budget_ms = budget_ms or settings.QUESTION_SET_IMPORT_BUDGET_MS
+        self.workers = workers or settings.QUESTION_SET_IMPORT_WORKERS
+    
+    def run(self, entries, user=None, dry_run=False):
+        """
+        Validate entries and create a question set for each valid one.
+        
+        Args:
+            entries (list): ImportEntry objects from read_entries
+            user: Optional user recorded as the sets' creator
+            dry_run (bool): Only validate, create nothing
+        
+        Returns:
+            ImportReport: Valid and invalid entries, and the created sets
+        """
+        started = time.perf_counter()
+        for entry in entries:
+            if not entry.errors:
+                self._build(entry, user)
+        self._check_queries([entry for entry in entries if not entry.errors])
+        
+        report = ImportReport(entries, dry_run=dry_run)
+        valid = [entry.instance for entry in entries if not entry.errors]
+        if valid and not dry_run:
+            with transaction.atomic():
+                report.created = CustomQuestionSet.objects.bulk_create(valid)
+        report.elapsed_ms = (time.perf_counter() - started) * 1000
+        return report
+    
+    def _build(self, entry, user):
+        """Build the unsaved model instance and run the model's field validation."""
+        record = entry.record
+        if not isinstance(record, dict):
+            entry.errors.append("Expected a JSON object")
+            return
+        
+        unknown = sorted(set(record) - set(EXPORT_FIELDS))
+        if unknown:
+            entry.errors.append(f"Unknown field(s): {', '.join(unknown)}")
+        
+        instance = CustomQuestionSet(created_by=user, **{
+            name: record[name] for name in EXPORT_FIELDS if name in record
+        })
+        try:
+            instance.full_clean(exclude=['created_by', *OPTIONAL_FIELDS])
+        except ValidationError as e:
+            entry.errors.extend(
+                f"{name}: {message}"
+                for name, messages in e.message_dict.items()
+                for message in messages
+            )
+        entry.instance = instance
+    
+    def _check_queries(self, entries):
+        """Test-execute every checked query of every entry on the thread pool."""
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='question-set-import') as pool:
+            checks = [
+                (entry, name, pool.submit(
+                    _check_query_in_pool, getattr(entry.instance, name), self.budget_ms, entry.instance.tables
+                ))
+                for entry in entries
+                for name in CHECKED_QUERIES
+            ]
+            for entry, name, future in checks:
+                error = future.result()
+                if error:
+                    entry.errors.append(f"{name}: {error}")
@@ -0,0 +1,207 @@
+"""
+Request Profiler
+Records where the grading views spend their time, using cProfile.
+
+With PROFILE_ENABLED a PROFILE_SAMPLE_RATE fraction of grading requests runs
+under cProfile; so does any request whose X-Profile header carries a token
+from `python manage.py profile_report --token` (signed with SECRET_KEY, valid
+for PROFILE_TOKEN_MAX_AGE seconds), which lets a single slow request be
+profiled in production without turning sampling on.
+
+Each profile covers the view and, for streamed results, the sending of the
+body, and is written to PROFILE_DIR as
+<time>-<exercise>-<latency>ms.prof, keeping the newest PROFILE_KEEP files.
+`python manage.py profile_report` adds them up into a top-functions report;
+single files open with pstats or snakeviz.
+
+cProfile hooks the thread it runs in, so only one request is profiled at a
+time (others are skipped) and work done on other threads (cross-checks,
+the progress pool) is not included.
+"""
+
+import cProfile
+import functools
+import logging
+import random
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+TOKEN_SALT = 'website.request_profiler'
+
+# Profile files are named <time>-<exercise>-<latency>ms.prof
+FILENAME_PATTERN = re.compile(r'^(?P<time>\d{8}-\d{6}\.\d{3})-(?P<exercise>.+)-(?P<latency>\d+)ms\.prof$')
+
+_profiling_lock = threading.Lock()
+
+
+def make_token():
+    """Return a value for the X-Profile header that profiles one request."""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign('profile')
+
+
+def _has_token(request):
+    token = request.headers.get(PROFILE_HEADER)
+    if not token:
+        return False
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=settings.PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def _wanted(request):
+    if _has_token(request):
+        return True
+    return settings.PROFILE_ENABLED and random.random() < settings.PROFILE_SAMPLE_RATE
+
+
+def exercise_slug(exercise):
+    """Make an exercise key safe for a file name ('custom:3:make' -> 'custom_3_make')."""
+    return re.sub(r'[^\w.]+', '_', exercise).strip('_') or 'unknown'
+
+
+def profiled(view):
+    """
+    Decorate a grading function taking (request, exercise) to profile the
+    requests selected by the module docstring's rules.
+    """
+    @functools.wraps(view)
+    def wrapper(request, exercise, *args, **kwargs):
+        if not _wanted(request) or not _profiling_lock.acquire(blocking=False):
+            return view(request, exercise, *args, **kwargs)
+        
+        run = ProfiledRequest(exercise.key)
+        try:
+            response = run.call(view, request, exercise, *args, **kwargs)
+        except BaseException:
+            run.finish()
+            raise
+        
+        if response.streaming and not response.is_async:
+            # The rows are fetched and compared while the body is sent
+            response.streaming_content = run.stream(response.streaming_content)
+        else:
+            run.finish()
+        return response
+    return wrapper
+
+
+class ProfiledRequest:
+    """One request running under cProfile; releases the profiling lock when finished."""
+    
+    def __init__(self, exercise):
+        self.exercise = exercise
+        self.profile = cProfile.Profile()
+        self.started = time.perf_counter()
+        self.finished = False
+    
+    def call(self, func, *args, **kwargs):
+        return self.profile.runcall(func, *args, **kwargs)
+    
+    def stream(self, chunks):
+        """Wrap a streamed body so it is profiled while it is sent."""
+        return ProfiledStream(self, chunks)
+    
+    def finish(self):
+        """Write the profile and rotate the directory, once."""
+        if self.finished:
+            return
+        self.finished = True
+        try:
+            latency_ms = (time.perf_counter() - self.started) * 1000
+            write_profile(self.profile, self.exercise, latency_ms)
+        except Exception:
+            logger.exception("Could not write the profile of a %s request", self.exercise)
+        finally:
+            _profiling_lock.release()
+
+
+class ProfiledStream:
+    """
+    Streamed response body that runs under a request's profile.
+    
+    Django calls close() when the response finishes, even if the body was never
+    iterated, so the profile is always written and the lock released.
+    """
+    
+    def __init__(self, run, chunks):
+        self.run = run
+        self.chunks = chunks
+    
+    def __iter__(self):
+        iterator = iter(self.chunks)
+        while True:
+            # Enabled per chunk, as the body may be sent from another thread
+            self.run.profile.enable()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.run.profile.disable()
+            yield chunk
+    
+    def close(self):
+        try:
+            if hasattr(self.chunks, 'close'):
+                self.chunks.close()
+        finally:
+            self.run.finish()
+
+
+def write_profile(profile, exercise, latency_ms):
+    """
+    Dump a profile into PROFILE_DIR, then delete all but the newest PROFILE_KEEP.
+    
+    Args:
+        profile (cProfile.Profile): Finished profile
+        exercise (str): Exercise key of the request
+        latency_ms (float): Time the request took
+    
+    Returns:
+        Path: The written file
+    """
+    directory = settings.PROFILE_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    now = time.time()
+    stamp = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}.{int(now * 1000) % 1000:03d}"
+    path = directory / f"{stamp}-{exercise_slug(exercise)}-{round(latency_ms)}ms.prof"
+    profile.dump_stats(str(path))
+    
+    profiles = sorted(directory.glob('*.prof'), key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in profiles[settings.PROFILE_KEEP:]:
+        old.unlink(missing_ok=True)
+    return path
+
+
+def list_profiles(exercise=None):
+    """
+    Return the profiles in PROFILE_DIR, oldest first.
+    
+    Args:
+        exercise (str): Only profiles of this exercise key
+    
+    Returns:
+        list: (path, exercise slug, latency_ms) tuples
+    """
+    directory = settings.PROFILE_DIR
+    if not directory.exists():
+        return []
+    
+    wanted = exercise_slug(exercise) if exercise else None
+    profiles = []
+    for path in sorted(directory.glob('*.prof')):
+        match = FILENAME_PATTERN.match(path.name)
+        if match is None or (wanted and match['exercise'] != wanted):
+            continue
+        profiles.append((path, match['exercise'], int(match['latency'])))
+    return profiles
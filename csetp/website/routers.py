@@ -0,0 +1,45 @@
+"""
+Database Router
+Sends reads of the exercise dataset to the read-only exercise connection.
+"""
+
+from django.conf import settings
+
+
+class ExerciseRouter:
+    """Routes exercise dataset reads to the read-only alias, everything else to 'default'."""
+
+    # Models whose tables make up the dataset students query
+    EXERCISE_MODELS = {'employee', 'project'}
+
+    def _is_exercise_model(self, model):
+        return (
+            model._meta.app_label == 'website'
+            and model._meta.model_name in self.EXERCISE_MODELS
+        )
+
+    def db_for_read(self, model, **hints):
+        if self._is_exercise_model(model):
+            return settings.EXERCISE_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        # The exercise alias is opened with mode=ro, so all writes go to 'default'
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases point at the same data, e.g. an Employee read through
+        # the exercise alias can be assigned to a Project saved on 'default'.
+        aliases = {'default', settings.EXERCISE_DB_ALIAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db != settings.EXERCISE_DB_ALIAS:
+            return True
+        # A SQLite exercise alias is the default file opened read-only; a
+        # separate server (PostgreSQL) only needs the dataset tables.
+        if settings.DATABASES[db]['ENGINE'] == 'django.db.backends.sqlite3':
+            return False
+        return app_label == 'website' and model_name in self.EXERCISE_MODELS
@@ -0,0 +1,273 @@
+"""
+Session Sandboxes
+Gives every student session a private in-memory copy of the dataset to
+experiment with indexes on.
+
+The shared dataset stays read-only. A sandbox is cloned on first use from the
+worker's shared in-memory copy of the dataset (memory_dataset.py), at the real
+size or one of settings.PERFORMANCE_SCALES.
+Besides SELECT queries it accepts CREATE INDEX, DROP INDEX, ANALYZE and
+REINDEX (SandboxValidator), so a student can time a query, add an index and
+see the plan and the time change. The rows of the dataset cannot be changed.
+
+Sandboxes live in the worker process. When together they take more than
+settings.SANDBOX_MEMORY_BYTES, the least recently used ones are dropped; the
+next request of that session starts over from a fresh copy.
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.backends.sqlite3._functions import register as register_functions
+
+from . import dataset
+from .executor import QueryExecutor
+from .memory_dataset import DETECT_TYPES, memory_dataset
+from .performance import plan_tree, rows_scanned
+from .query_log import query_log
+
+
+# Exercise key sandbox statements are recorded under in the query log
+SANDBOX_EXERCISE = 'sandbox'
+
+# Authorizer actions of index statements, allowed on the dataset tables
+INDEX_ACTIONS = frozenset({sqlite3.SQLITE_CREATE_INDEX, sqlite3.SQLITE_DROP_INDEX})
+MAINTENANCE_ACTIONS = frozenset({sqlite3.SQLITE_ANALYZE, sqlite3.SQLITE_REINDEX})
+
+# What index statements do to SQLite's own tables (sqlite_master, sqlite_stat1)
+SCHEMA_TABLE_ACTIONS = frozenset({
+    sqlite3.SQLITE_READ, sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE, sqlite3.SQLITE_DELETE,
+    sqlite3.SQLITE_CREATE_TABLE,
+})
+
+
+def schema_authorizer():
+    """
+    Build a sqlite3 authorizer for the index statements a sandbox accepts.
+    
+    Indexes may be created and dropped on the dataset tables, and SQLite may
+    update its schema and statistics tables while doing so; everything else
+    is left to QueryExecutor.authorizer().
+    
+    Returns:
+        callable: For sqlite3.Connection.set_authorizer
+    """
+    tables = frozenset(table.lower() for table in settings.EXERCISE_TABLES)
+    authorize_read = QueryExecutor.authorizer()
+    
+    def authorize(action, arg1, arg2, database, trigger):
+        if action in INDEX_ACTIONS:
+            return sqlite3.SQLITE_OK if arg2 and arg2.lower() in tables else sqlite3.SQLITE_DENY
+        if action in MAINTENANCE_ACTIONS:
+            return sqlite3.SQLITE_OK
+        if action in SCHEMA_TABLE_ACTIONS and arg1 and arg1.lower().startswith('sqlite_'):
+            return sqlite3.SQLITE_OK
+        return authorize_read(action, arg1, arg2, database, trigger)
+    
+    return authorize
+
+
+class Sandbox:
+    """One session's private copy of the dataset."""
+    
+    def __init__(self, scale=None):
+        self.scale = scale
+        self.version = dataset.current_version()
+        self.lock = threading.Lock()
+        self.closed = False
+        self._table_rows = None
+        
+        if scale is None:
+            image = memory_dataset.image(self.version)
+        else:
+            image = memory_dataset.scaled_image(self.version, settings.PERFORMANCE_SCALES[scale])
+        # Used by whichever request thread the session's next request lands on
+        self.connection = sqlite3.connect(':memory:', detect_types=DETECT_TYPES, check_same_thread=False)
+        self.connection.deserialize(image)
+        register_functions(self.connection)
+        self.size = self._measure_size()
+    
+    def run(self, query, schema_change):
+        """
+        Execute one statement in the sandbox.
+        
+        Args:
+            query (str): Statement accepted by SandboxValidator
+            schema_change (bool): Whether it is an index statement rather than a query
+        
+        Returns:
+            tuple: (success, result/error_message); a query's result has columns,
+                   rows (the first SANDBOX_MAX_ROWS), rows_returned, elapsed_ms,
+                   rows_scanned, tables and plan, an index statement's only elapsed_ms
+        """
+        with self.lock:
+            if self.closed:
+                return False, "❌ The sandbox was reset. Run the statement again."
+            
+            started = time.perf_counter()
+            rows_returned = 0
+            error = None
+            connection = self.connection
+            connection.set_authorizer(schema_authorizer() if schema_change else QueryExecutor.authorizer())
+            deadline = time.monotonic() + settings.SANDBOX_TIME_LIMIT_MS / 1000
+            connection.set_progress_handler(
+                lambda: time.monotonic() > deadline, QueryExecutor.PROGRESS_HANDLER_STEPS
+            )
+            try:
+                statement = QueryExecutor.single_statement(query)
+                if schema_change:
+                    connection.execute(statement)
+                    result = {'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)}
+                else:
+                    plan = plan_tree(connection.execute(f"EXPLAIN QUERY PLAN {statement}").fetchall())
+                    started = time.perf_counter()
+                    cursor = connection.execute(statement)
+                    columns = [col[0] for col in cursor.description]
+                    shown = cursor.fetchmany(settings.SANDBOX_MAX_ROWS)
+                    rows_returned = len(shown)
+                    while True:
+                        rows = cursor.fetchmany(settings.EXERCISE_FETCH_SIZE)
+                        if not rows:
+                            break
+                        rows_returned += len(rows)
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    
+                    sizes = self.table_rows()
+                    result = {
+                        'columns': columns,
+                        'rows': [dict(zip(columns, row)) for row in shown],
+                        'rows_returned': rows_returned,
+                        'elapsed_ms': round(elapsed_ms, 2),
+                        'rows_scanned': rows_scanned(plan, statement, sizes),
+                        'tables': sizes,
+                        'plan': plan,
+                    }
+            except Exception as e:
+                error = QueryExecutor.error_message(e)
+            finally:
+                connection.set_authorizer(None)
+                connection.set_progress_handler(None, 0)
+                self.size = self._measure_size()
+                query_log.record(
+                    query, SANDBOX_EXERCISE, (time.perf_counter() - started) * 1000, rows_returned, error
+                )
+        
+        if error is not None:
+            return False, error
+        return True, result
+    
+    def table_rows(self):
+        """Return the row count of each dataset table, counted once."""
+        if self._table_rows is None:
+            self._table_rows = {
+                table: self.connection.execute(f'SELECT count(*) FROM "{table}"').fetchone()[0]
+                for table in settings.EXERCISE_TABLES
+            }
+        return self._table_rows
+    
+    def describe(self):
+        """
+        Return what the sandbox holds, for the response.
+        
+        Returns:
+            dict: scale, size_bytes, stale (the dataset has changed since it
+                  was cloned) and the indexes created in it
+        """
+        with self.lock:
+            indexes = [] if self.closed else [
+                {'name': name, 'table': table, 'sql': sql}
+                for name, table, sql in self.connection.execute(
+                    "SELECT name, tbl_name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL ORDER BY name"
+                )
+            ]
+        return {
+            'scale': self.scale,
+            'size_bytes': self.size,
+            'stale': self.version != dataset.current_version(),
+            'indexes': indexes,
+        }
+    
+    def close(self):
+        """Free the copy, waiting for a statement running in it to finish."""
+        with self.lock:
+            if not self.closed:
+                self.closed = True
+                self.connection.close()
+    
+    def _measure_size(self):
+        page_count = self.connection.execute('PRAGMA page_count').fetchone()[0]
+        page_size = self.connection.execute('PRAGMA page_size').fetchone()[0]
+        return page_count * page_size
+
+
+class SandboxRegistry:
+    """The sandboxes of this worker, least recently used first."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sandboxes = OrderedDict()
+        self._evicted = 0
+    
+    def get(self, session_key, scale=None):
+        """
+        Return a session's sandbox, cloning the dataset if it has none.
+        
+        Args:
+            session_key (str): Session of the student
+            scale (str): Key of settings.PERFORMANCE_SCALES for a new sandbox,
+                         None for the real dataset
+        
+        Returns:
+            Sandbox
+        """
+        with self._lock:
+            sandbox = self._sandboxes.get(session_key)
+            if sandbox is not None and not sandbox.closed:
+                self._sandboxes.move_to_end(session_key)
+                return sandbox
+        
+        # Cloning a large copy takes a while; done outside the registry lock
+        sandbox = Sandbox(scale)
+        with self._lock:
+            previous = self._sandboxes.pop(session_key, None)
+            self._sandboxes[session_key] = sandbox
+        if previous is not None:
+            previous.close()
+        self.evict()
+        return sandbox
+    
+    def reset(self, session_key):
+        """Drop a session's sandbox, if it has one."""
+        with self._lock:
+            sandbox = self._sandboxes.pop(session_key, None)
+        if sandbox is not None:
+            sandbox.close()
+    
+    def evict(self):
+        """Drop least recently used sandboxes until the rest fit in SANDBOX_MEMORY_BYTES."""
+        victims = []
+        with self._lock:
+            total = sum(sandbox.size for sandbox in self._sandboxes.values())
+            # The most recently used sandbox is always kept
+            while total > settings.SANDBOX_MEMORY_BYTES and len(self._sandboxes) > 1:
+                _, sandbox = self._sandboxes.popitem(last=False)
+                total -= sandbox.size
+                victims.append(sandbox)
+            self._evicted += len(victims)
+        for sandbox in victims:
+            sandbox.close()
+    
+    def stats(self):
+        """Return the number of sandboxes, their total size and how many were evicted."""
+        with self._lock:
+            return {
+                'sandboxes': len(self._sandboxes),
+                'bytes': sum(sandbox.size for sandbox in self._sandboxes.values()),
+                'evicted': self._evicted,
+            }
+
+
+sandboxes = SandboxRegistry()
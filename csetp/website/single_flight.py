@@ -0,0 +1,278 @@
+"""
+Single-Flight Computations
+Runs a computation once for all callers that ask for it at the same time.
+
+When a class opens an exercise together, dozens of requests want the same
+expected result or predict query result at once. SingleFlight.do() lets the
+first caller for a key (exercise, query hash, dataset version) compute it;
+callers arriving while it runs wait and get the same result (or exception).
+Nothing is kept afterwards, so this coalesces concurrent work but is not a
+cache. The computation runs detached from the first caller's submission
+ticket (inflight.py): a resubmission by that student must not stop it for
+everyone else.
+
+Within a process this costs a dictionary lookup. Values that are small and
+asked for rarely (expected fingerprints and values, once per dataset version)
+can also be shared across worker processes (SINGLE_FLIGHT_CROSS_PROCESS, POSIX
+only) by passing a SharedCodec: the computing process holds an flock on a lock
+file for the key in SINGLE_FLIGHT_DIR, and a process that finds the file
+locked waits for it (up to SINGLE_FLIGHT_WAIT seconds) and then reads the JSON
+the holder left next to it, if that was written after it started waiting;
+otherwise it computes the value itself. Only JSON is read back, never pickles,
+and values encoding to more than SINGLE_FLIGHT_SHARED_MAX_BYTES are not
+written. Files unused for SINGLE_FLIGHT_FILE_TTL seconds are removed; a lock
+file only while nobody holds it.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+from .inflight import detached
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalesce within the process only
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds between attempts to take a lock file held by another process
+LOCK_POLL_SECONDS = 0.02
+
+
+def query_key(label, query, version):
+    """
+    Build a single-flight key for running a query on a dataset version.
+    
+    Args:
+        label (str): Exercise key or other name of the computation
+        query (str): SQL text
+        version (int): Dataset version the result depends on
+    
+    Returns:
+        str: Key for SingleFlight.do
+    """
+    digest = hashlib.sha1(query.encode()).hexdigest()[:16]
+    return f"{label}:{digest}:{version}"
+
+
+class SharedCodec:
+    """Converts a value shared with other processes to JSON data and back."""
+    
+    def __init__(self, encode, decode):
+        self.encode = encode
+        self.decode = decode
+    
+    def result(self):
+        """Codec for (success, value/error_message) pairs whose value uses this codec."""
+        return SharedCodec(
+            lambda pair: [pair[0], self.encode(pair[1]) if pair[0] else pair[1]],
+            lambda data: (data[0], self.decode(data[1]) if data[0] else data[1]),
+        )
+
+
+# JSON values as they are (counts, scalar expected values); others are not shared
+PLAIN = SharedCodec(lambda value: value, lambda data: data)
+
+# QueryComparator.fingerprint_result multisets: row keys are sets of (column, text) pairs
+FINGERPRINT = SharedCodec(
+    lambda fingerprint: [[sorted(row), count] for row, count in fingerprint.items()],
+    lambda data: Counter({frozenset(map(tuple, row)): count for row, count in data}),
+)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {'computed': 0, 'joined': 0, 'shared': 0}
+        self._directory = None  # Last SINGLE_FLIGHT_DIR known to exist
+        self._pruned_at = 0.0
+    
+    def do(self, key, compute, shared=None):
+        """
+        Return compute(), computed once for all concurrent callers with this key.
+        
+        Args:
+            key (str): What is computed, including everything the value depends on
+            compute (callable): Computes the value
+            shared (SharedCodec): Also coalesce with other processes, exchanging
+                                  the value as JSON through this codec
+        
+        Returns:
+            The value returned by compute() for this or a concurrent caller
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        
+        if not leader:
+            self._count('joined')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+        
+        try:
+            with detached():
+                if shared is not None and settings.SINGLE_FLIGHT_CROSS_PROCESS and fcntl is not None:
+                    call.value = self._do_across_processes(key, compute, shared)
+                else:
+                    call.value = compute()
+                    self._count('computed')
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value
+    
+    def stats(self):
+        """Return how many values were computed, joined in-process and shared across processes."""
+        with self._lock:
+            return dict(self._stats)
+    
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+    
+    def _do_across_processes(self, key, compute, codec):
+        directory = settings.SINGLE_FLIGHT_DIR
+        name = hashlib.sha1(key.encode()).hexdigest()
+        result_path = directory / f"{name}.json"
+        
+        started = time.time()
+        try:
+            if self._directory != directory:
+                directory.mkdir(parents=True, exist_ok=True)
+                self._directory = directory
+            lock_file, waited = self._acquire(directory / f"{name}.lock")
+        except OSError:
+            # Coalesce within the process only
+            logger.exception("Could not open single-flight lock for %s", key)
+            self._directory = None
+            value = compute()
+            self._count('computed')
+            return value
+        try:
+            if waited:
+                # Someone else held the lock: use their result if it is from this flight
+                value = self._read_result(result_path, started, codec)
+                if value is not None:
+                    self._count('shared')
+                    return value[0]
+            value = compute()
+            self._count('computed')
+            self._write_result(result_path, value, codec)
+            return value
+        finally:
+            lock_file.close()
+    
+    def _acquire(self, path):
+        """
+        Open and lock a lock file, waiting for another process if needed.
+        
+        Returns:
+            tuple: (open lock file, True if another process held it); if the
+                   holder does not finish in time the file is returned unlocked
+        """
+        deadline = time.monotonic() + settings.SINGLE_FLIGHT_WAIT
+        waited = False
+        while True:
+            lock_file = open(path, 'a')
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() > deadline:
+                        # Holder is stuck; compute without the lock rather than fail
+                        logger.warning("Gave up waiting for single-flight lock %s", path.name)
+                        return lock_file, False
+                    waited = True
+                    time.sleep(LOCK_POLL_SECONDS)
+            # _prune may have removed the file while we waited for it; a lock
+            # on a removed file excludes nobody, so start over on the new one
+            try:
+                if os.stat(path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                    return lock_file, waited
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+    
+    def _read_result(self, path, since, codec):
+        try:
+            with open(path, encoding='utf-8') as f:
+                stored = json.load(f)
+            if stored['finished_at'] < since:
+                return None
+            return (codec.decode(stored['value']),)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+    
+    def _write_result(self, path, value, codec):
+        try:
+            data = json.dumps({'finished_at': time.time(), 'value': codec.encode(value)})
+        except (TypeError, ValueError):
+            # Not JSON (e.g. a Decimal value): the other processes compute it themselves
+            return
+        if len(data) > settings.SINGLE_FLIGHT_SHARED_MAX_BYTES:
+            return
+        try:
+            temporary = path.with_suffix(f".{os.getpid()}.tmp")
+            temporary.write_text(data, encoding='utf-8')
+            os.replace(temporary, path)
+        except OSError:
+            logger.exception("Could not share single-flight result %s", path.name)
+            return
+        self._prune(path.parent)
+    
+    def _prune(self, directory):
+        """Remove files unused for SINGLE_FLIGHT_FILE_TTL, at most once per TTL."""
+        now = time.time()
+        with self._lock:
+            if now - self._pruned_at < settings.SINGLE_FLIGHT_FILE_TTL:
+                return
+            self._pruned_at = now
+        
+        cutoff = now - settings.SINGLE_FLIGHT_FILE_TTL
+        for path in directory.iterdir():
+            try:
+                if path.stat().st_mtime >= cutoff:
+                    continue
+                if path.suffix != '.lock':
+                    path.unlink()
+                    continue
+                # Only remove a lock file nobody holds, and while holding it
+                with open(path, 'a') as lock_file:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue
+                    path.unlink()
+            except OSError:
+                pass
+
+
+single_flight = SingleFlight()
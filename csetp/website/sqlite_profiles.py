@@ -0,0 +1,87 @@
+"""
+SQLite Connection Profiles
+Named sets of PRAGMAs applied to every new SQLite connection.
+
+settings.SQLITE_PROFILE selects the profile; the connection_created receiver
+below applies it to each Django connection. The exercise alias is read-only, so
+it skips the journal settings (a property of the database file, set through
+'default') and additionally gets query_only. `python manage.py
+benchmark_sqlite_profiles` compares the profiles under concurrent load.
+"""
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+SQLITE_PROFILES = {
+    # SQLite defaults: rollback journal, 2 MB page cache, no memory mapping
+    'baseline': {
+        'journal_mode': 'DELETE',
+    },
+    # Readers and a writer no longer block each other
+    'wal': {
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,
+    },
+    # WAL plus larger caches; synchronous=NORMAL is durable in WAL mode except
+    # for the last transactions before a power loss
+    'tuned': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64000,  # negative: KiB, i.e. 64 MB
+        'temp_store': 'MEMORY',
+    },
+}
+
+# Only meaningful on connections that may write to the file
+WRITER_PRAGMAS = ('journal_mode', 'synchronous')
+
+# Added on read-only connections (the exercise alias)
+READ_ONLY_PRAGMAS = {'query_only': 'ON'}
+
+
+def profile_pragmas(name, read_only=False):
+    """
+    Return the PRAGMAs of a profile, in the order they should be applied.
+    
+    Args:
+        name (str): Key of SQLITE_PROFILES
+        read_only (bool): Whether the connection only reads
+    
+    Returns:
+        list: (pragma, value) pairs
+    """
+    try:
+        profile = SQLITE_PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown SQLite profile '{name}', expected one of {', '.join(SQLITE_PROFILES)}")
+    
+    pragmas = list(profile.items())
+    if read_only:
+        pragmas = [(pragma, value) for pragma, value in pragmas if pragma not in WRITER_PRAGMAS]
+        pragmas.extend(READ_ONLY_PRAGMAS.items())
+    return pragmas
+
+
+def apply_profile(connection, name, read_only=False):
+    """
+    Apply a profile to a DB-API sqlite3 connection.
+    
+    Args:
+        connection (sqlite3.Connection): Open connection
+        name (str): Key of SQLITE_PROFILES
+        read_only (bool): Whether the connection only reads
+    """
+    for pragma, value in profile_pragmas(name, read_only):
+        connection.execute(f'PRAGMA {pragma} = {value}').fetchall()
+
+
+@receiver(connection_created)
+def _apply_sqlite_profile(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    read_only = connection.alias == settings.EXERCISE_DB_ALIAS
+    apply_profile(connection.connection, settings.SQLITE_PROFILE, read_only)
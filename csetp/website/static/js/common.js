@@ -46,6 +46,49 @@ async function fetchQueryResults(url) {
 }
 
 
+// Latest submission per endpoint. Submitting again aborts the previous request
+// (the server stops its query as well), whose promise then never settles so
+// a stale result cannot overwrite the new one.
+const pendingSubmissions = {};
+
+
+/**
+ * Abort the pending submission to an endpoint and start tracking a new one.
+ * @param {string} url - API endpoint URL
+ * @returns {AbortController} Controller for the new request
+ */
+function beginSubmission(url) {
+    if (pendingSubmissions[url]) {
+        pendingSubmissions[url].abort();
+    }
+    const controller = new AbortController();
+    pendingSubmissions[url] = controller;
+    return controller;
+}
+
+
+/**
+ * Stop tracking a submission that has finished.
+ * @param {string} url - API endpoint URL
+ * @param {AbortController} controller - Controller returned by beginSubmission
+ */
+function endSubmission(url, controller) {
+    if (pendingSubmissions[url] === controller) {
+        delete pendingSubmissions[url];
+    }
+}
+
+
+/**
+ * Whether a failed or answered submission was replaced by a newer one.
+ * @param {Error|Response} outcome - Error thrown by fetch, or its response
+ * @returns {boolean}
+ */
+function isSuperseded(outcome) {
+    return outcome.name === 'AbortError' || outcome.status === 409;
+}
+
+
 /**
  * Make a POST request with user's SQL query.
  * @param {string} url - API endpoint URL
@@ -53,6 +96,7 @@ async function fetchQueryResults(url) {
  * @returns {Promise} Promise resolving to JSON response
  */
 async function submitQuery(url, query) {
+    const controller = beginSubmission(url);
     try {
         const response = await fetch(url, {
             method: 'POST',
@@ -60,18 +104,206 @@ async function submitQuery(url, query) {
                 'Content-Type': 'application/json',
                 'X-CSRFToken': getCSRFToken()
             },
-            body: JSON.stringify({ query: query })
+            body: JSON.stringify({ query: query, ...performanceOptions() }),
+            signal: controller.signal
         });
         
+        if (isSuperseded(response)) {
+            return new Promise(() => {});
+        }
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
         
-        return await response.json();
+        const data = await response.json();
+        displayPerformance(data.performance);
+        return data;
     } catch (error) {
+        if (isSuperseded(error)) {
+            return new Promise(() => {});
+        }
         console.error('Submit error:', error);
         throw error;
+    } finally {
+        endSubmission(url, controller);
+    }
+}
+
+
+/**
+ * POST a user's SQL query to an events endpoint and follow its progress.
+ * The endpoint streams server-sent events ('start', 'progress', 'rows', then
+ * 'verdict', 'error' or 'cancelled'); submissions it does not run get a plain
+ * JSON response, which is returned as is.
+ * @param {string} url - Events endpoint URL
+ * @param {string} query - User's SQL query
+ * @param {Function} onEvent - Called with (eventName, data) for every event
+ * @returns {Promise} Promise resolving to the same shape submitQuery returns
+ */
+async function submitQueryWithProgress(url, query, onEvent = () => {}) {
+    const controller = beginSubmission(url);
+    try {
+        return await followQueryProgress(url, query, onEvent, controller);
+    } catch (error) {
+        if (isSuperseded(error)) {
+            return new Promise(() => {});
+        }
+        throw error;
+    } finally {
+        endSubmission(url, controller);
+    }
+}
+
+
+async function followQueryProgress(url, query, onEvent, controller) {
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': getCSRFToken()
+        },
+        body: JSON.stringify({ query: query, ...performanceOptions() }),
+        signal: controller.signal
+    });
+    
+    if (isSuperseded(response)) {
+        return new Promise(() => {});
+    }
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    if (!(response.headers.get('Content-Type') || '').startsWith('text/event-stream')) {
+        const data = await response.json();
+        displayPerformance(data.performance);
+        return data;
+    }
+    
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = '';
+    let rows = null;
+    let outcome = {};
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += value;
+        
+        // Events are separated by a blank line
+        let end;
+        while ((end = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, end);
+            buffer = buffer.slice(end + 2);
+            
+            let event = 'message';
+            let data = '';
+            for (const line of block.split('\n')) {
+                if (line.startsWith('event: ')) {
+                    event = line.slice('event: '.length);
+                } else if (line.startsWith('data: ')) {
+                    data += line.slice('data: '.length);
+                }
+            }
+            
+            const payload = JSON.parse(data);
+            if (payload.superseded) {
+                return new Promise(() => {});
+            }
+            onEvent(event, payload);
+            if (event === 'rows') {
+                rows = (rows || []).concat(payload.rows);
+            } else if (['verdict', 'error', 'cancelled'].includes(event)) {
+                outcome = { ...payload, cancelled: event === 'cancelled' };
+                displayPerformance(payload.performance);
+            }
+        }
+    }
+    
+    return rows !== null ? { result: rows, ...outcome } : outcome;
+}
+
+
+/**
+ * Stop a query started with submitQueryWithProgress.
+ * @param {string} runId - run_id from the 'start' event
+ * @returns {Promise} Promise resolving to JSON response
+ */
+async function cancelQueryRun(runId) {
+    const response = await fetch(`/api/runs/${runId}/cancel/`, {
+        method: 'POST',
+        headers: { 'X-CSRFToken': getCSRFToken() }
+    });
+    return await response.json();
+}
+
+
+// ============================================================================
+// Performance Feedback
+// ============================================================================
+
+/**
+ * Read the timing and query plan controls (performance_panel.html).
+ * @returns {Object} Extra request fields, empty if the feedback is off or not offered
+ */
+function performanceOptions() {
+    const toggle = document.getElementById('performance-toggle');
+    if (!toggle || !toggle.checked) {
+        return {};
+    }
+    const scale = document.getElementById('performance-scale');
+    return { performance: true, scale: scale ? scale.value : '' };
+}
+
+
+/**
+ * Format query plan steps as a nested list.
+ * @param {Array} steps - Plan steps with detail, children and (for full scans) rows
+ * @returns {string} HTML string
+ */
+function formatQueryPlan(steps) {
+    if (!steps || steps.length === 0) {
+        return '';
+    }
+    let html = '<ul class="mb-0">';
+    steps.forEach(step => {
+        const rows = step.rows !== undefined ? ` <span class="text-muted">(${step.rows} rows)</span>` : '';
+        html += `<li><code>${step.detail}</code>${rows}${formatQueryPlan(step.children)}</li>`;
+    });
+    html += '</ul>';
+    return html;
+}
+
+
+/**
+ * Show the timing and query plan of the last submission in the panel.
+ * @param {Object} performance - 'performance' key of a response, if any
+ */
+function displayPerformance(performance) {
+    const output = document.getElementById('performance-output');
+    if (!output || !performance) {
+        return;
     }
+    
+    const dataset = performance.scale ? `${performance.scale} employees` : 'the exercise data';
+    let html = `<p class="mb-1"><strong>On ${dataset}:</strong> `;
+    if (performance.error) {
+        html += `<span class="text-danger">${performance.error}</span></p>`;
+    } else {
+        // Grading that does not fetch the rows itself leaves out time or rows returned
+        const parts = [];
+        if (performance.elapsed_ms !== null) {
+            parts.push(`${performance.elapsed_ms} ms`);
+        }
+        if (performance.rows_returned !== null) {
+            parts.push(`${performance.rows_returned} row(s) returned`);
+        }
+        if (performance.rows_scanned !== null) {
+            parts.push(`about ${performance.rows_scanned} row(s) scanned`);
+        }
+        html += `${parts.join(', ')}</p>`;
+        html += '<p class="mb-1">Query plan:</p>' + formatQueryPlan(performance.plan);
+    }
+    output.innerHTML = html;
+    showElement('performance-output');
 }
 
 
@@ -126,6 +358,54 @@ function formatAggregateValue(value) {
 }
 
 
+/**
+ * Format the row-level diff returned for an incorrect result.
+ * @param {Object} diff - missing/extra columns, counts and example rows
+ * @returns {string} HTML string, empty if there is nothing to show
+ */
+function formatResultDiff(diff) {
+    if (!diff) {
+        return '';
+    }
+    
+    let html = '<div class="mt-3">';
+    
+    if (diff.missing_columns.length > 0) {
+        html += `<p class="text-warning">Missing column(s): <code>${diff.missing_columns.join(', ')}</code></p>`;
+    }
+    if (diff.extra_columns.length > 0) {
+        html += `<p class="text-warning">Unexpected column(s): <code>${diff.extra_columns.join(', ')}</code></p>`;
+    }
+    
+    if (diff.missing_count > 0) {
+        html += `<p class="mb-1"><strong>${diff.missing_count}</strong> expected row(s) are missing from your result`;
+        html += diff.missing_rows.length < diff.missing_count ? `, for example:</p>` : `:</p>`;
+        html += formatQueryResultsAsTable(diff.missing_rows);
+    }
+    if (diff.extra_count > 0) {
+        html += `<p class="mb-1"><strong>${diff.extra_count}</strong> row(s) in your result should not be there`;
+        html += diff.extra_rows.length < diff.extra_count ? `, for example:</p>` : `:</p>`;
+        html += formatQueryResultsAsTable(diff.extra_rows);
+    }
+    
+    html += '</div>';
+    return html;
+}
+
+
+/**
+ * Append the row-level diff of an incorrect result below a feedback message.
+ * @param {string} elementId - ID of the feedback element
+ * @param {Object} diff - Diff from the response, if any
+ */
+function displayResultDiff(elementId, diff) {
+    const element = document.getElementById(elementId);
+    if (element && diff) {
+        element.innerHTML += formatResultDiff(diff);
+    }
+}
+
+
 // ============================================================================
 // UI Helper Functions
 // ============================================================================
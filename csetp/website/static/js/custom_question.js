@@ -80,14 +80,32 @@ function showModifySection() {
 // Section 3: Modify
 // ============================================================================
 
+let modifyRunId = null;
+
+
 function runCustomModifyQuery(questionSetId) {
     const userQuery = getTextareaValue('modify-query');
+    document.getElementById('modify-result-display').innerHTML = '';
     
-    submitQuery(`/api/custom-question/${questionSetId}/run-modify/`, userQuery)
+    // Slow queries report their progress and can be stopped
+    submitQueryWithProgress(`/api/exercise/custom:${questionSetId}:modify/events/`, userQuery, (event, data) => {
+        if (event === 'start') {
+            modifyRunId = data.run_id;
+            showElement('modify-stop-btn', 'inline-block');
+        } else if (event === 'progress') {
+            showElement('modify-query-output');
+            displayFeedback('modify-feedback',
+                `Running… ${data.rows} row(s) so far, ${(data.elapsed_ms / 1000).toFixed(1)}s`, 'info');
+        }
+    })
         .then(data => {
+            modifyRunId = null;
+            hideElement('modify-stop-btn');
             showElement('modify-query-output');
             
-            if (data.error) {
+            if (data.cancelled) {
+                displayFeedback('modify-feedback', data.error, 'warning');
+            } else if (data.error) {
                 document.getElementById('modify-result-display').innerHTML = '';
                 displayFeedback('modify-feedback', data.error, 'error');
             } else {
@@ -99,16 +117,26 @@ function runCustomModifyQuery(questionSetId) {
                     showElement('next-section-btn-3', 'inline-block');
                 } else {
                     displayFeedback('modify-feedback', '❌ Incorrect. Try modifying the query again.', 'error');
+                    displayResultDiff('modify-feedback', data.diff);
                 }
             }
         })
         .catch(error => {
+            modifyRunId = null;
+            hideElement('modify-stop-btn');
             showElement('modify-query-output');
             displayFeedback('modify-feedback', `Error: ${error.message}`, 'error');
         });
 }
 
 
+function stopCustomModifyQuery() {
+    if (modifyRunId) {
+        cancelQueryRun(modifyRunId);
+    }
+}
+
+
 function showMakeSection() {
     showElement('section-4');
     const section = document.getElementById('section-4');
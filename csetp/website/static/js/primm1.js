@@ -132,6 +132,7 @@ function runModifiedQuery(modifyQueryUrl) {
                 showElement('next-section-btn-3', 'inline-block');
             } else {
                 displayFeedback('modify-feedback', '❌ Incorrect. Try modifying the query again.', 'error');
+                displayResultDiff('modify-feedback', data.diff);
             }
         })
         .catch(error => {
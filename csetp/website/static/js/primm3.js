@@ -131,6 +131,7 @@ function runModifiedQueryJoin(modifyQueryUrl) {
                     "❌ Incorrect. Make sure you're filtering projects that started after 2023-01-01.",
                     'error'
                 );
+                displayResultDiff('modify-feedback', data.diff);
             }
         })
         .catch(error => {
@@ -171,6 +172,7 @@ function runMakeQueryJoin(makeQueryUrl, homeUrl) {
             } else {
                 const hint = data.hint || "Try using LEFT JOIN and check for NULL values in the projects table.";
                 displayFeedback('make-feedback', `⚠️ Hint: ${hint}`, 'warning');
+                displayResultDiff('make-feedback', data.diff);
             }
         })
         .catch(error => {
@@ -0,0 +1,72 @@
+/**
+ * Question Set Import
+ * Uploads a JSONL/ZIP export from the dashboard and shows the import report.
+ */
+
+/**
+ * Format an import report as HTML.
+ * @param {Object} report - Report returned by the import endpoint
+ * @returns {string} HTML string
+ */
+function formatImportReport(report) {
+    const created = report.dry_run ? report.valid : report.created.length;
+    const verb = report.dry_run ? 'would be created' : 'created';
+    const alertClass = report.invalid.length > 0 ? 'alert-warning' : 'alert-success';
+    
+    let html = `<div class="alert ${alertClass}">${report.total} set(s) read, ` +
+        `<strong>${created}</strong> ${verb}, ${report.invalid.length} invalid ` +
+        `(${Math.round(report.elapsed_ms)} ms).</div>`;
+    
+    report.invalid.forEach(entry => {
+        html += `<p class="mb-1"><code>${escapeHtml(entry.source)}</code> ${escapeHtml(entry.name || 'unnamed')}</p><ul>`;
+        entry.errors.forEach(error => {
+            html += `<li>${escapeHtml(error)}</li>`;
+        });
+        html += '</ul>';
+    });
+    return html;
+}
+
+
+/**
+ * Escape text for insertion into HTML.
+ * @param {string} text - Raw text
+ * @returns {string} Escaped text
+ */
+function escapeHtml(text) {
+    const element = document.createElement('span');
+    element.textContent = text;
+    return element.innerHTML;
+}
+
+
+document.addEventListener('DOMContentLoaded', function() {
+    const form = document.getElementById('importForm');
+    if (!form) {
+        return;
+    }
+    
+    form.addEventListener('submit', async function(event) {
+        event.preventDefault();
+        const reportElement = document.getElementById('importReport');
+        reportElement.innerHTML = '<p class="text-muted">Validating question sets...</p>';
+        
+        try {
+            const response = await fetch(form.action, {
+                method: 'POST',
+                headers: { 'X-CSRFToken': getCSRFToken() },
+                body: new FormData(form)
+            });
+            const report = await response.json();
+            
+            if (report.error) {
+                reportElement.innerHTML = `<div class="alert alert-danger">${escapeHtml(report.error)}</div>`;
+            } else {
+                reportElement.innerHTML = formatImportReport(report);
+            }
+        } catch (error) {
+            console.error('Import error:', error);
+            reportElement.innerHTML = '<div class="alert alert-danger">❌ Import failed.</div>';
+        }
+    });
+});
@@ -0,0 +1,89 @@
+/**
+ * Index Sandbox JavaScript
+ * Runs queries and index statements in the session's own copy of the dataset
+ */
+
+/**
+ * Run the statement in the textarea and show its timing, plan and first rows.
+ */
+async function runSandboxStatement() {
+    const query = getTextareaValue('sandbox-query');
+    const scale = document.getElementById('sandbox-scale').value;
+    setButtonEnabled('sandbox-run-btn', false);
+    
+    try {
+        const response = await fetch('/api/sandbox/run/', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': getCSRFToken()
+            },
+            body: JSON.stringify({ query: query, scale: scale })
+        });
+        const data = await response.json();
+        showElement('sandbox-output');
+        
+        if (data.error) {
+            displayFeedback('sandbox-feedback', data.error, 'error');
+            document.getElementById('sandbox-result').innerHTML = '';
+        } else if (data.plan) {
+            displayFeedback(
+                'sandbox-feedback',
+                `${data.elapsed_ms} ms, ${data.rows_returned} row(s) returned, about ${data.rows_scanned} row(s) scanned`,
+                'info'
+            );
+            let html = '<p class="mb-1 mt-3">Query plan:</p>' + formatQueryPlan(data.plan);
+            if (data.rows_returned > data.rows.length) {
+                html += `<p class="text-muted mt-3">First ${data.rows.length} rows:</p>`;
+            }
+            html += formatQueryResultsAsTable(data.rows);
+            document.getElementById('sandbox-result').innerHTML = html;
+        } else {
+            displayFeedback('sandbox-feedback', `✅ Done in ${data.elapsed_ms} ms.`, 'success');
+            document.getElementById('sandbox-result').innerHTML = '';
+        }
+        
+        if (data.sandbox) {
+            displaySandboxIndexes(data.sandbox);
+        }
+    } catch (error) {
+        displayFeedback('sandbox-feedback', `Error: ${error.message}`, 'error');
+    } finally {
+        setButtonEnabled('sandbox-run-btn', true);
+    }
+}
+
+
+/**
+ * List the indexes and size of the sandbox.
+ * @param {Object} sandbox - 'sandbox' key of a response
+ */
+function displaySandboxIndexes(sandbox) {
+    const size = (sandbox.size_bytes / (1024 * 1024)).toFixed(1);
+    const dataset = sandbox.scale ? `${sandbox.scale} employees` : 'exercise data';
+    let html = `<p class="text-muted mt-3 mb-1">Sandbox: ${dataset}, ${size} MB`;
+    html += sandbox.stale ? ' (the dataset has changed since; start over to get the new data)</p>' : '</p>';
+    
+    if (sandbox.indexes.length > 0) {
+        html += '<ul>';
+        sandbox.indexes.forEach(index => {
+            html += `<li><code>${index.sql}</code></li>`;
+        });
+        html += '</ul>';
+    }
+    document.getElementById('sandbox-indexes').innerHTML = html;
+}
+
+
+/**
+ * Drop the sandbox, so the next statement runs on a fresh copy at the selected size.
+ */
+async function resetSandbox() {
+    await fetch('/api/sandbox/reset/', {
+        method: 'POST',
+        headers: { 'X-CSRFToken': getCSRFToken() }
+    });
+    document.getElementById('sandbox-indexes').innerHTML = '';
+    document.getElementById('sandbox-result').innerHTML = '';
+    displayFeedback('sandbox-feedback', 'Sandbox reset. Your next statement runs on a fresh copy.', 'info');
+}
@@ -0,0 +1,120 @@
+"""
+Streaming JSON Responses
+Encodes query results row by row so large result sets reach the client
+without building the full list or the full JSON string in memory.
+"""
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .executor import QueryExecutor
+from .inflight import SUPERSEDED_RESPONSE
+from .memory_profiler import memory_phase
+
+
+# Same encoder JsonResponse uses, so Decimal and date values match the non-streaming endpoints
+ENCODER = DjangoJSONEncoder()
+
+# Encoded rows are batched into chunks of this many rows before being sent
+STREAM_CHUNK_ROWS = 500
+
+
+def encode_rows(columns, rows):
+    """Encode row tuples as comma-separated JSON objects."""
+    with memory_phase('encode'):
+        return ', '.join(ENCODER.encode(dict(zip(columns, row))) for row in rows)
+
+
+def iter_json_result(columns, rows, on_row=None, trailer=None, ticket=None):
+    """
+    Encode a result set as a JSON object of the form {"result": [...], ...}.
+    
+    Args:
+        columns (list): Column names for each row tuple
+        rows (iterable): Row tuples, consumed lazily
+        on_row (callable): Optional callback invoked with each row tuple
+        trailer (callable): Optional callable returning extra keys, evaluated
+                            after the last row has been sent
+        ticket (SubmissionTicket): Submission the rows belong to; once it is
+                                   superseded the document ends with
+                                   SUPERSEDED_RESPONSE instead of the trailer
+    
+    Yields:
+        str: Chunks of the encoded JSON document
+    """
+    yield '{"result": ['
+    extra = {}
+    try:
+        chunk = []
+        first = True
+        for row in rows:
+            if on_row:
+                on_row(row)
+            chunk.append(row)
+            if len(chunk) >= STREAM_CHUNK_ROWS:
+                yield ('' if first else ', ') + encode_rows(columns, chunk)
+                first = False
+                chunk = []
+        if chunk:
+            yield ('' if first else ', ') + encode_rows(columns, chunk)
+        if ticket is not None and ticket.superseded:
+            extra = SUPERSEDED_RESPONSE
+        elif trailer:
+            extra = trailer()
+    
+    except Exception as e:
+        # Headers are already sent, so errors can only be reported in the body
+        if ticket is not None and ticket.superseded:
+            extra = SUPERSEDED_RESPONSE
+        else:
+            extra = {"error": QueryExecutor.error_message(e, ticket), "correct": False}
+    
+    finally:
+        if hasattr(rows, 'close'):
+            rows.close()
+    
+    yield ']'
+    for key, value in extra.items():
+        yield f', {ENCODER.encode(key)}: {ENCODER.encode(value)}'
+    yield '}'
+
+
+class JsonResultStream:
+    """
+    Iterable response body for StreamingHttpResponse.
+    
+    Django calls close() when the response finishes, even if the body was never
+    iterated, which releases the cursor behind the rows.
+    """
+    
+    def __init__(self, columns, rows, on_row=None, trailer=None, ticket=None):
+        self.rows = rows
+        self._chunks = iter_json_result(columns, rows, on_row, trailer, ticket)
+    
+    def __iter__(self):
+        return self._chunks
+    
+    def close(self):
+        self._chunks.close()
+        if hasattr(self.rows, 'close'):
+            self.rows.close()
+
+
+def stream_result_response(columns, rows, on_row=None, trailer=None, ticket=None):
+    """
+    Build a StreamingHttpResponse that encodes rows as they are fetched.
+    
+    Args:
+        columns (list): Column names for each row tuple
+        rows (iterable): Row tuples, consumed lazily
+        on_row (callable): Optional callback invoked with each row tuple
+        trailer (callable): Optional callable returning extra keys for the response
+        ticket (SubmissionTicket): Submission the rows belong to, see iter_json_result
+    
+    Returns:
+        StreamingHttpResponse with an application/json body
+    """
+    return StreamingHttpResponse(
+        JsonResultStream(columns, rows, on_row, trailer, ticket),
+        content_type='application/json',
+    )
@@ -0,0 +1,122 @@
+"""
+Submission Log
+Records graded attempts without putting a database write on the grading path.
+
+Attempts are appended to an in-memory buffer and written with bulk_create in
+one transaction per batch, either by a background thread every
+SUBMISSION_LOG_FLUSH_INTERVAL seconds or as soon as SUBMISSION_LOG_BATCH_SIZE
+attempts are waiting. Each batch also updates the precomputed exercise
+analytics in the same transaction.
+"""
+
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .analytics import ExerciseAnalytics
+from .models import Submission
+from .validators import QueryNormalizer
+
+
+logger = logging.getLogger(__name__)
+
+
+class SubmissionLog:
+    """Write-behind buffer of Submission rows."""
+    
+    def __init__(self):
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.dropped = 0
+    
+    def record(self, exercise, session_key, query, verdict, latency_ms):
+        """
+        Buffer one graded attempt. Returns immediately.
+        
+        Args:
+            exercise (str): Exercise key, e.g. 'primm1_modify' or 'custom:3:make'
+            session_key (str): Session the attempt belongs to
+            query (str): The submitted query, stored as is next to its fingerprint
+            verdict (str): One of Submission.VERDICT_CHOICES
+            latency_ms (float): Time spent grading the attempt
+        """
+        if not settings.SUBMISSION_LOG_ENABLED:
+            return
+        
+        submission = Submission(
+            exercise=exercise,
+            session_key=session_key or '',
+            query=query,
+            fingerprint=QueryNormalizer.fingerprint(query),
+            verdict=verdict,
+            latency_ms=latency_ms,
+            created_at=timezone.now(),
+        )
+        
+        with self._lock:
+            self._buffer.append(submission)
+            overflow = len(self._buffer) - settings.SUBMISSION_LOG_MAX_BUFFER
+            if overflow > 0:
+                del self._buffer[:overflow]
+                self.dropped += overflow
+            pending = len(self._buffer)
+        
+        self._ensure_thread()
+        if pending >= settings.SUBMISSION_LOG_BATCH_SIZE:
+            self._wakeup.set()
+    
+    def flush(self):
+        """
+        Write all buffered attempts in a single transaction.
+        
+        Returns:
+            int: Number of attempts written
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            
+            if not batch:
+                return 0
+            
+            try:
+                with transaction.atomic(using='default'):
+                    Submission.objects.using('default').bulk_create(batch)
+                    ExerciseAnalytics.apply(batch)
+            except Exception:
+                logger.exception("Failed to write %d submissions", len(batch))
+                with self._lock:
+                    self.dropped += len(batch)
+                return 0
+            
+            return len(batch)
+    
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='submission-log', daemon=True
+                )
+                self._thread.start()
+    
+    def _run(self):
+        while True:
+            self._wakeup.wait(settings.SUBMISSION_LOG_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            self.flush()
+            close_old_connections()
+
+
+submission_log = SubmissionLog()
+
+# The flush thread is a daemon, so write whatever is left when the worker exits
+atexit.register(submission_log.flush)
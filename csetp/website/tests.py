@@ -1,3 +1,1516 @@
-from django.test import TestCase
+import bisect
+import datetime
+import decimal
+import hashlib
+import io
+import itertools
+import json
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import dataset, performance, streaming
+from .analytics import SOLVE_TIME_BUCKETS, ExerciseAnalytics, median_from_histogram, record_wrong_answer
+from .comparison import COMPARE_DATABASE, COMPARE_PYTHON, DatabaseComparator
+from .cross_check import CrossCheck
+from .executor import QueryExecutor
+from .exercises import GRADING_ROWS, Exercise, ExerciseRegistry, TableRewriter, exercise_registry
+from .inflight import SUPERSEDED_RESPONSE, InFlightRegistry
+from .jobs import JOB_HANDLERS, JobQueue
+from .memory_dataset import memory_dataset
+from .memory_profiler import _tracing_lock, memory_stats
+from .models import (
+    CustomQuestionSet, DatasetVersion, Employee, ExerciseStats, Job, Project, SessionProgress, Submission
+)
+from .performance import PerformanceProbe
+from .progress import CANCELLED_MESSAGE, QueryRun
+from .query_log import TOP_ORDERINGS, QueryLog
+from .question_sets import EXPORT_FIELDS, QuestionSetImporter, iter_jsonl, read_entries, write_zip
+from .request_profiler import PROFILE_HEADER, _profiling_lock, list_profiles, make_token
+from .sandbox import SandboxRegistry
+from .single_flight import FINGERPRINT, PLAIN, SingleFlight, fcntl
+from .streaming import iter_json_result, stream_result_response
+from .submissions import SubmissionLog, submission_log
+from .validators import QueryComparator, ResultMatcher, SandboxValidator, SQLValidator
+from .views import _check_row
+from .warmup import WarmupState, run_warmup, serves_requests
+
+
+# Every test dataset gets a version of its own, so nothing cached for an
+# earlier test's data (in-memory copies, expected results) is reused
+_versions = itertools.count(1000)
+
+DEPARTMENTS = ['IT', 'IT', 'IT', 'HR', 'Sales', 'Sales', 'Marketing', 'Operations']
+
+
+def setUpModule():
+    # Graded submissions share expected results through SINGLE_FLIGHT_DIR;
+    # keep the files of this run to themselves. They are not logged either:
+    # the log's flush thread would write to the test database while a later
+    # test does, and SQLite's shared cache fails rather than waits on that
+    global _single_flight_dir, _module_settings
+    _single_flight_dir = tempfile.TemporaryDirectory()
+    _module_settings = override_settings(
+        SINGLE_FLIGHT_DIR=Path(_single_flight_dir.name), SUBMISSION_LOG_ENABLED=False
+    )
+    _module_settings.enable()
+
+
+def tearDownModule():
+    _module_settings.disable()
+    _single_flight_dir.cleanup()
+
+
+def create_dataset():
+    """Fill the employees and projects tables with a small dataset."""
+    employees = [
+        Employee.objects.create(
+            first_name=f'First{i}',
+            last_name=f'Last{i}',
+            email=f'employee{i}@example.com',
+            job_title='Software Engineer' if i % 2 else 'Analyst',
+            department=department,
+            salary=50000 + i * 1000,
+        )
+        for i, department in enumerate(DEPARTMENTS)
+    ]
+    for i, employee in enumerate(employees[:5]):
+        Project.objects.create(
+            project_name=f'Project{i}',
+            start_date=datetime.date(2024, 1, 1) + datetime.timedelta(days=30 * i),
+            employee=employee,
+        )
+    DatasetVersion.objects.update_or_create(pk=1, defaults={'version': next(_versions)})
+    dataset._cache['version'] = None
+    return employees
+
+
+def create_question_set(modify_correct_query="SELECT first_name FROM employees WHERE department = 'IT'",
+                        make_correct_query="SELECT count(*) AS n FROM employees", **fields):
+    """Create a custom question set on the employees table."""
+    return CustomQuestionSet.objects.create(
+        name='Test set',
+        predict_query='SELECT first_name FROM employees',
+        predict_option1='a', predict_option2='b', predict_option3='c', predict_option4='d',
+        predict_correct_answer=1,
+        investigate_q1='q1', investigate_a1='a1',
+        investigate_q2='q2', investigate_a2='a2',
+        investigate_q3='q3', investigate_a3='a3',
+        modify_task='Modify it', modify_initial_query='SELECT first_name FROM employees',
+        modify_correct_query=modify_correct_query,
+        make_task='Make it', make_correct_query=make_correct_query,
+        **fields,
+    )
+
+
+def submit(client, url, query, **extra):
+    """POST a query as the frontend does and return the decoded JSON answer."""
+    response = client.post(url, json.dumps({'query': query, **extra}), content_type='application/json')
+    body = b''.join(response.streaming_content) if response.streaming else response.content
+    return json.loads(body)
+
+
+def make_exercise(expected_sql, **options):
+    """Build a rows-graded exercise on the dataset tables."""
+    options.setdefault('cross_check_copies', 3)
+    options.setdefault('cross_check_budget_ms', 10_000)
+    return Exercise(
+        key=f"test:{next(_versions)}",
+        grading=GRADING_ROWS,
+        show_result=False,
+        rewrite_tables=TableRewriter(None),
+        expected_sql=expected_sql,
+        tables=frozenset({'employees', 'projects'}),
+        **options,
+    )
+
+
+class MemoryDatasetTests(TransactionTestCase):
+    """The in-memory copy holds only the dataset tables and is shared by threads."""
+    
+    def setUp(self):
+        create_dataset()
+    
+    def test_copy_holds_only_dataset_tables(self):
+        image = memory_dataset.image(dataset.current_version())
+        copy = sqlite3.connect(':memory:')
+        copy.deserialize(image)
+        tables = {name for (name,) in copy.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )}
+        self.assertEqual(tables, {'employees', 'projects'})
+        self.assertEqual(copy.execute('SELECT count(*) FROM employees').fetchone()[0], len(DEPARTMENTS))
+        # Indexes come along, so plans match the database
+        self.assertTrue(copy.execute("SELECT count(*) FROM sqlite_master WHERE type = 'index'").fetchone()[0])
+    
+    def test_threads_share_one_copy(self):
+        names = []
+        
+        def connect():
+            connection = memory_dataset.connection()
+            names.append(connection.execute('PRAGMA database_list').fetchone()[2])
+        
+        threads = [threading.Thread(target=connect) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(names), 3)
+        self.assertEqual(len(set(names)), 1)
+    
+    def test_copy_is_read_only(self):
+        success, result = QueryExecutor.execute_query('SELECT count(*) AS n FROM employees')
+        self.assertEqual((success, result), (True, [{'n': len(DEPARTMENTS)}]))
+        with self.assertRaises(sqlite3.OperationalError):
+            memory_dataset.connection().execute('DELETE FROM employees')
+
+
+IT_SALARIES = "SELECT first_name, salary FROM employees WHERE department = 'IT'"
+# Right for the real data only
+IT_SALARIES_HARD_CODED = (
+    "SELECT 'First0' AS first_name, 50000 AS salary "
+    "UNION ALL SELECT 'First1', 51000 UNION ALL SELECT 'First2', 52000"
+)
+
+
+class CrossCheckTests(TransactionTestCase):
+    """A correct answer must also hold on every perturbed copy, and be checked on all of them."""
+    
+    def setUp(self):
+        create_dataset()
+    
+    def test_correct_query_passes(self):
+        for comparison in (COMPARE_PYTHON, COMPARE_DATABASE):
+            exercise = make_exercise(IT_SALARIES, comparison=comparison)
+            cross_check = CrossCheck.start(exercise, IT_SALARIES)
+            self.assertTrue(CrossCheck.confirm(cross_check, True))
+            self.assertFalse(cross_check.failed or cross_check.unverified)
+    
+    def test_hard_coded_answer_fails(self):
+        success, result = QueryExecutor.execute_query(IT_SALARIES_HARD_CODED)
+        self.assertTrue(success)
+        self.assertEqual(len(result), 3)
+        for comparison in (COMPARE_PYTHON, COMPARE_DATABASE):
+            exercise = make_exercise(IT_SALARIES, comparison=comparison)
+            cross_check = CrossCheck.start(exercise, IT_SALARIES_HARD_CODED)
+            self.assertFalse(CrossCheck.confirm(cross_check, True))
+            self.assertTrue(cross_check.failed)
+    
+    def test_variants_out_of_time_are_unverified(self):
+        exercise = make_exercise(IT_SALARIES, cross_check_budget_ms=0)
+        cross_check = CrossCheck.start(exercise, IT_SALARIES_HARD_CODED)
+        self.assertFalse(CrossCheck.confirm(cross_check, True))
+        self.assertTrue(cross_check.unverified)
+        self.assertFalse(cross_check.failed)
+    
+    def test_variant_errors_are_unverified(self):
+        exercise = make_exercise(IT_SALARIES)
+        with mock.patch.object(Exercise, 'expected_variant', side_effect=RuntimeError('pool broken')):
+            cross_check = CrossCheck.start(exercise, IT_SALARIES)
+            self.assertFalse(CrossCheck.confirm(cross_check, True))
+        self.assertTrue(cross_check.unverified)
+    
+    def test_wrong_row_stops_cross_check(self):
+        exercise = make_exercise(IT_SALARIES)
+        success, expected = exercise.expected()
+        self.assertTrue(success)
+        cross_check = CrossCheck.start(exercise, IT_SALARIES)
+        matcher = ResultMatcher(expected)
+        _check_row(matcher, cross_check, {'first_name': 'Nobody', 'salary': 1})
+        self.assertTrue(cross_check.cancelled)
+        self.assertFalse(CrossCheck.confirm(cross_check, matcher.matches()))
+
+
+class SingleStatementTests(SimpleTestCase):
+    """Submissions hold exactly one statement; only a trailing ';' and comments may follow it."""
+    
+    def test_trailing_semicolons_and_comments_are_stripped(self):
+        for query in ('SELECT 1', 'SELECT 1;', 'SELECT 1; -- done', 'SELECT 1 ;; /* done */ ;\n'):
+            self.assertEqual(SQLValidator.single_statement(query), 'SELECT 1', query)
+    
+    def test_quoted_semicolons_do_not_separate(self):
+        for query in ("SELECT ';' AS a", 'SELECT "a;b" FROM employees', "/* ; */ SELECT 1",
+                      "SELECT 1 -- ;\nFROM employees", "SELECT 'it''s; fine'"):
+            self.assertEqual(SQLValidator.single_statement(query), query, query)
+    
+    def test_several_statements_are_refused(self):
+        for query in ('SELECT 1; COMMIT; DROP TABLE employees', 'SELECT 1;; SELECT 2',
+                      "SELECT 'a'; DELETE FROM employees -- ;",
+                      # Backslash escapes and dollar quotes are read differently
+                      # by each database, so every semicolon counts
+                      "SELECT E'\\''; COMMIT; --'", 'SELECT $$;$$'):
+            self.assertIsNone(SQLValidator.single_statement(query), query)
+            self.assertEqual(SQLValidator(query).validate(), (False, SQLValidator.MULTIPLE_STATEMENTS_MESSAGE))
+    
+    def test_sandbox_index_statements(self):
+        self.assertEqual(SandboxValidator('CREATE INDEX e ON employees (salary);').validate(), (True, None))
+        self.assertFalse(SandboxValidator('CREATE INDEX e ON employees (salary); DROP TABLE employees').validate()[0])
+
+
+class ExecutorSafetyTests(TransactionTestCase):
+    """What a query may do is enforced when it runs, whatever the validator let through."""
+    
+    databases = {'default', 'exercise'}
+    
+    def setUp(self):
+        create_dataset()
+    
+    def assertDatasetIntact(self):
+        self.assertEqual(Employee.objects.count(), len(DEPARTMENTS))
+    
+    def aliases(self):
+        return ['memory', settings.EXERCISE_DB_ALIAS]
+    
+    def test_writes_are_not_authorized(self):
+        for using in self.aliases():
+            for query in ('DELETE FROM employees', "UPDATE employees SET salary = 0",
+                          'PRAGMA query_only = OFF', "ATTACH DATABASE ':memory:' AS other"):
+                success, message = QueryExecutor.execute_query(query, using)
+                self.assertFalse(success, (using, query))
+                self.assertIn('Unsafe query', message)
+        self.assertDatasetIntact()
+    
+    def test_only_exercise_tables_are_readable(self):
+        for using in self.aliases():
+            for query in ('SELECT * FROM django_session', 'SELECT * FROM sqlite_master'):
+                success, message = QueryExecutor.execute_query(query, using)
+                self.assertFalse(success, (using, query))
+            success, _ = QueryExecutor.execute_query('SELECT * FROM projects', using, tables={'employees'})
+            self.assertFalse(success)
+            success, _ = QueryExecutor.execute_query(
+                'WITH it AS (SELECT * FROM employees) SELECT count(*) AS n FROM it', using, tables={'employees'}
+            )
+            self.assertTrue(success)
+    
+    def test_several_statements_are_refused(self):
+        query = 'SELECT 1; DELETE FROM employees'
+        for using in self.aliases():
+            self.assertEqual(
+                QueryExecutor.execute_query(query, using), (False, SQLValidator.MULTIPLE_STATEMENTS_MESSAGE)
+            )
+            success, results = QueryExecutor.execute_batch(['SELECT 1 AS n', query], using)
+            self.assertTrue(success)
+            self.assertEqual(results[0], (True, (['n'], [(1,)])))
+            self.assertEqual(results[1], (False, SQLValidator.MULTIPLE_STATEMENTS_MESSAGE))
+            self.assertFalse(QueryExecutor.stream_query(query, using)[0])
+            self.assertFalse(QueryExecutor.execute_query_single_value(query, using)[0])
+        self.assertEqual(QueryExecutor.execute_query('SELECT 1 AS n; -- done'), (True, [{'n': 1}]))
+        self.assertDatasetIntact()
+
+
+@skipUnless(connections[settings.EXERCISE_DB_ALIAS].vendor == 'postgresql',
+            "the exercise database is not PostgreSQL")
+class PostgreSQLSafetyTests(TransactionTestCase):
+    """psycopg runs every statement of a query without parameters, so it must never see more than one."""
+    
+    databases = {'default', 'exercise'}
+    
+    def setUp(self):
+        create_dataset()
+    
+    def test_snapshot_batch_cannot_commit(self):
+        success, results = QueryExecutor.execute_batch(
+            ['SELECT 1; COMMIT; DELETE FROM employees'], settings.EXERCISE_DB_ALIAS
+        )
+        self.assertTrue(success)
+        self.assertEqual(results, [(False, SQLValidator.MULTIPLE_STATEMENTS_MESSAGE)])
+        self.assertEqual(Employee.objects.count(), len(DEPARTMENTS))
+    
+    def test_transaction_is_read_only(self):
+        for query in ('DELETE FROM employees', 'SELECT 1 FROM employees FOR UPDATE'):
+            success, _ = QueryExecutor.execute_query(query, settings.EXERCISE_DB_ALIAS)
+            self.assertFalse(success, query)
+        self.assertEqual(Employee.objects.count(), len(DEPARTMENTS))
+
+
+class DatabaseComparatorTests(TransactionTestCase):
+    """The in-database comparison agrees with QueryComparator, except where documented."""
+    
+    def setUp(self):
+        create_dataset()
+    
+    def compare(self, user_query, expected_query):
+        """Return the verdicts of the database and the Python comparison."""
+        success, comparison = DatabaseComparator.compare(user_query, expected_query)
+        self.assertTrue(success, comparison)
+        _, user_result = QueryExecutor.execute_query(user_query)
+        _, expected_result = QueryExecutor.execute_query(expected_query)
+        return comparison['matches'], QueryComparator.compare_results(user_result, expected_result)
+    
+    def test_trailing_semicolons_and_comments(self):
+        self.assertEqual(
+            self.compare('SELECT first_name FROM employees; -- done', 'SELECT first_name FROM employees;\n'),
+            (True, True)
+        )
+        self.assertEqual(
+            self.compare('SELECT first_name FROM employees /* all of them */ ;;', 'SELECT first_name FROM employees'),
+            (True, True)
+        )
+    
+    def test_several_statements_are_refused(self):
+        self.assertEqual(
+            DatabaseComparator.compare('SELECT 1 AS n; SELECT 2 AS n', 'SELECT 1 AS n'),
+            (False, SQLValidator.MULTIPLE_STATEMENTS_MESSAGE)
+        )
+    
+    def test_whitespace_and_null_match_python(self):
+        # str.strip() also removes tabs, newlines and no-break spaces, str(None) is 'None'
+        user_query = ("SELECT char(9) || first_name || char(10, 160) AS first_name, "
+                      "'  ' || department || char(13) AS department, NULL AS note FROM employees")
+        expected_query = "SELECT UPPER(first_name) AS first_name, department, 'None' AS note FROM employees"
+        self.assertEqual(self.compare(user_query, expected_query), (True, True))
+        self.assertEqual(
+            self.compare("SELECT char(11) || 'x' AS a", "SELECT 'y' AS a"), (False, False)
+        )
+    
+    def test_non_ascii_case_differs_on_sqlite(self):
+        # Documented in comparison.py: SQLite's LOWER() only folds ASCII letters
+        self.assertEqual(self.compare("SELECT 'ÉMILE' AS a", "SELECT 'Émile' AS a"), (True, True))
+        self.assertEqual(self.compare("SELECT 'ÉMILE' AS a", "SELECT 'émile' AS a"), (False, True))
+
+class ResultDiffTests(SimpleTestCase):
+    """Wrong row results are described as missing and extra rows and columns."""
+    
+    EXPECTED = [{'name': 'Ann', 'salary': 1}, {'name': 'Bob', 'salary': 2}, {'name': 'Cy', 'salary': 3}]
+    
+    def diff(self, user_result, expected_result=None, **options):
+        expected_result = self.EXPECTED if expected_result is None else expected_result
+        return QueryComparator.diff_results(user_result, expected_result, **options)
+    
+    def test_missing_and_extra_rows(self):
+        diff = self.diff([{'name': 'Ann', 'salary': 1}, {'name': 'Dee', 'salary': 4}])
+        self.assertEqual((diff['missing_count'], diff['extra_count']), (2, 1))
+        self.assertCountEqual(diff['missing_rows'], [{'name': 'bob', 'salary': '2'}, {'name': 'cy', 'salary': '3'}])
+        self.assertEqual(diff['extra_rows'], [{'name': 'dee', 'salary': '4'}])
+        self.assertEqual((diff['missing_columns'], diff['extra_columns']), ([], []))
+    
+    def test_matching_result_has_empty_diff(self):
+        diff = self.diff([{'salary': 3, 'name': ' CY '}, {'name': 'bob', 'salary': 2}, {'name': 'Ann', 'salary': 1}])
+        self.assertEqual(
+            (diff['missing_count'], diff['extra_count'], diff['missing_rows'], diff['extra_rows']), (0, 0, [], [])
+        )
+    
+    def test_duplicates_are_counted(self):
+        ann = {'name': 'Ann', 'salary': 1}
+        diff = self.diff([ann, ann, ann], expected_result=[ann, ann])
+        self.assertEqual((diff['missing_count'], diff['extra_count']), (0, 1))
+        diff = self.diff([ann], expected_result=[ann, ann, ann])
+        self.assertEqual((diff['missing_count'], diff['extra_count']), (2, 0))
+        self.assertEqual(diff['missing_rows'], [{'name': 'ann', 'salary': '1'}] * 2)
+    
+    def test_column_mismatch(self):
+        diff = self.diff([{'name': 'Ann', 'pay': 1}])
+        self.assertEqual((diff['missing_columns'], diff['extra_columns']), (['salary'], ['pay']))
+        self.assertEqual((diff['missing_count'], diff['extra_count']), (3, 1))
+    
+    def test_renamed_fields(self):
+        rename = {'employee': 'name'}
+        user_result = [{'employee': name, 'salary': salary} for name, salary in (('Ann', 1), ('Bob', 2), ('Cy', 3))]
+        diff = self.diff(user_result, rename_fields=rename)
+        self.assertEqual((diff['missing_count'], diff['extra_count'], diff['extra_columns']), (0, 0, []))
+        diff = self.diff(user_result[:1] + [{'employee': 'Dee', 'salary': 4}], rename_fields=rename)
+        self.assertEqual(diff['extra_rows'], [{'name': 'dee', 'salary': '4'}])
+    
+    def test_example_rows_are_capped(self):
+        extra = [{'name': f'Extra{i}', 'salary': i} for i in range(10)]
+        diff = self.diff(extra, example_rows=2)
+        self.assertEqual((diff['missing_count'], diff['extra_count']), (3, 10))
+        self.assertEqual((len(diff['missing_rows']), len(diff['extra_rows'])), (2, 2))
+        diff = self.diff([], expected_result=[{'name': 'Ann'}] * 10)
+        self.assertEqual(len(diff['missing_rows']), ResultMatcher.DIFF_EXAMPLE_ROWS)
+    
+    def test_columns_in_user_order(self):
+        matcher = ResultMatcher(QueryComparator.fingerprint_result(self.EXPECTED), columns=['salary', 'name'])
+        matcher.add({'salary': 9, 'name': 'Zed'})
+        self.assertEqual(list(matcher.diff()['extra_rows'][0]), ['salary', 'name'])
+
+
+class ResultDiffEndpointTests(TransactionTestCase):
+    """Wrong answers to exercises that show their result come back with the diff."""
+    
+    databases = {'default', 'exercise'}
+    
+    def setUp(self):
+        create_dataset()
+    
+    def test_built_in_modify(self):
+        query = "SELECT first_name, last_name, email FROM employees WHERE department = '{}'"
+        answer = submit(self.client, '/run-modified-query/', query.format('HR'))
+        self.assertFalse(answer['correct'])
+        diff = answer['diff']
+        self.assertEqual((diff['missing_count'], diff['extra_count']), (3, 1))
+        self.assertEqual(
+            diff['extra_rows'], [{'first_name': 'first3', 'last_name': 'last3', 'email': 'employee3@example.com'}]
+        )
+        self.assertNotIn('diff', submit(self.client, '/run-modified-query/', query.format('IT')))
+    
+    def test_custom_modify(self):
+        question_set = create_question_set()
+        answer = submit(
+            self.client, f'/api/custom-question/{question_set.pk}/run-modify/',
+            "SELECT first_name, salary FROM employees WHERE department = 'IT'"
+        )
+        self.assertFalse(answer['correct'])
+        self.assertEqual(answer['diff']['extra_columns'], ['salary'])
+        self.assertEqual((answer['diff']['missing_count'], answer['diff']['extra_count']), (3, 3))
+
+
+@override_settings(SUBMISSION_LOG_ENABLED=True)
+class SubmissionLoggingTests(TransactionTestCase):
+    """Every answer to a submission, failures included, is logged once."""
+    
+    databases = {'default', 'exercise'}
+    
+    def setUp(self):
+        create_dataset()
+        patcher = mock.patch.object(submission_log, 'record')
+        self.record = patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def verdicts(self):
+        return [call.kwargs['verdict'] for call in self.record.call_args_list]
+    
+    def grade(self, question_set, query, section='modify'):
+        return submit(self.client, f'/api/custom-question/{question_set.pk}/run-{section}/', query)
+    
+    def test_graded_answers(self):
+        question_set = create_question_set()
+        self.assertTrue(self.grade(question_set, "SELECT first_name FROM employees WHERE department = 'IT'")['correct'])
+        self.assertFalse(self.grade(question_set, 'SELECT first_name FROM employees')['correct'])
+        self.assertIn('error', self.grade(question_set, 'DELETE FROM employees'))
+        self.assertEqual(self.verdicts(), ['correct', 'incorrect', 'invalid'])
+    
+    def test_raw_query_is_stored(self):
+        query = "SELECT *  FROM employees WHERE last_name = 'O''Brien';"
+        log = SubmissionLog()
+        with mock.patch.object(log, '_ensure_thread'):
+            log.record('primm1_modify', 'session', query, 'incorrect', 1)
+        self.assertEqual(log.flush(), 1)
+        submission = Submission.objects.get()
+        self.assertEqual(submission.query, query)
+        self.assertEqual(submission.fingerprint, 'select * from employees where last_name = ?')
+        stats = ExerciseStats.objects.get(exercise='primm1_modify')
+        self.assertEqual(list(stats.wrong_answers), [submission.fingerprint])
+    
+    def test_failed_batch_is_dropped(self):
+        log = SubmissionLog()
+        with mock.patch.object(log, '_ensure_thread'):
+            log.record('primm1_modify', 'session', 'SELECT 1', 'correct', 1)
+        with mock.patch.object(ExerciseAnalytics, 'apply', side_effect=RuntimeError), \
+                self.assertLogs('website.submissions', 'ERROR'):
+            self.assertEqual(log.flush(), 0)
+        self.assertEqual(log.dropped, 1)
+        self.assertFalse(Submission.objects.exists())
+    
+    def test_failures_are_logged(self):
+        for mode, comparison in (('memory', 'python'), ('database', 'python'), ('database', 'database')):
+            with self.subTest(mode=mode, comparison=comparison), \
+                    override_settings(EXERCISE_EXECUTION_MODE=mode, RESULT_COMPARISON=comparison):
+                self.record.reset_mock()
+                # A broken expected query fails every submission
+                broken = create_question_set(
+                    modify_correct_query='SELECT missing FROM employees',
+                    make_correct_query='SELECT missing FROM employees',
+                )
+                working = create_question_set()
+                for question_set, section, query in (
+                    (working, 'modify', 'SELECT missing FROM employees'),
+                    (working, 'make', 'SELECT missing FROM employees'),
+                    (broken, 'modify', 'SELECT first_name FROM employees'),
+                    (broken, 'make', 'SELECT first_name FROM employees'),
+                ):
+                    self.assertIn('error', self.grade(question_set, query, section), (section, query))
+                self.assertEqual(self.verdicts(), ['error'] * 4)
+    
+    def test_unreadable_request_is_not_logged(self):
+        question_set = create_question_set()
+        response = self.client.post(
+            f'/api/custom-question/{question_set.pk}/run-modify/', 'not json', content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.verdicts(), [])
+
+class ExerciseAnalyticsTests(TransactionTestCase):
+    """Dashboard counters are maintained incrementally from logged batches."""
+    
+    def test_sketch_evicts_least_frequent(self):
+        sketch = {}
+        for fingerprint in ('a', 'a', 'a', 'b', 'b', 'c'):
+            record_wrong_answer(sketch, fingerprint, capacity=3)
+        self.assertEqual(sketch, {'a': [3, 0], 'b': [2, 0], 'c': [1, 0]})
+        # The newcomer replaces the minimum and inherits its count as an overestimate
+        record_wrong_answer(sketch, 'd', capacity=3)
+        self.assertEqual(sketch, {'a': [3, 0], 'b': [2, 0], 'd': [2, 1]})
+        record_wrong_answer(sketch, 'd', capacity=3)
+        self.assertEqual(sketch['d'], [3, 1])
+    
+    def test_median_from_histogram(self):
+        buckets = len(SOLVE_TIME_BUCKETS) + 1
+        self.assertIsNone(median_from_histogram([0] * buckets))
+        # Odd total: the middle attempt is halfway through the 30-60s bucket's two entries
+        self.assertEqual(median_from_histogram([1, 0, 2] + [0] * (buckets - 3)), 37.5)
+        # Even total: the median falls a third of the way into the 30-60s bucket
+        self.assertEqual(median_from_histogram([1, 0, 3] + [0] * (buckets - 3)), 40.0)
+        # The open-ended last bucket spans up to twice its lower bound
+        self.assertEqual(median_from_histogram([0] * (buckets - 1) + [2]), SOLVE_TIME_BUCKETS[-1] * 1.5)
+    
+    def test_sessions_across_flushes(self):
+        start = timezone.now()
+        
+        def attempt(session_key, verdict, seconds, query='SELECT 1'):
+            return Submission(
+                exercise='primm1_modify', session_key=session_key, query=query, fingerprint=query,
+                verdict=verdict, latency_ms=1, created_at=start + datetime.timedelta(seconds=seconds)
+            )
+        
+        ExerciseAnalytics.apply([attempt('retry', 'incorrect', 0, 'SELECT 2'), attempt('first', 'correct', 5)])
+        ExerciseAnalytics.apply([attempt('retry', 'correct', 45), attempt('first', 'correct', 50)])
+        
+        stats = ExerciseStats.objects.get(exercise='primm1_modify')
+        self.assertEqual(
+            (stats.attempts, stats.sessions, stats.first_try_correct, stats.solved_sessions), (4, 2, 1, 2)
+        )
+        # Time to solve is measured from each session's first attempt, in the earlier flush
+        self.assertEqual(stats.solve_time_histogram[0], 1)
+        self.assertEqual(stats.solve_time_histogram[bisect.bisect_left(SOLVE_TIME_BUCKETS, 45)], 1)
+        self.assertEqual(sum(stats.solve_time_histogram), 2)
+        self.assertEqual(list(stats.wrong_answers.values()), [[1, 0]])
+        self.assertEqual(
+            dict(SessionProgress.objects.values_list('session_key', 'attempts')), {'retry': 2, 'first': 2}
+        )
+
+
+class SupersessionTests(SimpleTestCase):
+    """A resubmission stops the submission it replaces, and that one says so."""
+    
+    def interrupted_rows(self, ticket=None):
+        yield (1,)
+        if ticket is not None:
+            ticket.supersede()
+        raise sqlite3.OperationalError('interrupted')
+    
+    def test_newer_ticket_supersedes(self):
+        registry = InFlightRegistry()
+        first = registry.begin('session', 'exercise')
+        stopped = []
+        first.attach(lambda: stopped.append(True))
+        second = registry.begin('session', 'exercise')
+        self.assertTrue(first.superseded)
+        self.assertEqual(stopped, [True])
+        self.assertFalse(second.superseded)
+        first.finish()
+        self.assertEqual(len(registry), 1)
+        second.finish()
+        self.assertEqual(len(registry), 0)
+    
+    def test_superseded_stream_reports_it(self):
+        ticket = InFlightRegistry().begin('session', 'exercise')
+        document = json.loads(''.join(iter_json_result(
+            ['n'], self.interrupted_rows(ticket), trailer=lambda: {'correct': True}, ticket=ticket
+        )))
+        # Rows still waiting for a full chunk are dropped with the cursor
+        self.assertEqual(document, {'result': [], **SUPERSEDED_RESPONSE})
+    
+    def test_interrupted_stream_without_supersession_is_a_timeout(self):
+        ticket = InFlightRegistry().begin('session', 'exercise')
+        document = json.loads(''.join(iter_json_result(['n'], self.interrupted_rows(), ticket=ticket)))
+        self.assertIn('took too long', document['error'])
+        self.assertNotIn('superseded', document)
+
+
+class SingleFlightTests(SimpleTestCase):
+    """Concurrent calls share one computation; other processes only ever get JSON."""
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings_override = override_settings(SINGLE_FLIGHT_DIR=self.directory, SINGLE_FLIGHT_WAIT=5)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.flight = SingleFlight()
+    
+    def run_concurrently(self, callers, compute, **options):
+        """Start callers threads on one key while compute is blocked; return their results."""
+        release = threading.Event()
+        results = []
+        
+        def blocked():
+            release.wait(5)
+            return compute()
+        
+        def call():
+            try:
+                results.append(self.flight.do('key', blocked, **options))
+            except Exception as e:
+                results.append(e)
+        
+        threads = [threading.Thread(target=call) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        while self.flight.stats()['joined'] < callers - 1:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        return results
+    
+    def test_concurrent_calls_compute_once(self):
+        computed = []
+        results = self.run_concurrently(4, lambda: computed.append(1) or len(computed))
+        self.assertEqual(results, [1] * 4)
+        self.assertEqual(self.flight.stats(), {'computed': 1, 'joined': 3, 'shared': 0})
+        # Nothing is kept once the call is over
+        self.assertEqual(self.flight.do('key', lambda: 'again'), 'again')
+    
+    def test_errors_are_shared(self):
+        def fail():
+            raise ValueError('broken')
+        
+        results = self.run_concurrently(3, fail)
+        self.assertEqual([type(result) for result in results], [ValueError] * 3)
+    
+    def test_in_process_only_without_codec(self):
+        self.assertEqual(self.flight.do('key', lambda: [1, 2]), [1, 2])
+        self.assertEqual(list(self.directory.iterdir()), [])
+    
+    def test_fingerprint_round_trip(self):
+        fingerprint = QueryComparator.fingerprint_result(
+            [{'name': 'Ann', 'salary': 1}, {'name': 'Ann', 'salary': 1}, {'name': 'Bob', 'salary': None}]
+        )
+        codec = FINGERPRINT.result()
+        self.assertEqual(codec.decode(json.loads(json.dumps(codec.encode((True, fingerprint))))), (True, fingerprint))
+        self.assertEqual(codec.decode(codec.encode((False, 'failed'))), (False, 'failed'))
+    
+    def hold_lock(self, key, value=None, codec=PLAIN):
+        """Play another process: hold the key's lock file, then leave value (as JSON) and release."""
+        name = hashlib.sha1(key.encode()).hexdigest()
+        lock_file = open(self.directory / f"{name}.lock", 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        
+        def finish(result_bytes=None):
+            if result_bytes is not None:
+                (self.directory / f"{name}.json").write_bytes(result_bytes)
+            elif value is not None:
+                (self.directory / f"{name}.json").write_text(
+                    json.dumps({'finished_at': time.time(), 'value': codec.encode(value)})
+                )
+            lock_file.close()
+        return finish
+    
+    def call_in_thread(self, key, compute, codec):
+        results = []
+        thread = threading.Thread(target=lambda: results.append(self.flight.do(key, compute, shared=codec)))
+        thread.start()
+        time.sleep(0.1)
+        return thread, results
+    
+    @skipIf(fcntl is None, "no flock on this platform")
+    def test_result_of_other_process_is_used(self):
+        release = self.hold_lock('key', 42)
+        thread, results = self.call_in_thread('key', lambda: 'computed', PLAIN)
+        release()
+        thread.join()
+        self.assertEqual(results, [42])
+        self.assertEqual(self.flight.stats()['shared'], 1)
+    
+    @skipIf(fcntl is None, "no flock on this platform")
+    def test_pickled_result_is_never_loaded(self):
+        class Boom:
+            def __reduce__(self):
+                return (os.abort, ())
+        
+        release = self.hold_lock('key')
+        thread, results = self.call_in_thread('key', lambda: 'computed', PLAIN)
+        release(pickle.dumps((time.time(), Boom())))
+        thread.join()
+        self.assertEqual(results, ['computed'])
+    
+    @skipIf(fcntl is None, "no flock on this platform")
+    def test_large_and_non_json_values_are_not_written(self):
+        with override_settings(SINGLE_FLIGHT_SHARED_MAX_BYTES=100):
+            self.flight.do('large', lambda: 'x' * 200, shared=PLAIN)
+            self.flight.do('decimal', lambda: decimal.Decimal('1.5'), shared=PLAIN)
+            self.flight.do('small', lambda: 7, shared=PLAIN)
+        self.assertEqual(len(list(self.directory.glob('*.json'))), 1)
+    
+    @skipIf(fcntl is None, "no flock on this platform")
+    def test_prune_keeps_held_lock_files(self):
+        release = self.hold_lock('held')
+        idle = self.directory / 'idle.lock'
+        idle.touch()
+        stale = time.time() - 3600
+        for path in self.directory.iterdir():
+            os.utime(path, (stale, stale))
+        with override_settings(SINGLE_FLIGHT_FILE_TTL=60):
+            self.flight.do('other', lambda: 1, shared=PLAIN)
+        names = {path.name for path in self.directory.iterdir()}
+        self.assertNotIn('idle.lock', names)
+        self.assertEqual(len([name for name in names if name.endswith('.lock')]), 2)
+        release()
+
+
+class PredictStreamingTests(TransactionTestCase):
+    """Predict queries stream their rows rather than sharing a materialized list."""
+    
+    def setUp(self):
+        create_dataset()
+    
+    def test_join_predict_streams(self):
+        response = self.client.get('/run-sql-query-join/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(json.loads(b''.join(response.streaming_content))['result']), 5)
+    
+    def test_custom_predict_streams(self):
+        question_set = create_question_set()
+        response = self.client.get(f'/api/custom-question/{question_set.pk}/run-predict/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(json.loads(b''.join(response.streaming_content))['result']), len(DEPARTMENTS))
+
+
+class PerformanceProbeTests(TransactionTestCase):
+    """Timing comes from the grading run; the probe only plans, and is dropped when late."""
+    
+    databases = {'default', 'exercise'}
+    
+    def setUp(self):
+        create_dataset()
+    
+    def test_grading_run_is_not_repeated(self):
+        question_set = create_question_set(performance_feedback=True)
+        with override_settings(RESULT_COMPARISON=COMPARE_PYTHON), \
+                mock.patch.object(performance, 'measure', side_effect=AssertionError('query ran again')):
+            answer = submit(
+                self.client, f'/api/custom-question/{question_set.pk}/run-modify/',
+                "SELECT first_name FROM employees WHERE department = 'IT'", performance=True
+            )
+        self.assertTrue(answer['correct'])
+        measurement = answer['performance']
+        self.assertNotIn('error', measurement)
+        self.assertEqual(measurement['rows_returned'], 3)
+        self.assertIsNotNone(measurement['elapsed_ms'])
+        self.assertEqual(measurement['rows_scanned'], len(DEPARTMENTS))
+        self.assertTrue(measurement['plan'])
+    
+    def test_scaled_probe_times_the_copy(self):
+        exercise = make_exercise(IT_SALARIES, performance_feedback=True)
+        probe = PerformanceProbe.start(exercise, IT_SALARIES, {'performance': True, 'scale': '1k'})
+        measurement = probe.result()
+        self.assertEqual(measurement['scale'], '1k')
+        self.assertGreater(measurement['rows_returned'], 3)
+        self.assertEqual(measurement['tables']['employees'], 1000)
+    
+    @override_settings(PERFORMANCE_WAIT_MS=50)
+    def test_late_probe_is_dropped(self):
+        exercise = make_exercise(IT_SALARIES, performance_feedback=True)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        with mock.patch.object(performance, 'plan', side_effect=lambda *args: release.wait(5) and {}):
+            probe = PerformanceProbe.start(exercise, IT_SALARIES, {'performance': True})
+            self.assertEqual(probe.result(), {'scale': None, 'error': performance.DROPPED_MESSAGE})
+        self.assertTrue(probe.ticket.superseded)
+    
+    @override_settings(PERFORMANCE_WAIT_MS=50)
+    def test_scaled_copy_still_building(self):
+        exercise = make_exercise(IT_SALARIES, performance_feedback=True)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        with mock.patch.object(performance.memory_dataset, 'load_scaled', side_effect=lambda *args: release.wait(5)):
+            probe = PerformanceProbe.start(exercise, IT_SALARIES, {'performance': True, 'scale': '1k'})
+            self.assertEqual(
+                probe.result(), {'scale': '1k', 'error': performance.BUILDING_MESSAGE.format(scale='1k')}
+            )
+            # The build goes on for the next request; only the timing is dropped
+            release.set()
+            self.assertIn('error', probe.future.result(5))
+        self.assertTrue(probe.built.is_set())
+    
+    def test_table_rows_for_current_version_only(self):
+        self.assertEqual(performance.plan(IT_SALARIES)['tables']['employees'], len(DEPARTMENTS))
+        Employee.objects.create(
+            first_name='New', last_name='Hire', email='new@example.com', job_title='Analyst',
+            department='IT', salary=40000
+        )
+        DatasetVersion.objects.update_or_create(pk=1, defaults={'version': next(_versions)})
+        dataset._cache['version'] = None
+        self.assertEqual(performance.plan(IT_SALARIES)['tables']['employees'], len(DEPARTMENTS) + 1)
+        self.assertEqual(performance._table_rows_version, dataset.current_version())
+        self.assertEqual(list(performance._table_rows), [QueryExecutor.default_alias()])
+    
+    @skipIf(os.environ.get('CSETP_PERFORMANCE_LARGE_SCALES') == '1', "million-row scale enabled")
+    def test_million_rows_need_opt_in(self):
+        exercise = make_exercise(IT_SALARIES, performance_feedback=True)
+        probe = PerformanceProbe.start(exercise, IT_SALARIES, {'performance': True, 'scale': '1m'})
+        self.assertIn('Unknown scale', probe.result()['error'])
+
+
+class SandboxValidatorTests(SimpleTestCase):
+    """Sandboxes accept queries and index statements, one at a time, and nothing else."""
+    
+    def test_index_statements(self):
+        for query in (
+            'CREATE INDEX idx_salary ON employees (salary)',
+            'create unique index idx_email on employees(email);',
+            'DROP INDEX idx_salary',
+            'ANALYZE',
+            'REINDEX employees',
+            '-- after the index\nSELECT * FROM employees WHERE salary > 50000',
+        ):
+            with self.subTest(query=query):
+                validator = SandboxValidator(query)
+                self.assertEqual(validator.validate(), (True, None))
+        self.assertTrue(SandboxValidator('/* x */ CREATE INDEX i ON employees (salary)').is_schema_change())
+        self.assertFalse(SandboxValidator('SELECT 1').is_schema_change())
+    
+    def test_other_statements(self):
+        for query in (
+            'DROP TABLE employees',
+            'DELETE FROM employees',
+            'CREATE TABLE copy AS SELECT * FROM employees',
+            'CREATE TRIGGER t AFTER INSERT ON employees BEGIN SELECT 1; END',
+            'CREATE INDEX i ON employees (salary); DROP TABLE employees',
+            'ANALYZE; DELETE FROM employees',
+        ):
+            with self.subTest(query=query):
+                is_valid, error = SandboxValidator(query).validate()
+                self.assertFalse(is_valid)
+                self.assertTrue(error.startswith('❌'))
+
+
+class SandboxTests(TransactionTestCase):
+    """Each session gets its own copy to index; the shared dataset never changes."""
+    
+    databases = {'default', 'exercise'}
+    
+    QUERY = 'SELECT first_name FROM employees WHERE salary = 53000'
+    
+    def setUp(self):
+        create_dataset()
+        self.addCleanup(self.reset, self.client)
+    
+    def run_statement(self, client, query, **extra):
+        return submit(client, '/api/sandbox/run/', query, **extra)
+    
+    def reset(self, client):
+        return client.post('/api/sandbox/reset/')
+    
+    def plan(self, answer):
+        return ' '.join(step['detail'] for step in answer['plan'])
+    
+    def has_index(self, answer):
+        return 'idx_salary' in [index['name'] for index in answer['sandbox']['indexes']]
+    
+    def test_index_changes_the_plan(self):
+        before = self.run_statement(self.client, self.QUERY)
+        self.assertEqual(before['rows'], [{'first_name': 'First3'}])
+        self.assertEqual(before['rows_scanned'], len(DEPARTMENTS))
+        self.assertIn('SCAN', self.plan(before))
+        
+        created = self.run_statement(self.client, 'CREATE INDEX idx_salary ON employees (salary);; -- done')
+        self.assertNotIn('error', created)
+        self.assertTrue(self.has_index(created))
+        
+        after = self.run_statement(self.client, self.QUERY + ';;')
+        self.assertEqual(after['rows'], before['rows'])
+        self.assertIn('idx_salary', self.plan(after))
+        self.assertEqual(after['rows_scanned'], 0)
+    
+    def test_sessions_are_isolated(self):
+        other = self.client_class()
+        self.addCleanup(self.reset, other)
+        self.run_statement(self.client, 'CREATE INDEX idx_salary ON employees (salary)')
+        self.run_statement(other, 'SELECT 1')
+        
+        self.assertFalse(self.has_index(self.run_statement(other, 'SELECT 1')))
+        self.assertTrue(self.has_index(self.run_statement(self.client, 'SELECT 1')))
+        # Neither the shared copy nor the database got the index
+        shared_indexes = memory_dataset.connection().execute(
+            "SELECT count(*) FROM sqlite_master WHERE name = 'idx_salary'"
+        ).fetchone()[0]
+        self.assertEqual(shared_indexes, 0)
+        self.assertEqual(QueryExecutor.execute_query(self.QUERY), (True, [{'first_name': 'First3'}]))
+    
+    def test_reset_starts_over(self):
+        self.run_statement(self.client, 'CREATE INDEX idx_salary ON employees (salary)')
+        self.assertEqual(self.reset(self.client).json(), {'reset': True})
+        self.assertFalse(self.has_index(self.run_statement(self.client, 'SELECT 1')))
+    
+    def test_rows_cannot_change(self):
+        for query in ('DELETE FROM employees', 'CREATE INDEX i ON employees (salary); DELETE FROM employees'):
+            with self.subTest(query=query):
+                self.assertIn('error', self.run_statement(self.client, query))
+        answer = self.run_statement(self.client, 'SELECT count(*) AS n FROM employees')
+        self.assertEqual(answer['rows'], [{'n': len(DEPARTMENTS)}])
+    
+    def test_unknown_scale(self):
+        response = self.client.post(
+            '/api/sandbox/run/', json.dumps({'query': 'SELECT 1', 'scale': 'huge'}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+    
+    def test_least_recently_used_are_evicted(self):
+        registry = SandboxRegistry()
+        first = registry.get('first')
+        with override_settings(SANDBOX_MEMORY_BYTES=first.size):
+            second = registry.get('second')
+        self.assertTrue(first.closed)
+        self.assertFalse(second.closed)
+        self.assertEqual(registry.stats()['evicted'], 1)
+        self.assertEqual(first.run('SELECT 1', False)[0], False)
+        # The evicted session gets a fresh copy
+        self.assertIsNot(registry.get('first'), first)
+        registry.reset('first')
+        registry.reset('second')
+
+
+class QuestionSetImportTests(TransactionTestCase):
+    """Exports import again; bad records are reported by source and the rest still imported."""
+    
+    databases = {'default', 'exercise'}
+    
+    def setUp(self):
+        create_dataset()
+    
+    def exported_fields(self, question_set):
+        return {name: getattr(question_set, name) for name in EXPORT_FIELDS}
+    
+    def test_round_trip(self):
+        original = create_question_set(performance_feedback=True)
+        zipped = io.BytesIO()
+        write_zip(zipped, CustomQuestionSet.objects.filter(pk=original.pk))
+        jsonl = ''.join(iter_jsonl(CustomQuestionSet.objects.filter(pk=original.pk))).encode()
+        
+        for data in (jsonl, zipped.getvalue()):
+            entries = read_entries(data)
+            report = QuestionSetImporter().run(entries)
+            self.assertEqual(report.as_dict()['invalid'], [])
+            self.assertEqual(len(report.created), 1)
+            imported = CustomQuestionSet.objects.get(pk=report.created[0].pk)
+            self.assertEqual(self.exported_fields(imported), self.exported_fields(original))
+    
+    def test_bad_records_are_reported(self):
+        good = json.loads(next(iter_jsonl(CustomQuestionSet.objects.filter(pk=create_question_set().pk))))
+        lines = [
+            json.dumps({**good, 'name': 'Good'}),
+            '{not json',
+            json.dumps({**good, 'name': 'Unknown field', 'colour': 'red'}),
+            json.dumps({**good, 'name': 'Broken query', 'make_correct_query': 'SELECT missing FROM employees'}),
+            json.dumps({**good, 'name': 'Writes', 'predict_query': 'DELETE FROM employees'}),
+        ]
+        entries = read_entries('\n'.join(lines).encode(), 'sets.jsonl')
+        report = QuestionSetImporter().run(entries).as_dict()
+        
+        self.assertEqual([entry['name'] for entry in report['created']], ['Good'])
+        invalid = {entry['source']: entry for entry in report['invalid']}
+        self.assertEqual(sorted(invalid), ['sets.jsonl:2', 'sets.jsonl:3', 'sets.jsonl:4', 'sets.jsonl:5'])
+        self.assertIn('Invalid JSON', invalid['sets.jsonl:2']['errors'][0])
+        self.assertIn('colour', invalid['sets.jsonl:3']['errors'][0])
+        self.assertTrue(invalid['sets.jsonl:4']['errors'][0].startswith('make_correct_query:'))
+        self.assertTrue(invalid['sets.jsonl:5']['errors'][0].startswith('predict_query:'))
+    
+    def test_dry_run_creates_nothing(self):
+        data = ''.join(iter_jsonl(CustomQuestionSet.objects.filter(pk=create_question_set().pk))).encode()
+        report = QuestionSetImporter().run(read_entries(data), dry_run=True)
+        self.assertEqual((report.as_dict()['valid'], report.created), (1, []))
+        self.assertEqual(CustomQuestionSet.objects.count(), 1)
+
+
+@override_settings(JOB_RETRY_DELAY=0)
+class JobQueueTests(TransactionTestCase):
+    """Jobs run once claimed, are retried until they give up, and lost ones are queued again."""
+    
+    databases = {'default', 'exercise'}
+    
+    def setUp(self):
+        self.queue = JobQueue()
+    
+    def test_question_set_is_validated(self):
+        create_dataset()
+        good = self.queue.enqueue('validate_question_set', {'pk': create_question_set().pk})
+        broken = self.queue.enqueue(
+            'validate_question_set', {'pk': create_question_set(make_correct_query='SELECT missing FROM employees').pk}
+        )
+        self.assertEqual(self.queue.run_due(), 2)
+        good.refresh_from_db()
+        broken.refresh_from_db()
+        self.assertEqual((good.status, good.result), (Job.SUCCEEDED, {'errors': []}))
+        self.assertEqual(broken.status, Job.SUCCEEDED)
+        self.assertEqual(len(broken.result['errors']), 1)
+        self.assertTrue(broken.result['errors'][0].startswith('make_correct_query:'))
+    
+    def test_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            self.queue.enqueue('no_such_job')
+    
+    def test_failing_job_is_retried_then_failed(self):
+        handler = mock.Mock(side_effect=RuntimeError('broken'))
+        with mock.patch.dict(JOB_HANDLERS, {'test_failure': handler}), \
+                self.assertLogs('website.jobs', 'WARNING') as logs:
+            job = self.queue.enqueue('test_failure', {'n': 1}, max_attempts=2)
+            self.assertEqual(self.queue.run_due(), 2)
+        self.assertEqual(len(logs.records), 2)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertIn('RuntimeError: broken', job.error)
+        handler.assert_called_with({'n': 1})
+        
+        self.assertTrue(self.queue.retry(job.pk))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 0))
+        self.assertFalse(self.queue.retry(job.pk))
+    
+    def test_lost_job_is_queued_again(self):
+        job = self.queue.enqueue('warm_caches')
+        self.assertEqual(self.queue.claim(5), [job.pk])
+        self.assertEqual(self.queue.claim(5), [])
+        Job.objects.filter(pk=job.pk).update(started_at=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(self.queue.requeue_lost(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+
+
+class ServesRequestsTests(SimpleTestCase):
+    """Background threads start only in processes known to serve requests."""
+    
+    def serves(self, *argv, run_main=None):
+        with mock.patch.dict(os.environ):
+            os.environ.pop('RUN_MAIN', None)
+            if run_main:
+                os.environ['RUN_MAIN'] = run_main
+            return serves_requests(list(argv))
+    
+    def test_runserver(self):
+        self.assertFalse(self.serves('manage.py', 'runserver'))
+        self.assertTrue(self.serves('manage.py', 'runserver', run_main='true'))
+        self.assertTrue(self.serves('./manage.py', 'runserver', '--noreload'))
+    
+    def test_servers(self):
+        self.assertTrue(self.serves('/venv/bin/gunicorn', 'csetp.wsgi'))
+        self.assertTrue(self.serves('uwsgi', '--module', 'csetp.wsgi'))
+        self.assertTrue(self.serves('/venv/lib/python3.11/site-packages/gunicorn/__main__.py', 'csetp.wsgi'))
+        self.assertTrue(self.serves('daphne', 'csetp.asgi:application'))
+    
+    def test_other_processes(self):
+        for argv in (
+            ['manage.py', 'migrate'],
+            ['manage.py', 'test'],
+            ['manage.py'],
+            ['/venv/bin/pytest'],
+            ['script.py'],
+            ['-c'],
+            [],
+        ):
+            with self.subTest(argv=argv):
+                self.assertFalse(self.serves(*argv))
+    
+    @override_settings(SERVES_REQUESTS=True)
+    def test_explicit_flag(self):
+        self.assertTrue(self.serves('/venv/bin/hypercorn', 'csetp.asgi:application'))
+        self.assertTrue(self.serves('manage.py', 'migrate'))
+
+
+class ReadinessTests(TransactionTestCase):
+    """/ready/ reports 503 until this worker's warmup has finished."""
+    
+    databases = {'default', 'exercise'}
+    
+    def setUp(self):
+        create_dataset()
+        self.state = WarmupState()
+        patcher = mock.patch('website.views.warmup_state', self.state)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_ready_after_warmup(self):
+        response = self.client.get('/ready/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['status'], 'pending')
+        
+        run_warmup(self.state)
+        response = self.client.get('/ready/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('compile exercises', [step['step'] for step in response.json()['steps']])
+    
+    def test_failed_warmup(self):
+        with mock.patch('website.warmup._open_connection', side_effect=RuntimeError('no database')):
+            run_warmup(self.state)
+        response = self.client.get('/ready/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['error'], 'RuntimeError: no database')
+
+
+class RequestProfilerTests(TransactionTestCase):
+    """Requests with a valid X-Profile token are profiled, streamed bodies included."""
+    
+    databases = {'default', 'exercise'}
+    query = "SELECT first_name, last_name, email FROM employees WHERE department = 'IT'"
+    
+    def setUp(self):
+        create_dataset()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(PROFILE_DIR=Path(directory.name), PROFILE_ENABLED=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+    
+    def post(self, token):
+        return self.client.post(
+            '/run-modified-query/', json.dumps({'query': self.query}), content_type='application/json',
+            headers={PROFILE_HEADER: token}
+        )
+    
+    def test_stream_releases_lock(self):
+        response = self.post(make_token())
+        self.assertTrue(response.streaming)
+        # The body is still to be profiled while it is sent
+        self.assertTrue(_profiling_lock.locked())
+        self.assertTrue(json.loads(b''.join(response.streaming_content))['correct'])
+        self.assertFalse(_profiling_lock.locked())
+        self.assertEqual([profile[1] for profile in list_profiles()], ['primm1_modify'])
+    
+    def test_unread_stream_releases_lock(self):
+        response = self.post(make_token())
+        self.assertTrue(_profiling_lock.locked())
+        response.close()
+        self.assertFalse(_profiling_lock.locked())
+        self.assertEqual(len(list_profiles()), 1)
+    
+    def test_bad_tokens_are_ignored(self):
+        with mock.patch('django.core.signing.time.time', return_value=time.time() - 7200):
+            expired = make_token()
+        for token in ('profile', make_token() + 'x', expired):
+            with self.subTest(token=token):
+                response = self.post(token)
+                self.assertFalse(_profiling_lock.locked())
+                self.assertTrue(json.loads(b''.join(response.streaming_content))['correct'])
+        self.assertEqual(list_profiles(), [])
+
+
+@override_settings(DEBUG=True)
+class MemoryProfilerTests(TransactionTestCase):
+    """Traced requests stop tracing and release the lock once their body is sent."""
+    
+    databases = {'default', 'exercise'}
+    query = "SELECT first_name, last_name, email FROM employees WHERE department = 'IT'"
+    
+    def setUp(self):
+        self.assertFalse(tracemalloc.is_tracing())
+        create_dataset()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings_override = override_settings(MEMORY_PROFILE_DUMP_DIR=self.directory, MEMORY_PROFILE_ENABLED=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        memory_stats.reset()
+        self.addCleanup(memory_stats.reset)
+    
+    def post(self):
+        return self.client.post(
+            '/run-modified-query/', json.dumps({'query': self.query}), content_type='application/json',
+            headers={'X-Memory-Profile': '1'}
+        )
+    
+    def test_stream_is_traced_until_sent(self):
+        with override_settings(MEMORY_PROFILE_SNAPSHOT_BYTES=1), self.assertLogs('website.memory_profiler', 'WARNING'):
+            response = self.post()
+            self.assertTrue(response.streaming)
+            self.assertTrue(tracemalloc.is_tracing())
+            self.assertTrue(_tracing_lock.locked())
+            self.assertTrue(json.loads(b''.join(response.streaming_content))['correct'])
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertFalse(_tracing_lock.locked())
+        
+        report = memory_stats.export()
+        [endpoint] = report['endpoints']
+        self.assertEqual(endpoint['requests'], 1)
+        self.assertTrue({'request', 'encode'} <= set(endpoint['phases']))
+        self.assertEqual([Path(path).parent for path in report['snapshots']], [self.directory])
+    
+    def test_unread_stream_stops_tracing(self):
+        response = self.post()
+        self.assertTrue(tracemalloc.is_tracing())
+        response.close()
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertFalse(_tracing_lock.locked())
+        self.assertEqual(memory_stats.export()['endpoints'][0]['requests'], 1)
+
+
+class ExerciseRegistryTests(TransactionTestCase):
+    """Exercises are compiled once and recompiled only when their question set changes."""
+    
+    def setUp(self):
+        self.question_set = create_question_set()
+        self.key = f'custom:{self.question_set.pk}:modify'
+    
+    def test_compiled_once(self):
+        registry = ExerciseRegistry()
+        for key in ('primm1_modify', self.key):
+            with self.subTest(key=key):
+                self.assertIs(registry.get(key), registry.get(key))
+    
+    @override_settings(EXERCISE_CACHE_TTL=0)
+    def test_expired_set_is_rechecked(self):
+        registry = ExerciseRegistry()
+        exercise = registry.get(self.key)
+        # Unchanged: the exercise and its cached expected results are kept
+        self.assertIs(registry.get(self.key), exercise)
+        
+        # Edited by another worker, whose signals this one never sees
+        query = "SELECT first_name FROM employees WHERE department = 'HR'"
+        CustomQuestionSet.objects.filter(pk=self.question_set.pk).update(
+            modify_correct_query=query, updated_at=timezone.now()
+        )
+        self.assertEqual(registry.get(self.key).expected_sql, query)
+    
+    def test_signals_invalidate(self):
+        exercise_registry.invalidate()
+        self.addCleanup(exercise_registry.invalidate)
+        exercise = exercise_registry.get(self.key)
+        self.question_set.modify_correct_query = "SELECT first_name FROM employees WHERE department = 'HR'"
+        self.question_set.save()
+        self.assertIsNot(exercise_registry.get(self.key), exercise)
+        self.assertEqual(exercise_registry.get(self.key).expected_sql, self.question_set.modify_correct_query)
+        
+        self.question_set.delete()
+        with self.assertRaises(KeyError):
+            exercise_registry.get(self.key)
+    
+    def test_unknown_keys(self):
+        registry = ExerciseRegistry()
+        pk = self.question_set.pk
+        for key in ('unknown', f'custom:{pk}', f'custom:{pk}:predict', 'custom:x:make', f'other:{pk}:make',
+                    f'custom:{pk + 1}:make'):
+            with self.subTest(key=key), self.assertRaises(KeyError):
+                registry.get(key)
+
+
+class SQLiteProfileTests(SimpleTestCase):
+    """New SQLite connections get the PRAGMAs of SQLITE_PROFILE."""
+    
+    # Only connections of their own, to a file of their own
+    databases = {'default', 'exercise'}
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'profile.sqlite3'
+        sqlite3.connect(self.path).close()
+    
+    def pragmas(self, alias, *names):
+        settings_dict = {**connections['default'].settings_dict, 'NAME': self.path}
+        connection = type(connections['default'])(settings_dict, alias=alias)
+        self.addCleanup(connection.close)
+        with connection.cursor() as cursor:
+            return [cursor.execute(f'PRAGMA {name}').fetchone()[0] for name in names]
+    
+    def test_tuned(self):
+        names = ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'query_only')
+        with override_settings(SQLITE_PROFILE='tuned'):
+            self.assertEqual(self.pragmas('default', *names), ['wal', 1, 5000, -64000, 0])
+            # The read-only exercise connection leaves the file's journal alone
+            self.assertEqual(self.pragmas(settings.EXERCISE_DB_ALIAS, *names), ['wal', 2, 5000, -64000, 1])
+    
+    def test_baseline(self):
+        with override_settings(SQLITE_PROFILE='tuned'):
+            self.pragmas('default', 'journal_mode')
+        # WAL is a property of the file; baseline switches it back
+        with override_settings(SQLITE_PROFILE='baseline'):
+            self.assertEqual(self.pragmas('default', 'journal_mode', 'cache_size'), ['delete', -2000])
+            self.assertEqual(self.pragmas(settings.EXERCISE_DB_ALIAS, 'query_only'), [1])
+    
+    @override_settings(SQLITE_PROFILE='fast')
+    def test_unknown_profile(self):
+        with self.assertRaisesMessage(ValueError, "Unknown SQLite profile 'fast'"):
+            self.pragmas('default', 'journal_mode')
+
+
+class QueryProgressTests(TransactionTestCase):
+    """Submissions streamed as events end with their verdict and can be stopped."""
+    
+    databases = {'default', 'exercise'}
+    url = '/api/exercise/primm1_modify/events/'
+    endless = 'WITH RECURSIVE c(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM c) SELECT count(*) FROM c'
+    
+    def setUp(self):
+        create_dataset()
+    
+    def events(self, response):
+        """Yield (event, data) pairs from a text/event-stream response as they arrive."""
+        for chunk in response.streaming_content:
+            event, data = chunk.decode().strip().split('\n')
+            yield event.removeprefix('event: '), json.loads(data.removeprefix('data: '))
+    
+    def post(self, query):
+        return self.client.post(self.url, json.dumps({'query': query}), content_type='application/json')
+    
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "timed out")
+            time.sleep(0.01)
+    
+    def test_final_event_is_the_verdict(self):
+        events = list(self.events(self.post(
+            "SELECT first_name, last_name, email FROM employees WHERE department = 'IT'"
+        )))
+        self.assertEqual(events[0][0], 'start')
+        self.assertEqual(sum(len(data['rows']) for event, data in events if event == 'rows'), 3)
+        self.assertEqual(events[-1][0], 'verdict')
+        self.assertTrue(events[-1][1]['correct'])
+        
+        event, verdict = list(self.events(self.post(
+            "SELECT first_name, last_name, email FROM employees WHERE department = 'HR'"
+        )))[-1]
+        self.assertEqual(event, 'verdict')
+        self.assertFalse(verdict['correct'])
+        self.assertEqual(verdict['diff']['missing_count'], 3)
+    
+    def test_cancel_interrupts_the_query(self):
+        events = self.events(self.post(self.endless))
+        event, data = next(events)
+        self.assertEqual(event, 'start')
+        # Another session cannot stop it
+        self.assertEqual(self.client_class().post(f"/api/runs/{data['run_id']}/cancel/").status_code, 404)
+        
+        self.assertEqual(next(events)[0], 'progress')
+        cancelled = time.monotonic()
+        self.assertEqual(self.client.post(f"/api/runs/{data['run_id']}/cancel/").json(), {'cancelled': True})
+        event, data = list(events)[-1]
+        # Well within the exercise's time budget, so the statement was interrupted
+        self.assertLess(time.monotonic() - cancelled, settings.EXERCISE_TIME_BUDGET_MS / 2000)
+        self.assertEqual((event, data), ('cancelled', {'error': CANCELLED_MESSAGE, 'correct': False}))
+    
+    @override_settings(PROGRESS_QUEUE_BATCHES=1, EXERCISE_FETCH_SIZE=1)
+    def test_reader_that_stops_does_not_block_the_worker(self):
+        run = QueryRun('session', 'SELECT first_name FROM employees').start()
+        # One batch queued, the worker waiting to hand over the next
+        self.wait_for(lambda: run.rows_fetched == 2)
+        self.assertIsNone(run.elapsed_ms)
+        run.close()
+        self.wait_for(lambda: run.elapsed_ms is not None)
+        self.assertEqual((run.rows_fetched, run.error), (2, CANCELLED_MESSAGE))
+        self.assertIsNone(QueryRun.find(run.id, 'session'))
+    
+    @override_settings(PROGRESS_QUEUE_BATCHES=1, EXERCISE_FETCH_SIZE=1)
+    def test_client_going_away_stops_the_run(self):
+        response = self.post("SELECT first_name, last_name, email FROM employees")
+        events = self.events(response)
+        run_id = next(events)[1]['run_id']
+        run = QueryRun.find(run_id, self.client.session.session_key)
+        self.wait_for(lambda: run.rows_fetched == 2)
+        response.close()
+        self.wait_for(lambda: run.elapsed_ms is not None)
+        self.assertTrue(run.cancelled.is_set())
+        self.assertLess(run.rows_fetched, len(DEPARTMENTS))
+
+
+@override_settings(QUERY_LOG_ENABLED=True, QUERY_LOG_SLOW_MS=100, QUERY_LOG_RING_SIZE=3, QUERY_LOG_MAX_FINGERPRINTS=2)
+class QueryLogTests(SimpleTestCase):
+    """Executions are grouped by fingerprint, within bounded memory."""
+    
+    def setUp(self):
+        self.log = QueryLog()
+    
+    def test_literals_share_a_fingerprint(self):
+        self.log.record("SELECT * FROM employees WHERE salary > 50000", 'primm1_modify', 10, rows=4)
+        self.log.record("select *  from employees where salary > 70000;", 'primm1_make', 30, rows=2)
+        self.log.record("SELECT * FROM employees WHERE department IN ('IT', 'HR')", None, 5, error='boom')
+        
+        top = self.log.top('count')
+        self.assertEqual([entry['fingerprint'] for entry in top], [
+            'select * from employees where salary > ?',
+            'select * from employees where department in (?)',
+        ])
+        self.assertEqual(
+            {key: top[0][key] for key in ('count', 'total_ms', 'mean_ms', 'max_ms', 'max_rows', 'error_rate')},
+            {'count': 2, 'total_ms': 40, 'mean_ms': 20, 'max_ms': 30, 'max_rows': 4, 'error_rate': 0.0}
+        )
+        self.assertEqual(top[0]['exercises'], {'primm1_modify': 1, 'primm1_make': 1})
+        self.assertEqual((top[1]['exercises'], top[1]['error_rate']), ({'-': 1}, 1.0))
+    
+    def test_least_recently_seen_is_evicted(self):
+        for query in ('SELECT 1', 'SELECT first_name FROM employees', 'SELECT 2', 'SELECT email FROM employees'):
+            self.log.record(query, None, 1)
+        # 'SELECT 2' refreshed 'select ?', so the first names query went
+        self.assertEqual(
+            {entry['fingerprint'] for entry in self.log.top()},
+            {'select ?', 'select email from employees'}
+        )
+        self.assertEqual(self.log.export()['fingerprints'], 2)
+    
+    def test_slow_and_failed_queries_ring(self):
+        self.log.record('SELECT 1', None, 5)
+        for elapsed_ms in (100, 200, 300):
+            self.log.record(f'SELECT {elapsed_ms}', 'primm1_modify', elapsed_ms)
+        self.log.record('SELECT missing', None, 1, error='no such column: missing')
+        
+        slow = self.log.slow_queries()
+        self.assertEqual([entry['elapsed_ms'] for entry in slow], [1, 300, 200])
+        self.assertEqual((slow[0]['query'], slow[0]['error']), ('select missing', 'no such column: missing'))
+        self.assertEqual(self.log.export()['slow_queries'], slow)
+    
+    def test_unknown_ordering(self):
+        self.log.record('SELECT 1', None, 1)
+        with self.assertRaisesMessage(ValueError, 'order_by must be one of'):
+            self.log.top('latency')
+        for order_by in TOP_ORDERINGS:
+            self.assertEqual(len(self.log.top(order_by)), 1)
+    
+    @override_settings(QUERY_LOG_ENABLED=False)
+    def test_disabled(self):
+        self.log.record('SELECT 1', None, 1000)
+        self.assertEqual((self.log.top(), self.log.slow_queries()), ([], []))
+
+
+class StreamedResultEncodingTests(TransactionTestCase):
+    """Streamed results encode values exactly as JsonResponse does."""
+    
+    databases = {'default', 'exercise'}
+    
+    def test_decimal_date_and_datetime(self):
+        columns = ['id', 'salary', 'start_date', 'updated_at', 'note']
+        moment = datetime.datetime(2024, 3, 1, 9, 30, 15, 123456, tzinfo=datetime.timezone.utc)
+        rows = [
+            (i, decimal.Decimal(f'{50000 + i}.50'), datetime.date(2024, 1, 1) + datetime.timedelta(days=i),
+             moment + datetime.timedelta(minutes=i), None if i % 2 else 'say "hi", ok?')
+            for i in range(streaming.STREAM_CHUNK_ROWS * 2 + 1)
+        ]
+        response = stream_result_response(columns, iter(rows), trailer=lambda: {'correct': True})
+        document = json.loads(b''.join(response.streaming_content))
+        
+        expected = JsonResponse({'result': [dict(zip(columns, row)) for row in rows], 'correct': True})
+        self.assertEqual(document, json.loads(expected.content))
+        self.assertEqual(document['result'][1], {
+            'id': 1, 'salary': '50001.50', 'start_date': '2024-01-02',
+            'updated_at': '2024-03-01T09:31:15.123Z', 'note': None,
+        })
+    
+    def test_endpoint_streams_dates(self):
+        create_dataset()
+        query = 'SELECT e.first_name, e.salary, p.start_date FROM employees e JOIN projects p ON p.employee_id = e.id'
+        question_set = create_question_set(modify_correct_query=query, uses_projects=True)
+        response = self.client.post(
+            f'/api/custom-question/{question_set.pk}/run-modify/', json.dumps({'query': query}),
+            content_type='application/json'
+        )
+        self.assertTrue(response.streaming)
+        document = json.loads(b''.join(response.streaming_content))
+        self.assertTrue(document['correct'])
+        self.assertEqual(
+            sorted(row['start_date'] for row in document['result']),
+            [(datetime.date(2024, 1, 1) + datetime.timedelta(days=30 * i)).isoformat() for i in range(5)]
+        )
@@ -0,0 +1,331 @@
+"""
+Microbenchmarks
+Times the validator, table rewriting, result comparison and hint hot paths
+and fails when one of them has become slower, or allocates more, than the
+stored baseline allows.
+
+They take a few minutes (results go up to a million rows), so they only run
+when asked for:
+
+    CSETP_BENCHMARKS=1 python manage.py test website.tests_benchmarks
+
+Each benchmark reports ns/op (best of BENCHMARK_REPEATS timings) and the
+peak memory one operation allocates (tracemalloc). A benchmark fails when it
+is more than CSETP_BENCHMARK_THRESHOLD (default 0.3, i.e. 30%) slower than
+benchmark_baseline.json, or allocates that much more. Each timing sample runs
+the operation for at least 0.2 seconds; still, operations under
+SHORT_BENCHMARK_NS swing by most of their length from run to run, so they
+may also take up to their baseline time again (at least TIME_SLACK_NS) on top
+of the threshold. A benchmark over its limits is measured again (CONFIRM_RUNS),
+next to a fresh calibration, before it fails, so a busy moment on a shared
+machine does not fail the run.
+Timings are scaled by a calibration loop measured next to them, so a baseline
+recorded on another machine still roughly applies; re-record it on the
+machine that runs the suite with
+
+    CSETP_BENCHMARKS=1 CSETP_BENCHMARK_UPDATE=1 python manage.py test website.tests_benchmarks
+"""
+
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+from functools import cache
+from pathlib import Path
+from unittest import skipUnless
+
+from django.test import SimpleTestCase
+
+from .exercises import HintMatcher, TableRewriter
+from .validators import QueryComparator, QueryHintGenerator, SQLValidator
+
+
+BENCHMARKS_ENABLED = os.environ.get('CSETP_BENCHMARKS') == '1'
+UPDATE_BASELINE = os.environ.get('CSETP_BENCHMARK_UPDATE') == '1'
+THRESHOLD = float(os.environ.get('CSETP_BENCHMARK_THRESHOLD', '0.3'))
+
+BASELINE_PATH = Path(__file__).with_name('benchmark_baseline.json')
+
+# Timings are the best of this many runs of at least 0.2 seconds each
+BENCHMARK_REPEATS = 7
+# Operations slower than this are timed once
+SLOW_OPERATION_SECONDS = 1.0
+# Growth below this much time or memory per operation is noise, not a regression
+TIME_SLACK_NS = 1000
+ALLOCATION_SLACK_BYTES = 1024
+# Operations faster than this may also take their baseline time again
+SHORT_BENCHMARK_NS = 100_000
+# Measurements over the limits are repeated this often, keeping the best, before failing
+CONFIRM_RUNS = 2
+
+# Result sizes, in rows
+RESULT_SIZES = (10, 1_000, 100_000, 1_000_000)
+
+TABLE_MAPPING = {'employees': 'website_employee', 'projects': 'website_project'}
+
+DEPARTMENTS = ('IT', 'HR', 'Sales', 'Marketing', 'Operations', 'Finance')
+
+
+def _long_query():
+    columns = ', '.join(f"employees.column_{i}" for i in range(200))
+    conditions = ' OR '.join(f"employees.salary = {i * 1000}" for i in range(500))
+    return (
+        f"SELECT {columns} FROM employees "
+        f"INNER JOIN projects ON employees.id = projects.employee_id "
+        f"WHERE {conditions} ORDER BY employees.last_name;"
+    )
+
+
+QUERIES = {
+    'short': "SELECT first_name, last_name FROM employees WHERE department = 'IT'",
+    'long': _long_query(),
+    # Inputs aimed at the leading-keyword scan, the statement tokenizer and the normalizing regexes
+    'comments': "/* note */ -- line comment\n" * 2000 + "SELECT 1",
+    'nested_parens': "(" * 10000 + "SELECT 1" + ")" * 10000,
+    'unclosed_comments': "/*" * 10000 + " SELECT 1",
+    'whitespace': " \n\t" * 20000 + "SELECT 1",
+    'quoted_semicolons': "SELECT '" + "a;''" * 10000 + "' AS s; -- done",
+}
+
+# The last keyword is the one missing, so every keyword is checked
+HINT_KEYWORDS = {
+    'few': {'select': 'hint', 'from': 'hint', 'missing_keyword': 'hint'},
+    'many': {**{f'column_{i}': 'hint' for i in range(49)}, 'missing_keyword': 'hint'},
+}
+
+
+def make_rows(count):
+    """Build a query result of the given size, as the executor returns it."""
+    return [
+        {
+            'first_name': f'Name{i % 1000}',
+            'last_name': f'Surname{i}',
+            'department': DEPARTMENTS[i % len(DEPARTMENTS)],
+            'salary': 50000 + i % 40 * 1000,
+        }
+        for i in range(count)
+    ]
+
+
+def measure(operation):
+    """
+    Time an operation and the memory it allocates.
+    
+    Args:
+        operation (callable): Runs the operation once
+    
+    Returns:
+        dict: ns_per_op and alloc_bytes (peak memory allocated by one call)
+    """
+    timer = timeit.Timer(operation)
+    number, elapsed = timer.autorange()
+    best = elapsed / number
+    if best < SLOW_OPERATION_SECONDS:
+        best = min([best] + [total / number for total in timer.repeat(BENCHMARK_REPEATS - 1, number)])
+    
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    
+    return {'ns_per_op': round(best * 1e9, 1), 'alloc_bytes': max(peak - before, 0)}
+
+
+def calibration_loop():
+    sum(len(str(i)) for i in range(1000))
+
+
+@cache
+def calibrate():
+    """Return the ns/op of a fixed pure-Python loop, to compare machines (measured once per run)."""
+    return measure(calibration_loop)['ns_per_op']
+
+
+def load_baseline():
+    if not BASELINE_PATH.exists():
+        return {}
+    return json.loads(BASELINE_PATH.read_text())
+
+
+def save_baseline(results, calibration):
+    """
+    Merge results into the baseline file.
+    
+    A baseline that already has entries keeps its calibration, and the new
+    timings are scaled to it, so re-recording some benchmarks leaves the
+    others comparable.
+    """
+    baseline = load_baseline()
+    recorded_calibration = baseline.setdefault('_calibration_ns', calibration)
+    factor = recorded_calibration / calibration
+    baseline.setdefault('benchmarks', {}).update({
+        name: {**result, 'ns_per_op': round(result['ns_per_op'] * factor, 1)}
+        for name, result in results.items()
+    })
+    baseline['benchmarks'] = dict(sorted(baseline['benchmarks'].items()))
+    BASELINE_PATH.write_text(json.dumps(baseline, indent=2) + '\n')
+
+
+def format_bytes(count):
+    for unit in ('B', 'KiB', 'MiB'):
+        if count < 1024:
+            return f"{count:.0f} {unit}"
+        count /= 1024
+    return f"{count:.1f} GiB"
+
+
+@skipUnless(BENCHMARKS_ENABLED, "set CSETP_BENCHMARKS=1 to run the microbenchmarks")
+class BenchmarkCase(SimpleTestCase):
+    """Base class: bench() measures, reports and checks against the baseline."""
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.baseline = load_baseline()
+        cls.calibration = calibrate()
+        baseline_calibration = cls.baseline.get('_calibration_ns')
+        # >1 when this machine is slower than the one that recorded the baseline
+        cls.speed_factor = cls.calibration / baseline_calibration if baseline_calibration else 1.0
+        cls.results = {}
+        # (ns_per_op, alloc_bytes) each checked benchmark was held to
+        cls.limits = {}
+    
+    @classmethod
+    def tearDownClass(cls):
+        if UPDATE_BASELINE and cls.results:
+            save_baseline(cls.results, cls.calibration)
+        cls._report()
+        super().tearDownClass()
+    
+    @classmethod
+    def allowed(cls, recorded, speed_factor=None):
+        """
+        Return the limits a benchmark's baseline entry sets on this machine.
+        
+        Args:
+            recorded (dict): Baseline entry
+            speed_factor (float): Machine speed factor, defaults to the one measured for the run
+        
+        Returns:
+            tuple: (ns_per_op, alloc_bytes) the benchmark may reach
+        """
+        expected_ns = recorded['ns_per_op'] * (speed_factor or cls.speed_factor)
+        slack_ns = max(TIME_SLACK_NS, expected_ns) if expected_ns < SHORT_BENCHMARK_NS else TIME_SLACK_NS
+        return (
+            expected_ns * (1 + THRESHOLD) + slack_ns,
+            recorded['alloc_bytes'] * (1 + THRESHOLD) + ALLOCATION_SLACK_BYTES,
+        )
+    
+    @classmethod
+    def _report(cls):
+        recorded = cls.baseline.get('benchmarks', {})
+        lines = [f"\n{cls.__name__} (machine speed factor {cls.speed_factor:.2f})"]
+        for name, result in cls.results.items():
+            line = f"  {name:<45}{result['ns_per_op']:>16,.0f} ns/op{format_bytes(result['alloc_bytes']):>12}"
+            if name in recorded:
+                expected = recorded[name]['ns_per_op'] * cls.speed_factor
+                line += f"{(result['ns_per_op'] / expected - 1) * 100:>+9.1f}%"
+                allowed_ns, allowed_bytes = cls.limits.get(name, cls.allowed(recorded[name]))
+                if result['ns_per_op'] > allowed_ns or result['alloc_bytes'] > allowed_bytes:
+                    line += "  REGRESSED"
+            else:
+                line += "      new"
+            lines.append(line)
+        sys.stderr.write('\n'.join(lines) + '\n')
+    
+    def bench(self, name, operation):
+        """
+        Measure an operation and check it against its baseline entry.
+        
+        Args:
+            name (str): Benchmark name, the key in the baseline file
+            operation (callable): Runs the operation once
+        """
+        result = measure(operation)
+        self.results[name] = result
+        
+        recorded = self.baseline.get('benchmarks', {}).get(name)
+        if UPDATE_BASELINE or recorded is None:
+            return
+        
+        allowed_ns, allowed_bytes = self.allowed(recorded)
+        for _ in range(CONFIRM_RUNS):
+            if result['ns_per_op'] <= allowed_ns and result['alloc_bytes'] <= allowed_bytes:
+                break
+            # Measured again next to a fresh calibration, in case the machine is busy right now
+            baseline_calibration = self.baseline.get('_calibration_ns')
+            if baseline_calibration:
+                speed_factor = max(self.speed_factor, measure(calibration_loop)['ns_per_op'] / baseline_calibration)
+                allowed_ns, allowed_bytes = self.allowed(recorded, speed_factor)
+            again = measure(operation)
+            result = self.results[name] = {key: min(result[key], again[key]) for key in result}
+        self.limits[name] = (allowed_ns, allowed_bytes)
+        
+        with self.subTest(benchmark=name):
+            self.assertLessEqual(
+                result['ns_per_op'], allowed_ns,
+                f"{name} takes {result['ns_per_op']:,.0f} ns/op, baseline allows {allowed_ns:,.0f}"
+            )
+            self.assertLessEqual(
+                result['alloc_bytes'], allowed_bytes,
+                f"{name} allocates {format_bytes(result['alloc_bytes'])}, baseline allows {format_bytes(allowed_bytes)}"
+            )
+
+
+class ValidatorBenchmarks(BenchmarkCase):
+
+    def test_validate(self):
+        for case, query in QUERIES.items():
+            self.bench(f"validate/{case}", lambda: SQLValidator(query).validate())
+    
+    def test_normalize_table_names(self):
+        for case, query in QUERIES.items():
+            validator = SQLValidator(query)
+            self.bench(f"normalize_table_names/{case}", lambda: validator.normalize_table_names(TABLE_MAPPING))
+    
+    def test_table_rewriter(self):
+        rewrite = TableRewriter(TABLE_MAPPING)
+        for case, query in QUERIES.items():
+            self.bench(f"table_rewriter/{case}", lambda: rewrite(query))
+
+
+class ComparatorBenchmarks(BenchmarkCase):
+
+    def test_compare_queries(self):
+        for case, query in QUERIES.items():
+            # Same query, different case and spacing: the whole text is compared
+            variant = query.upper().replace(' ', '  ')
+            self.bench(f"compare_queries/{case}", lambda: QueryComparator.compare_queries(query, variant))
+    
+    def test_results(self):
+        for size in RESULT_SIZES:
+            rows = make_rows(size)
+            reordered = rows[::-1]
+            self.bench(f"normalize_data/{size}", lambda: QueryComparator.normalize_data(rows))
+            self.bench(f"compare_results/{size}", lambda: QueryComparator.compare_results(reordered, rows))
+            self.bench(f"fingerprint_result/{size}", lambda: QueryComparator.fingerprint_result(rows))
+            del rows, reordered
+
+
+class HintBenchmarks(BenchmarkCase):
+
+    def test_generate_hint(self):
+        for keywords_case, keywords in HINT_KEYWORDS.items():
+            for case in ('short', 'long'):
+                query = QUERIES[case]
+                self.bench(
+                    f"generate_hint/{keywords_case}/{case}",
+                    lambda: QueryHintGenerator.generate_hint(query, keywords)
+                )
+    
+    def test_hint_matcher(self):
+        for keywords_case, keywords in HINT_KEYWORDS.items():
+            hint_for = HintMatcher(keywords)
+            for case in ('short', 'long'):
+                query = QUERIES[case]
+                self.bench(f"hint_matcher/{keywords_case}/{case}", lambda: hint_for(query))
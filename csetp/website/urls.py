@@ -21,7 +21,21 @@ urlpatterns = [
     path('add-question-set/', views.add_question_set, name='add-question-set'),
     path('custom-question/<int:pk>/', views.view_custom_question_set, name='custom-question-set'),
     path('delete-question-set/<int:pk>/', views.delete_question_set, name='delete-question-set'),
+    path('dashboard/', views.exercise_dashboard, name='dashboard'),
+    path('dashboard/queries/', views.query_stats, name='query-stats'),
+    path('dashboard/queries.json', views.query_stats_export, name='query-stats-export'),
+    path('dashboard/memory.json', views.memory_stats_export, name='memory-stats-export'),
+    path('question-sets/export/', views.export_question_sets, name='export-question-sets'),
+    path('question-sets/import/', views.import_question_sets, name='import-question-sets'),
     path('api/custom-question/<int:pk>/run-predict/', views.custom_question_run_predict, name='custom-question-run-predict'),
     path('api/custom-question/<int:pk>/run-modify/', views.custom_question_run_modify, name='custom-question-run-modify'),
     path('api/custom-question/<int:pk>/run-make/', views.custom_question_run_make, name='custom-question-run-make'),
+    path('api/exercise/<str:key>/run/', views.run_exercise, name='run-exercise'),
+    path('api/exercise/<str:key>/events/', views.run_exercise_events, name='run-exercise-events'),
+    path('api/runs/<str:run_id>/cancel/', views.cancel_run, name='cancel-run'),
+    path('sandbox/', views.sandbox, name='sandbox'),
+    path('api/sandbox/run/', views.sandbox_run, name='sandbox-run'),
+    path('api/sandbox/reset/', views.sandbox_reset, name='sandbox-reset'),
+    path('jobs/<int:pk>/', views.job_status, name='job-status'),
+    path('ready/', views.readiness, name='readiness'),
 ]
\ No newline at end of file
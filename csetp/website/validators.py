@@ -1,23 +1,55 @@
 """
 SQL Query Validator
-Provides validation and security checks for user-submitted SQL queries.
+Provides validation and comparison helpers for user-submitted SQL queries.
 """
 
 import re
-import sqlparse
-from sqlparse.sql import IdentifierList, Identifier, Where
-from sqlparse.tokens import Keyword, DML
+from collections import Counter
+
+from .memory_profiler import memory_phase
 
 
 class SQLValidator:
-    """Validates SQL queries for security and correctness."""
+    """
+    Cheap text-level checks for user-submitted SQL queries.
+    
+    Only the leading keyword is looked at, to reject obvious mistakes early with
+    a clear message, and the text must hold a single statement. What a query
+    can actually do is enforced by the database: on SQLite an authorizer lets
+    it read the exercise's tables and nothing else, on PostgreSQL it runs in a
+    READ ONLY transaction (see QueryExecutor.get_cursor). A second statement
+    could end that transaction (SELECT 1; COMMIT; ...), so QueryExecutor also
+    refuses to run text that single_statement() rejects.
+    """
     
-    # Dangerous SQL keywords that should be blocked
+    # Statements a submission may start with
+    READ_KEYWORDS = ('SELECT', 'WITH')
+    
+    # Leading keywords of statements that modify the database
     DANGEROUS_KEYWORDS = [
         'DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER', 
         'CREATE', 'TRUNCATE', 'REPLACE', 'GRANT', 'REVOKE'
     ]
     
+    # First word of a query, after comments and opening parentheses
+    LEADING_KEYWORD = re.compile(r'(?:\s+|--[^\n]*(?:\n|$)|/\*.*?\*/|\()*([A-Za-z]*)', re.DOTALL)
+    
+    # Pieces of SQL text: strings, quoted identifiers, comments, statement
+    # separators and runs of other code (unclosed quotes and comments run to the end)
+    SQL_TOKEN = re.compile(
+        r"""'(?:[^']+|'')*'?|"(?:[^"]+|"")*"?|--[^\n]*|/\*.*?(?:\*/|\Z)|;|[^'";/-]+|[/-]""",
+        re.DOTALL
+    )
+    
+    # Quoting that differs between dialects (E'\'', $$...$$, [...], `...`):
+    # with any of it in a statement, every semicolon counts as a separator
+    DIALECT_QUOTING = re.compile(r'[\\$\[`]')
+    
+    # Stripped off the end of a statement without tokenizing it
+    TRAILING_CHARACTERS = '; \t\n\r\f\v'
+    
+    MULTIPLE_STATEMENTS_MESSAGE = "❌ Only one SQL statement can be run at a time. Remove the extra semicolons."
+    
     def __init__(self, query):
         """
         Initialize validator with a SQL query.
@@ -38,43 +70,74 @@ class SQLValidator:
         if not self._check_not_empty():
             return False, "❌ Query is empty. Please enter a valid SQL query."
         
-        if not self._check_no_dangerous_keywords():
+        keyword = self._leading_keyword()
+        if keyword in self.DANGEROUS_KEYWORDS:
             return False, "❌ Unsafe query detected. Only SELECT statements are allowed. As you cannot modify the database."
         
-        if not self._check_valid_sql_syntax():
+        if keyword not in self.READ_KEYWORDS:
             return False, "❌ Invalid SQL syntax. Please check your query."
         
+        if self._statement_length(self.query) is None:
+            return False, self.MULTIPLE_STATEMENTS_MESSAGE
+        
         return True, None
     
     def _check_not_empty(self):
         """Check if query is not empty."""
         return bool(self.query)
     
-    def _check_no_dangerous_keywords(self):
-        """Check if query contains dangerous SQL keywords."""
-        query_upper = self.query.upper()
-        return not any(keyword in query_upper for keyword in self.DANGEROUS_KEYWORDS)
-    
-    def _check_valid_sql_syntax(self):
+    @staticmethod
+    def single_statement(query):
         """
-        Check if query has valid SQL syntax using sqlparse.
+        Strip the trailing semicolons and comments off a single SQL statement.
+        
+        Semicolons inside strings, quoted identifiers and comments do not
+        separate statements; anything else after the first separator does.
+        Text with no semicolon before its end is not tokenized at all.
+        
+        Args:
+            query (str): SQL text
         
         Returns:
-            bool: True if syntax appears valid
+            str: The statement without its trailing semicolons and whitespace
+                 (and comments, if a semicolon precedes them), or None if the
+                 text holds more than one statement
         """
-        try:
-            parsed = sqlparse.parse(self.query)
-            if not parsed:
-                return False
-            
-            # Check if it's a SELECT statement
-            statement = parsed[0]
-            if statement.get_type() != 'SELECT':
-                return False
-            
-            return True
-        except Exception:
-            return False
+        length = SQLValidator._statement_length(query)
+        return None if length is None else query[:length]
+    
+    @staticmethod
+    def _statement_length(query):
+        """
+        Return the length of single_statement(query), or None if it rejects the text.
+        
+        The text is measured where it is, so checking a long query that ends
+        with a semicolon does not copy it.
+        """
+        end = len(query)
+        while end and query[end - 1] in SQLValidator.TRAILING_CHARACTERS:
+            end -= 1
+        if query.find(';', 0, end) == -1:
+            return end
+        
+        tokens = SQLValidator.SQL_TOKEN.findall(query, 0, end)
+        count = len(tokens)
+        while count and (tokens[count - 1] == ';' or tokens[count - 1].isspace()
+                         or tokens[count - 1].startswith(('--', '/*'))):
+            count -= 1
+        if ';' in tokens[:count]:
+            return None
+        
+        length = sum(map(len, tokens[:count]))
+        while length and query[length - 1].isspace():
+            length -= 1
+        if query.find(';', 0, length) != -1 and SQLValidator.DIALECT_QUOTING.search(query, 0, length):
+            return None
+        return length
+    
+    def _leading_keyword(self):
+        """Return the query's first keyword in upper case ('' if there is none)."""
+        return self.LEADING_KEYWORD.match(self.query).group(1).upper()
     
     def normalize_table_names(self, table_mapping):
         """
@@ -96,6 +159,39 @@ class SQLValidator:
         return normalized_query
 
 
+class SandboxValidator(SQLValidator):
+    """
+    Checks statements run in a session sandbox (sandbox.py), which may also
+    create, drop and analyze indexes on its own copy of the dataset.
+    """
+    
+    # Index statements a sandbox accepts besides queries
+    SCHEMA_STATEMENT = re.compile(r'(?:CREATE\s+(?:UNIQUE\s+)?INDEX|DROP\s+INDEX|ANALYZE|REINDEX)\b', re.IGNORECASE)
+    
+    def validate(self):
+        """
+        Run all validation checks.
+        
+        Returns:
+            tuple: (is_valid, error_message)
+        """
+        if self._check_not_empty() and self.is_schema_change():
+            if self._statement_length(self.query) is None:
+                return False, self.MULTIPLE_STATEMENTS_MESSAGE
+            return True, None
+        
+        is_valid, error_message = super().validate()
+        if not is_valid and self._leading_keyword() in self.DANGEROUS_KEYWORDS:
+            return False, ("❌ The sandbox only runs SELECT queries and CREATE INDEX, "
+                           "DROP INDEX, ANALYZE and REINDEX statements.")
+        return is_valid, error_message
+    
+    def is_schema_change(self):
+        """Whether the statement is one of the index statements (SCHEMA_STATEMENT)."""
+        start = self.LEADING_KEYWORD.match(self.query).start(1)
+        return self.SCHEMA_STATEMENT.match(self.query, start) is not None
+
+
 class QueryComparator:
     """Compares user query results with expected results."""
     
@@ -111,19 +207,55 @@ class QueryComparator:
         Returns:
             list: Normalized and sorted data
         """
-        normalized = []
-        for record in data:
-            new_record = {k: str(v).strip().lower() for k, v in record.items()}
-            
-            # Rename fields if mapping provided
-            if rename_fields:
-                for old_name, new_name in rename_fields.items():
-                    if old_name in new_record:
-                        new_record[new_name] = new_record.pop(old_name)
+        with memory_phase('normalize'):
+            normalized = [QueryComparator.normalize_record(record, rename_fields) for record in data]
             
-            normalized.append(new_record)
+            return sorted(normalized, key=lambda x: tuple(x.values()))
+    
+    @staticmethod
+    def normalize_record(record, rename_fields=None):
+        """
+        Normalize a single result row: values are stringified, stripped and lowercased.
         
-        return sorted(normalized, key=lambda x: tuple(x.values()))
+        Args:
+            record (dict): One result row
+            rename_fields (dict): Optional dictionary for renaming fields
+        
+        Returns:
+            dict: Normalized row
+        """
+        new_record = {k: str(v).strip().lower() for k, v in record.items()}
+        
+        # Rename fields if mapping provided
+        if rename_fields:
+            for old_name, new_name in rename_fields.items():
+                if old_name in new_record:
+                    new_record[new_name] = new_record.pop(old_name)
+        
+        return new_record
+    
+    @staticmethod
+    def row_key(record, rename_fields=None):
+        """Hashable form of a normalized row, independent of column order."""
+        return frozenset(QueryComparator.normalize_record(record, rename_fields).items())
+    
+    @staticmethod
+    def fingerprint_result(data, rename_fields=None):
+        """
+        Reduce a result to a multiset of normalized rows.
+        
+        Two results compare equal exactly when their fingerprints are equal, so
+        an expected result can be fingerprinted once and reused for grading.
+        
+        Args:
+            data (list): List of dictionaries containing query results
+            rename_fields (dict): Optional dictionary for renaming fields
+        
+        Returns:
+            Counter: Normalized row -> number of occurrences
+        """
+        with memory_phase('normalize'):
+            return Counter(QueryComparator.row_key(record, rename_fields) for record in data)
     
     @staticmethod
     def compare_results(user_result, expected_result, rename_fields=None):
@@ -143,18 +275,182 @@ class QueryComparator:
         
         return normalized_user == normalized_expected
     
+    @staticmethod
+    def diff_results(user_result, expected_result, rename_fields=None, example_rows=None):
+        """
+        Compute the row-level diff between two results in a single pass.
+        
+        Args:
+            user_result (list): Results from user's query
+            expected_result (list): Expected results
+            rename_fields (dict): Optional field name mapping
+            example_rows (int): Maximum example rows per side
+        
+        Returns:
+            dict: See ResultMatcher.diff
+        """
+        matcher = ResultMatcher(
+            QueryComparator.fingerprint_result(expected_result, rename_fields),
+            rename_fields,
+            example_rows=example_rows
+        )
+        for record in user_result:
+            matcher.add(record)
+        return matcher.diff()
+    
     @staticmethod
     def compare_queries(user_query, expected_query):
         """
         Compare two SQL queries by normalizing whitespace and case.
         
         """
-        def normalize_query(query):
-            normalized = re.sub(r'\s+', '', query.lower())
-            normalized = normalized.rstrip(';')
-            return normalized
-        
+        normalize_query = QueryComparator.normalize_query
         return normalize_query(user_query) == normalize_query(expected_query)
+    
+    @staticmethod
+    def normalize_query(query):
+        """Remove all whitespace, fold case and drop the trailing semicolon."""
+        normalized = re.sub(r'\s+', '', query.lower())
+        normalized = normalized.rstrip(';')
+        return normalized
+
+
+class QueryNormalizer:
+    """Canonical text forms of SQL queries for logging and grouping attempts."""
+    
+    # String and numeric literals, replaced by '?' when fingerprinting
+    LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+    
+    # A parenthesised list of placeholders, e.g. IN (?, ?, ?)
+    PLACEHOLDER_LIST_PATTERN = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+    
+    @staticmethod
+    def normalize(query):
+        """
+        Collapse whitespace, fold case and drop the trailing semicolon.
+        
+        Args:
+            query (str): SQL query text
+        
+        Returns:
+            str: Normalized query
+        """
+        normalized = re.sub(r'\s+', ' ', query or '').strip().lower()
+        return normalized.rstrip(';').rstrip()
+    
+    @staticmethod
+    def fingerprint(query):
+        """
+        Normalize a query and strip its literals, so queries that differ only
+        in the values they use share one fingerprint.
+        
+        Args:
+            query (str): SQL query text
+        
+        Returns:
+            str: Query shape, e.g. "select * from employees where salary < ?"
+        """
+        fingerprint = QueryNormalizer.LITERAL_PATTERN.sub('?', QueryNormalizer.normalize(query))
+        return QueryNormalizer.PLACEHOLDER_LIST_PATTERN.sub('(?)', fingerprint)
+
+
+class ResultMatcher:
+    """
+    Compares a streamed result with an expected result one row at a time.
+    
+    The expected rows are held as a multiset of normalized rows and each user
+    row is checked off as it arrives, so the user result never has to be
+    materialized or sorted. What is left over afterwards is the row-level diff:
+    expected rows never seen are missing, user rows with nothing left to check
+    off are extra.
+    """
+    
+    # Example rows kept for each side of the diff
+    DIFF_EXAMPLE_ROWS = 5
+    
+    def __init__(self, expected_fingerprint, rename_fields=None, columns=None, example_rows=None):
+        """
+        Args:
+            expected_fingerprint (Counter): From QueryComparator.fingerprint_result,
+                                            not modified
+            rename_fields (dict): Optional field name mapping
+            columns (list): Column names of the user's result, if known up front
+            example_rows (int): Extra/missing rows reported by diff(),
+                                defaults to DIFF_EXAMPLE_ROWS
+        """
+        self.rename_fields = rename_fields
+        self.remaining = Counter(expected_fingerprint)
+        self.unexpected_rows = 0
+        self.example_rows = self.DIFF_EXAMPLE_ROWS if example_rows is None else example_rows
+        self.extra_examples = []
+        
+        # Every expected row has the same columns, so any key describes them
+        expected_key = next(iter(expected_fingerprint), None)
+        self.expected_columns = None if expected_key is None else {name for name, _ in expected_key}
+        self.columns = None
+        self.column_order = []
+        if columns is not None:
+            self.column_order = list(QueryComparator.normalize_record(dict.fromkeys(columns, ''), rename_fields))
+            self.columns = set(self.column_order)
+        self.column_position = {name: index for index, name in enumerate(self.column_order)}
+    
+    def add(self, record):
+        """Check off one row of the user's result."""
+        key = QueryComparator.row_key(record, self.rename_fields)
+        if self.remaining[key] > 0:
+            self.remaining[key] -= 1
+            return
+        
+        self.unexpected_rows += 1
+        if len(self.extra_examples) < self.example_rows:
+            self.extra_examples.append(self._example(key))
+        if self.columns is None:
+            self.columns = {name for name, _ in key}
+    
+    def matches(self):
+        """Return True if every expected row was seen exactly once and nothing else."""
+        return self.unexpected_rows == 0 and not +self.remaining
+    
+    def diff(self):
+        """
+        Describe how the user's result differs from the expected one.
+        
+        Linear in the number of distinct expected rows; values are shown in
+        their normalized (compared) form.
+        
+        Returns:
+            dict: missing_columns/extra_columns (lists, empty if the column sets
+                  agree or are unknown), missing_count/extra_count (ints) and
+                  up to example_rows missing_rows/extra_rows (lists of dicts)
+        """
+        missing_rows = []
+        missing_count = 0
+        for key, count in self.remaining.items():
+            if count <= 0:
+                continue
+            missing_count += count
+            if len(missing_rows) < self.example_rows:
+                missing_rows.extend([self._example(key)] * min(count, self.example_rows - len(missing_rows)))
+        
+        missing_columns, extra_columns = [], []
+        if self.columns is not None and self.expected_columns is not None:
+            missing_columns = sorted(self.expected_columns - self.columns)
+            extra_columns = sorted(self.columns - self.expected_columns)
+        
+        return {
+            'missing_columns': missing_columns,
+            'extra_columns': extra_columns,
+            'missing_count': missing_count,
+            'extra_count': self.unexpected_rows,
+            'missing_rows': missing_rows,
+            'extra_rows': self.extra_examples,
+        }
+    
+    def _example(self, key):
+        """Turn a row key back into a dict, in the user's column order where known."""
+        values = dict(key)
+        position = self.column_position
+        return {name: values[name] for name in sorted(values, key=lambda name: (position.get(name, len(position)), name))}
 
 
 class QueryHintGenerator:
@@ -1,17 +1,39 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
+import io
 import json
+import time
 
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from .models import CustomQuestionSet
 
 from .models import Employee, Project
-from .validators import SQLValidator, QueryComparator, QueryHintGenerator
-from .executor import QueryExecutor
-from .query_configs import QUERY_CONFIGS
+from .validators import SQLValidator, QueryComparator, ResultMatcher
+from .executor import MEMORY_ALIAS, QueryExecutor
+from .exercises import exercise_registry, GRADING_QUERY, GRADING_SCALAR
+from .cross_check import CrossCheck
+from .comparison import DatabaseComparator
+from .streaming import stream_result_response
+from .progress import CANCELLED_MESSAGE, QueryRun, event_stream_response, format_event
+from .inflight import SUPERSEDED_RESPONSE, Superseded, in_flight
+from .request_profiler import profiled
+from .performance import PerformanceProbe
+from .sandbox import sandboxes
+from .validators import SandboxValidator
+from .single_flight import query_key, single_flight
+from . import dataset
+from .submissions import submission_log
+from .analytics import ExerciseAnalytics
+from .warmup import warmup_state
+from .query_log import query_log, TOP_ORDERINGS
+from .memory_profiler import memory_stats
+from . import question_sets
+from .jobs import job_queue
+from .models import Job
 
 
 def home(request):
@@ -30,15 +52,23 @@ def all_questions(request):
 
 
 def primm1(request):
-    return render(request, "primm1.html")
+    return render(request, "primm1.html", _performance_context(settings.PERFORMANCE_FEEDBACK))
 
 
 def primm2(request):
-    return render(request, "primm2.html")
+    return render(request, "primm2.html", _performance_context(settings.PERFORMANCE_FEEDBACK))
 
 
 def primm3(request):
-    return render(request, "primm3.html")
+    return render(request, "primm3.html", _performance_context(settings.PERFORMANCE_FEEDBACK))
+
+
+def _performance_context(enabled):
+    """Template context for the timing and query plan controls (performance_panel.html)."""
+    return {
+        'performance_feedback': enabled,
+        'performance_scales': list(settings.PERFORMANCE_SCALES),
+    }
 
 
 def database_view(request):
@@ -61,10 +91,14 @@ def run_sql_query(request):
     Returns filtered employees (Software Engineers).
     """
     try:
-        result = list(
+        queryset = (
             Employee.objects.filter(job_title="Software Engineer")
             .values("first_name", "last_name", "email", "job_title")
         )
+        result = single_flight.do(
+            query_key('primm1_predict', str(queryset.query), dataset.current_version()),
+            lambda: list(queryset)
+        )
         return JsonResponse({"result": result})
     
     except Exception as e:
@@ -78,8 +112,7 @@ def run_modified_query(request):
     Execute user's modified query for PRIMM1 Modify section.
     Validates and compares with expected result (IT department employees).
     """
-    config = QUERY_CONFIGS['primm1_modify']
-    return _execute_user_query(request, config)
+    return _run_exercise(request, 'primm1_modify')
 
 
 @csrf_exempt
@@ -89,8 +122,7 @@ def run_make_query(request):
     Execute user's custom query for PRIMM1 Make section.
     Checks if query matches expected solution.
     """
-    config = QUERY_CONFIGS['primm1_make']
-    return _execute_make_query(request, config)
+    return _run_exercise(request, 'primm1_make')
 
 
 @require_http_methods(["GET"])
@@ -100,7 +132,11 @@ def run_sql_query_aggregate(request):
     Returns count of Operations department employees.
     """
     try:
-        count = Employee.objects.filter(department="Operations").count()
+        queryset = Employee.objects.filter(department="Operations")
+        count = single_flight.do(
+            query_key('primm2_predict', str(queryset.query), dataset.current_version()),
+            queryset.count
+        )
         return JsonResponse({"result": count})
     
     except Exception as e:
@@ -114,8 +150,7 @@ def run_modified_query_aggregate(request):
     Execute user's modified aggregate query for PRIMM2 Modify section.
     Validates and compares count of Data Scientists.
     """
-    config = QUERY_CONFIGS['primm2_modify']
-    return _execute_user_query_aggregate(request, config)
+    return _run_exercise(request, 'primm2_modify')
 
 
 @csrf_exempt
@@ -125,8 +160,7 @@ def run_make_query_aggregate(request):
     Execute user's custom aggregate query for PRIMM2 Make section.
     Checks SUM of Marketing department salaries.
     """
-    config = QUERY_CONFIGS['primm2_make']
-    return _execute_make_query_aggregate(request, config)
+    return _run_exercise(request, 'primm2_make')
 
 
 @require_http_methods(["GET"])
@@ -142,10 +176,11 @@ def run_sql_query_join(request):
     FROM employees
     INNER JOIN projects ON employees.id = projects.employee_id;
 '''
-        success, result = QueryExecutor.execute_query(query)
+        # Streamed, not coalesced: sharing would mean holding every row in memory
+        success, result = QueryExecutor.stream_query(query, exercise='primm3_predict')
         
         if success:
-            return JsonResponse({"result": result})
+            return stream_result_response(*result)
         else:
             return JsonResponse({"error": result}, status=500)
     
@@ -160,8 +195,7 @@ def run_modified_query_join(request):
     Execute user's modified JOIN query for PRIMM3 Modify section.
     Validates JOIN with date filter.
     """
-    config = QUERY_CONFIGS['primm3_modify']
-    return _execute_user_query(request, config)
+    return _run_exercise(request, 'primm3_modify')
 
 
 @csrf_exempt
@@ -171,145 +205,255 @@ def run_make_query_primm3(request):
     Execute user's custom JOIN query for PRIMM3 Make section.
     Checks LEFT JOIN for employees without projects.
     """
-    config = QUERY_CONFIGS['primm3_make']
-    return _execute_user_query(request, config)
+    return _run_exercise(request, 'primm3_make')
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def run_exercise(request, key):
+    """
+    Grade a submission for any exercise.
+    Built-in exercises use their QUERY_CONFIGS key, custom question sets
+    use 'custom:<pk>:modify' or 'custom:<pk>:make'.
+    """
+    return _run_exercise(request, key)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def run_exercise_events(request, key):
+    """
+    Grade a submission while streaming its progress as server-sent events.
+    Sends 'start' (the run_id for cancel_run), 'progress' (rows fetched,
+    elapsed_ms) while the query runs, 'rows' with each batch of a shown result,
+    then 'verdict', 'error' or 'cancelled'. Submissions that are rejected before
+    running, or only syntax-checked, get the usual JSON response instead.
+    """
+    try:
+        exercise = exercise_registry.get(key)
+    except KeyError:
+        return JsonResponse({"error": "❌ Exercise not found.", "correct": False}, status=404)
+    
+    if exercise.grading == GRADING_QUERY:
+        return _grade_submission(request, exercise)
+    return _grade_with_progress(request, exercise)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def cancel_run(request, run_id):
+    """
+    Stop a submission started through run_exercise_events by this session.
+    The running statement is interrupted and its stream ends with 'cancelled'.
+    """
+    run = QueryRun.find(run_id, _session_key(request))
+    if run is None:
+        return JsonResponse({"error": "❌ Run not found.", "cancelled": False}, status=404)
+    run.cancel()
+    return JsonResponse({"cancelled": True})
 
 
 # ============================================================================
-# Helper Functions
+# API Views - Session Sandbox
 # ============================================================================
 
-def _execute_user_query(request, config):
+def sandbox(request):
+    """Page where students try indexes on their own copy of the dataset."""
+    return render(request, "sandbox.html", {
+        'performance_scales': list(settings.PERFORMANCE_SCALES),
+        'available': QueryExecutor.default_alias() == MEMORY_ALIAS,
+    })
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def sandbox_run(request):
     """
-    Generic function to execute user queries that return multiple rows.
-    
-    Args:
-        request: Django request object
-        config: Dictionary with validation and comparison configuration
-    
-    Returns:
-        JsonResponse with results or error
+    Run a query or index statement in the session's sandbox (sandbox.py).
+    Queries return their first rows with timing and query plan; the sandbox
+    is cloned on first use, at the requested scale.
     """
     try:
         data = json.loads(request.body)
-        user_query = data.get("query", "").strip()
-        
-        # Validate query
-        validator = SQLValidator(user_query)
-        is_valid, error_message = validator.validate()
-        
-        if not is_valid:
-            return JsonResponse({"error": error_message, "correct": False})
-        
-        # Normalize table names
-        normalized_query = validator.normalize_table_names(config['table_mapping'])
-        
-        # Execute query
-        success, result = QueryExecutor.execute_query(normalized_query)
-        
-        if not success:
-            return JsonResponse({"error": result, "correct": False})
-        
-        # Get expected result
-        expected_result = config['get_expected_result']()
-        
-        # Compare results
-        is_correct = QueryComparator.compare_results(
-            result, 
-            expected_result,
-            config.get('rename_fields')
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "❌ Invalid request format."}, status=400)
+    
+    if QueryExecutor.default_alias() != MEMORY_ALIAS:
+        return JsonResponse({"error": "❌ The sandbox needs the in-memory dataset (SQLite)."}, status=400)
+    scale = data.get("scale") or None
+    if scale is not None and scale not in settings.PERFORMANCE_SCALES:
+        return JsonResponse(
+            {"error": f"❌ Unknown scale. Choose one of {', '.join(settings.PERFORMANCE_SCALES)}."}, status=400
         )
-        
-        return JsonResponse({"result": result, "correct": is_correct})
     
-    except json.JSONDecodeError:
-        return JsonResponse({
-            "error": "❌ Invalid request format.",
-            "correct": False
-        }, status=400)
+    query = data.get("query", "").strip()
+    validator = SandboxValidator(query)
+    is_valid, error_message = validator.validate()
+    if not is_valid:
+        return JsonResponse({"error": error_message})
     
-    except Exception as e:
-        return JsonResponse({
-            "error": f"❌ Query Processing Error: {str(e)}",
-            "correct": False
-        }, status=500)
+    session_sandbox = sandboxes.get(_session_key(request), scale)
+    success, result = session_sandbox.run(query, validator.is_schema_change())
+    # Creating an index makes the sandbox bigger
+    sandboxes.evict()
+    
+    response = {"sandbox": session_sandbox.describe()}
+    if not success:
+        return JsonResponse({"error": result, **response})
+    return JsonResponse({**result, **response})
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def sandbox_reset(request):
+    """Drop the session's sandbox; the next statement starts from a fresh copy."""
+    sandboxes.reset(_session_key(request))
+    return JsonResponse({"reset": True})
 
 
-def _execute_make_query(request, config):
+# ============================================================================
+# Helper Functions
+# ============================================================================
+
+def _session_key(request):
+    """Return the request's session key, creating the session on first use."""
+    if not request.session.session_key:
+        request.session.save()
+        # Make SessionMiddleware send the cookie for the new session
+        request.session.modified = True
+    return request.session.session_key
+
+
+def _log_submission(session_key, exercise, user_query, verdict, started):
     """
-    Generic function for "Make" section queries with hint generation.
+    Record a graded attempt in the write-behind submission log.
+    
+    Args:
+        session_key (str): Session the attempt belongs to
+        exercise (str): Exercise key
+        user_query (str): The submitted query
+        verdict (str|bool): 'invalid'/'error', or whether the attempt was correct
+        started (float): time.perf_counter() value taken when grading began
+    """
+    if isinstance(verdict, bool):
+        verdict = 'correct' if verdict else 'incorrect'
+    submission_log.record(
+        exercise=exercise,
+        session_key=session_key,
+        query=user_query,
+        verdict=verdict,
+        latency_ms=(time.perf_counter() - started) * 1000,
+    )
+
+
+def _run_exercise(request, key):
+    """
+    Look up the compiled exercise for a key and grade the submission.
     
     Args:
         request: Django request object
-        config: Dictionary with validation and hint configuration
+        key: Exercise key
     
     Returns:
-        JsonResponse with correctness and hints
+        JsonResponse (or streamed JSON) with results or error
     """
     try:
-        data = json.loads(request.body)
-        user_query = data.get("query", "").strip()
-        
-        # Validate query
-        validator = SQLValidator(user_query)
-        is_valid, error_message = validator.validate()
-        
-        if not is_valid:
-            return JsonResponse({"error": error_message, "correct": False})
-        
-        # Normalize table names
-        normalized_query = validator.normalize_table_names(config['table_mapping'])
-        
-        # Test query syntax
-        success, error = QueryExecutor.test_query_syntax(normalized_query)
-        
-        if not success:
-            return JsonResponse({
-                "error": f"❌ SQL Syntax Error: {error}",
-                "correct": False
-            })
-        
-        # Compare with expected query
-        is_correct = QueryComparator.compare_queries(
-            normalized_query,
-            config['expected_query']
-        )
-        
-        if is_correct:
-            return JsonResponse({"correct": True})
-        
-        # Generate hint
-        hint = QueryHintGenerator.generate_hint(
-            user_query,
-            config['hint_keywords']
-        )
-        
-        return JsonResponse({"correct": False, "hint": hint})
+        exercise = exercise_registry.get(key)
+    except KeyError:
+        return JsonResponse({"error": "❌ Exercise not found.", "correct": False}, status=404)
     
-    except json.JSONDecodeError:
-        return JsonResponse({
-            "error": "❌ Invalid request format.",
-            "correct": False
-        }, status=400)
+    return _grade_submission(request, exercise)
+
+
+def _verdict(exercise, user_query, is_correct, cross_check=None, matcher=None, probe=None):
+    """
+    Build the correctness part of a response, with a hint for wrong answers.
     
-    except Exception as e:
-        return JsonResponse({
-            "error": f"❌ Query Processing Error: {str(e)}",
-            "correct": False
-        }, status=500)
+    When the result itself is shown, a wrong row result also gets the diff
+    against the expected result (missing/extra rows and columns). A running
+    PerformanceProbe adds the timing and query plan of the submission.
+    """
+    if is_correct:
+        response = {"correct": True}
+    elif cross_check is not None and cross_check.unverified:
+        response = {"correct": False, "hint": CrossCheck.RETRY_HINT, "retry": True}
+    elif cross_check is not None and cross_check.failed:
+        response = {"correct": False, "hint": CrossCheck.HINT}
+    else:
+        response = {"correct": False}
+        if exercise.hint_for is not None:
+            response["hint"] = exercise.hint_for(user_query)
+        if matcher is not None and exercise.show_result:
+            response["diff"] = matcher.diff()
+    
+    if probe is not None:
+        response["performance"] = probe.result()
+    return response
+
+
+def _logged_verdict(cross_check, is_correct):
+    """Return the verdict to log: 'error' when the cross-check could not finish."""
+    if cross_check is not None and cross_check.unverified:
+        return 'error'
+    return is_correct
+
 
+def _check_row(matcher, cross_check, record):
+    """Check off one row of a result; after a wrong row the cross-check is pointless."""
+    matcher.add(record)
+    if matcher.unexpected_rows and cross_check is not None and not cross_check.cancelled:
+        cross_check.cancel()
 
-def _execute_user_query_aggregate(request, config):
+
+@profiled
+def _grade_submission(request, exercise):
     """
-    Execute user queries that return aggregate values (COUNT, SUM, etc.).
+    Validate, execute and grade a user's query for a compiled exercise.
+    
+    A resubmission for the same exercise from the same session stops this one
+    (inflight.py), which then answers with SUPERSEDED_RESPONSE.
     
     Args:
         request: Django request object
-        config: Dictionary with validation and comparison configuration
+        exercise: Compiled Exercise
     
     Returns:
-        JsonResponse with result and correctness
+        JsonResponse (or streamed JSON) with results or error
     """
+    session_key = _session_key(request)
+    ticket = in_flight.begin(session_key, exercise.key)
+    try:
+        with ticket.active():
+            response = _grade(request, exercise, session_key, ticket)
+    except BaseException:
+        ticket.finish()
+        raise
+    
+    # A streamed result reports the supersession at the end of its body
+    if ticket.superseded and not response.streaming:
+        ticket.finish()
+        return JsonResponse(SUPERSEDED_RESPONSE, status=409)
+    return ticket.track(response)
+
+
+def _grade(request, exercise, session_key, ticket):
+    """
+    Grade a submission under its in-flight ticket; see _grade_submission.
+    
+    Every answer to a submission, failures included, goes through log(); only
+    a request without a readable query is not an attempt and is not logged.
+    """
+    started = time.perf_counter()
+    user_query = None
+    
+    def log(verdict):
+        if not ticket.superseded and user_query is not None:
+            _log_submission(session_key, exercise.key, user_query, verdict, started)
+    
+    def fail(error, verdict='error', status=200):
+        log(verdict)
+        return JsonResponse({"error": error, "correct": False}, status=status)
+    
     try:
         data = json.loads(request.body)
         user_query = data.get("query", "").strip()
@@ -319,154 +463,270 @@ def _execute_user_query_aggregate(request, config):
         is_valid, error_message = validator.validate()
         
         if not is_valid:
-            return JsonResponse({"error": error_message, "correct": False})
+            return fail(error_message, 'invalid')
         
         # Normalize table names
-        normalized_query = validator.normalize_table_names(config['table_mapping'])
-        
-        # Execute query
-        success, result = QueryExecutor.execute_query_single_value(normalized_query)
+        normalized_query = exercise.rewrite_tables(user_query)
+        # Timing and query plan, if asked for, are measured while grading runs
+        probe = PerformanceProbe.start(exercise, normalized_query, data)
+        
+        if exercise.grading == GRADING_QUERY:
+            # Test query syntax, then compare with expected query
+            success, error = QueryExecutor.test_query_syntax(
+                normalized_query, time_limit_ms=exercise.time_budget_ms, exercise=exercise.key,
+                tables=exercise.tables
+            )
+            
+            if not success:
+                return fail(f"❌ SQL Syntax Error: {error}")
+            
+            is_correct = QueryComparator.normalize_query(normalized_query) == exercise.expected_query
+            log(is_correct)
+            return JsonResponse(_verdict(exercise, user_query, is_correct, probe=probe))
+        
+        if exercise.compares_in_database:
+            # Result is hidden, so let the database compute the difference
+            # instead of fetching every row into the worker
+            success, comparison = DatabaseComparator.compare(
+                normalized_query, exercise.expected_sql, exercise.rename_fields,
+                time_limit_ms=exercise.time_budget_ms, exercise=exercise.key,
+                tables=exercise.tables
+            )
+            
+            if not success:
+                return fail(comparison)
+            
+            cross_check = CrossCheck.start(exercise, normalized_query) if comparison['matches'] else None
+            is_correct = CrossCheck.confirm(cross_check, comparison['matches'])
+            log(_logged_verdict(cross_check, is_correct))
+            return JsonResponse(_verdict(exercise, user_query, is_correct, cross_check, probe=probe))
+        
+        if exercise.grades_in_snapshot:
+            # The live database can change between two queries, so the expected
+            # query runs again next to the student's, in one read transaction
+            success, results = QueryExecutor.execute_batch(
+                [exercise.expected_sql, normalized_query],
+                time_limit_ms=exercise.time_budget_ms, exercise=exercise.key,
+                tables=exercise.tables
+            )
+            
+            if not success:
+                return fail(results)
+            
+            (expected_ok, expected_rows), (success, result) = results
+            if not expected_ok:
+                return fail(f"❌ Expected query failed: {expected_rows}")
+            
+            expected_result = exercise.expected_from_rows(*expected_rows)
+            if success and probe is not None:
+                probe.record(None, len(result[1]))
+            if success and exercise.grading == GRADING_SCALAR:
+                _, rows = result
+                result = rows[0][0] if rows else None
+        else:
+            # Get expected result (cached per dataset version)
+            success, expected_result = exercise.expected()
+            
+            if not success:
+                return fail(expected_result)
+            
+            if exercise.grading == GRADING_SCALAR:
+                executed = time.perf_counter()
+                success, result = QueryExecutor.execute_query_single_value(
+                    normalized_query, time_limit_ms=exercise.time_budget_ms, exercise=exercise.key,
+                    tables=exercise.tables
+                )
+                if success and probe is not None:
+                    # Only the first row is fetched
+                    probe.record((time.perf_counter() - executed) * 1000, None)
+            else:
+                # Rows are compared one at a time as they are fetched
+                success, result = QueryExecutor.stream_query(
+                    normalized_query, time_limit_ms=exercise.time_budget_ms, exercise=exercise.key,
+                    tables=exercise.tables
+                )
         
         if not success:
-            return JsonResponse({"error": result, "correct": False})
+            return fail(result)
         
-        # Get expected result
-        expected_result = config['get_expected_result']()
-        
-        # Compare results
-        is_correct = (result == expected_result)
+        if exercise.grading == GRADING_SCALAR:
+            # Correct answers must also hold on the perturbed dataset copies
+            cross_check = CrossCheck.start(exercise, normalized_query) if result == expected_result else None
+            is_correct = CrossCheck.confirm(cross_check, result == expected_result)
+            log(_logged_verdict(cross_check, is_correct))
+            
+            response = _verdict(exercise, user_query, is_correct, cross_check, probe=probe)
+            if exercise.show_result:
+                response = {"result": result, **response}
+            return JsonResponse(response)
+        
+        columns, rows = result
+        matcher = ResultMatcher(expected_result, exercise.rename_fields, columns, settings.RESULT_DIFF_EXAMPLES)
+        # Runs on the perturbed dataset copies while the rows are being compared
+        cross_check = CrossCheck.start(exercise, normalized_query)
+        
+        def verdict():
+            if probe is not None:
+                probe.record(rows.elapsed_ms, rows.rows_fetched)
+            is_correct = CrossCheck.confirm(cross_check, matcher.matches())
+            log(_logged_verdict(cross_check, is_correct))
+            return _verdict(exercise, user_query, is_correct, cross_check, matcher, probe)
+        
+        if exercise.show_result:
+            return stream_result_response(
+                columns,
+                rows,
+                on_row=lambda row: _check_row(matcher, cross_check, dict(zip(columns, row))),
+                trailer=verdict,
+                ticket=ticket
+            )
         
-        return JsonResponse({"result": result, "correct": is_correct})
+        for row in rows:
+            _check_row(matcher, cross_check, dict(zip(columns, row)))
+        return JsonResponse(verdict())
     
     except json.JSONDecodeError:
-        return JsonResponse({
-            "error": "❌ Invalid request format.",
-            "correct": False
-        }, status=400)
+        return fail("❌ Invalid request format.", status=400)
     
     except Exception as e:
-        return JsonResponse({
-            "error": f"❌ Query Processing Error: {str(e)}",
-            "correct": False
-        }, status=500)
+        return fail(f"❌ Query Processing Error: {str(e)}", status=500)
 
 
-def _execute_make_query_aggregate(request, config):
+def _grade_with_progress(request, exercise):
     """
-    Execute "Make" queries with aggregate functions and hints.
+    Validate a submission and start it as a QueryRun whose progress is streamed.
     
     Args:
         request: Django request object
-        config: Dictionary with configuration
+        exercise: Compiled Exercise with rows or scalar grading
     
     Returns:
-        JsonResponse with correctness and hints
+        JsonResponse if the submission cannot run, else a text/event-stream response
     """
+    session_key = _session_key(request)
+    started = time.perf_counter()
+    
     try:
         data = json.loads(request.body)
-        user_query = data.get("query", "").strip()
-        
-        # Validate query
-        validator = SQLValidator(user_query)
-        is_valid, error_message = validator.validate()
-        
-        if not is_valid:
-            return JsonResponse({"error": error_message, "correct": False})
-        
-        # Normalize table names
-        normalized_query = validator.normalize_table_names(config['table_mapping'])
-        
-        # Execute query
-        success, result = QueryExecutor.execute_query_single_value(normalized_query)
-        
-        if not success:
-            return JsonResponse({"error": result, "correct": False})
-        
-        # Get expected result
-        expected_result = config['get_expected_result']()
-        
-        # Compare results
-        is_correct = (result == expected_result)
-        
-        if is_correct:
-            return JsonResponse({"correct": True})
-        
-        # Generate hint
-        hint = QueryHintGenerator.generate_hint(
-            user_query,
-            config['hint_keywords']
-        )
-        
-        return JsonResponse({"correct": is_correct, "hint": hint})
-    
     except json.JSONDecodeError:
         return JsonResponse({
             "error": "❌ Invalid request format.",
             "correct": False
         }, status=400)
+    user_query = data.get("query", "").strip()
     
-    except Exception as e:
-        return JsonResponse({
-            "error": f"❌ Query Processing Error: {str(e)}",
-            "correct": False
-        }, status=500)
-    if request.method == "POST":
-        try:
-            data = json.loads(request.body)
-            user_query = data.get("query", "").strip()
-
-            if not user_query:
-                return JsonResponse({"error": "❌ Query is empty. Please enter a valid SQL query.", "correct": False})
-
-            if any(word in user_query.upper() for word in ["DROP", "DELETE", "UPDATE", "INSERT", "ALTER"]):
-                return JsonResponse({"error": "❌ Unsafe query detected. Only SELECT statements are allowed.", "correct": False})
-
-
-            corrected_query = (
-                user_query
-                .replace("employees", "website_employee")
-                .replace("projects", "website_project")
-                .replace("employee_email", "employee_id")  # Fix incorrect column references
-            )
-
-            with connection.cursor() as cursor:
-                try:
-                    cursor.execute(corrected_query)
-                    columns = [col[0] for col in cursor.description]
-                    user_result = [dict(zip(columns, row)) for row in cursor.fetchall()]
-                except Exception as e:
-                    return JsonResponse({"error": f"❌ SQL Execution Error: {str(e)}", "correct": False})
-
-            expected_result = list(
-                Employee.objects.filter(project__isnull=True)
-                .values("first_name", "last_name")
-            )
-
+    def log(verdict):
+        _log_submission(session_key, exercise.key, user_query, verdict, started)
+    
+    is_valid, error_message = SQLValidator(user_query).validate()
+    if not is_valid:
+        log('invalid')
+        return JsonResponse({"error": error_message, "correct": False})
+    
+    success, expected_result = exercise.expected()
+    if not success:
+        log('error')
+        return JsonResponse({"error": expected_result, "correct": False})
+    
+    normalized_query = exercise.rewrite_tables(user_query)
+    run = QueryRun(
+        session_key, normalized_query, time_limit_ms=exercise.time_budget_ms, exercise=exercise.key,
+        tables=exercise.tables
+    )
+    # A resubmission for the same exercise cancels this run (inflight.py)
+    ticket = in_flight.begin(session_key, exercise.key)
+    try:
+        ticket.attach(run.cancel)
+    except Superseded:
+        ticket.finish()
+        return JsonResponse(SUPERSEDED_RESPONSE, status=409)
+    run.start()
+    with ticket.active():
+        probe = PerformanceProbe.start(exercise, normalized_query, data)
+    return event_stream_response(
+        request, _progress_events(run, ticket, exercise, user_query, expected_result, log, probe)
+    )
 
 
-            def normalize_data(data):
-                return sorted(
-                    [{k: str(v).strip().lower() for k, v in d.items()} for d in data],
-                    key=lambda x: tuple(x.values())
+def _progress_events(run, ticket, exercise, user_query, expected_result, log, probe=None):
+    """
+    Yield the server-sent events of a running submission, ending with its verdict.
+    
+    A cancelled or superseded submission is not graded, so it is not logged either.
+    """
+    matcher = None
+    cross_check = None
+    first_row = None
+    try:
+        yield format_event('start', {'run_id': run.id})
+        
+        for kind, payload in run.events():
+            if kind == 'progress':
+                yield format_event('progress', payload)
+                continue
+            
+            if exercise.grading == GRADING_SCALAR:
+                if first_row is None:
+                    first_row = payload[0]
+                continue
+            
+            if matcher is None:
+                matcher = ResultMatcher(
+                    expected_result, exercise.rename_fields, run.columns, settings.RESULT_DIFF_EXAMPLES
                 )
-
-            user_result_normalized = normalize_data(user_result)
-            expected_result_normalized = normalize_data(expected_result)
-
-
-            is_correct = user_result_normalized == expected_result_normalized
-
-            if not is_correct and "IS NULL" not in user_query.upper():
-                return JsonResponse({"error": "❌ Hint: Make sure you use `WHERE projects.employee_email IS NULL`.", "correct": False})
-
-            return JsonResponse({"result": user_result, "correct": is_correct})
-
-        except json.JSONDecodeError:
-            return JsonResponse({"error": "❌ JSON Decode Error: Invalid request format.", "correct": False})
-        except Exception as e:
-            return JsonResponse({"error": f"❌ Query Processing Error: {str(e)}", "correct": False})
-
-    return JsonResponse({"error": "❌ Invalid request method.", "correct": False})
+                # Runs on the perturbed dataset copies while the rows are being compared
+                cross_check = CrossCheck.start(exercise, run.query)
+            records = [dict(zip(run.columns, row)) for row in payload]
+            for record in records:
+                _check_row(matcher, cross_check, record)
+            if exercise.show_result:
+                yield format_event('rows', {'rows': records})
+        
+        if run.cancelled.is_set() or run.error:
+            if cross_check is not None:
+                cross_check.cancel()
+            if ticket.superseded:
+                yield format_event('cancelled', SUPERSEDED_RESPONSE)
+            elif run.cancelled.is_set():
+                yield format_event('cancelled', {'error': run.error or CANCELLED_MESSAGE, 'correct': False})
+            else:
+                log('error')
+                yield format_event('error', {'error': run.error, 'correct': False})
+            return
+        
+        if probe is not None:
+            probe.record(run.elapsed_ms, run.rows_fetched)
+        
+        if exercise.grading == GRADING_SCALAR:
+            result = first_row[0] if first_row is not None else None
+            cross_check = CrossCheck.start(exercise, run.query) if result == expected_result else None
+            is_correct = CrossCheck.confirm(cross_check, result == expected_result)
+            log(_logged_verdict(cross_check, is_correct))
+            
+            response = _verdict(exercise, user_query, is_correct, cross_check, probe=probe)
+            if exercise.show_result:
+                response = {"result": result, **response}
+            yield format_event('verdict', response)
+            return
+        
+        if matcher is None:
+            # No rows at all
+            matcher = ResultMatcher(
+                expected_result, exercise.rename_fields, run.columns or [], settings.RESULT_DIFF_EXAMPLES
+            )
+            cross_check = CrossCheck.start(exercise, run.query)
+        is_correct = CrossCheck.confirm(cross_check, matcher.matches())
+        log(_logged_verdict(cross_check, is_correct))
+        yield format_event('verdict', _verdict(exercise, user_query, is_correct, cross_check, matcher, probe))
+    
+    except Exception as e:
+        log('error')
+        yield format_event('error', {"error": f"❌ Query Processing Error: {str(e)}", "correct": False})
+    
+    finally:
+        # Also stops the query when the client goes away mid-stream
+        run.close()
+        ticket.finish()
 
 
 def add_question_set(request):
@@ -482,6 +742,7 @@ def add_question_set(request):
                 # Table selection
                 uses_employees=request.POST.get('uses_employees') == 'true',
                 uses_projects=request.POST.get('uses_projects') == 'true',
+                performance_feedback=request.POST.get('performance_feedback') == 'true',
                 
                 # Predict and Run
                 predict_query=request.POST.get('predict_query'),
@@ -510,9 +771,13 @@ def add_question_set(request):
             )
             
             question_set.save()
+            # Check the queries and precompute the expected results off the request thread
+            job_queue.enqueue('validate_question_set', {'pk': question_set.pk})
+            for section in ('modify', 'make'):
+                job_queue.enqueue('fingerprint_expected', {'key': f"custom:{question_set.pk}:{section}"})
             messages.success(request, f'Question set "{question_set.name}" created successfully!')
             return redirect('all-questions')
-            
+        
         except Exception as e:
             messages.error(request, f'Error creating question set: {str(e)}')
             return render(request, "add_question_set.html")
@@ -524,7 +789,8 @@ def view_custom_question_set(request, pk):
     """Display a custom question set (similar to primm1/2/3)."""
     question_set = get_object_or_404(CustomQuestionSet, pk=pk)
     return render(request, "custom_question_set.html", {
-        'question_set': question_set
+        'question_set': question_set,
+        **_performance_context(question_set.performance_feedback),
     })
 
 
@@ -542,6 +808,156 @@ def delete_question_set(request, pk):
     return redirect('all-questions')
 
 
+@login_required
+def exercise_dashboard(request):
+    """Show per-exercise attempt statistics (staff only)."""
+    if not request.user.is_staff:
+        messages.error(request, 'You do not have permission to view the dashboard.')
+        return redirect('all-questions')
+    
+    exercises, question_sets = ExerciseAnalytics.dashboard()
+    return render(request, "dashboard.html", {
+        'exercises': exercises,
+        'question_sets': question_sets,
+        'jobs': Job.objects.all()[:settings.JOB_DASHBOARD_ROWS],
+    })
+
+
+@login_required
+def query_stats(request):
+    """Show the worst query fingerprints and recent slow queries (staff only)."""
+    if not request.user.is_staff:
+        messages.error(request, 'You do not have permission to view query statistics.')
+        return redirect('all-questions')
+    
+    order_by = request.GET.get('order_by', 'total_ms')
+    if order_by not in TOP_ORDERINGS:
+        order_by = 'total_ms'
+    
+    return render(request, "query_stats.html", {
+        'log': query_log.export(order_by),
+        'orderings': TOP_ORDERINGS,
+    })
+
+
+@login_required
+@require_http_methods(["GET"])
+def query_stats_export(request):
+    """Export the query log of this worker as JSON (staff only)."""
+    if not request.user.is_staff:
+        return JsonResponse({"error": "❌ Permission denied."}, status=403)
+    
+    order_by = request.GET.get('order_by', 'total_ms')
+    if order_by not in TOP_ORDERINGS:
+        return JsonResponse({"error": f"❌ order_by must be one of {', '.join(TOP_ORDERINGS)}."}, status=400)
+    
+    try:
+        limit = int(request.GET.get('limit', 20))
+    except ValueError:
+        return JsonResponse({"error": "❌ limit must be a number."}, status=400)
+    
+    report = query_log.export(order_by, limit)
+    report['single_flight'] = single_flight.stats()
+    report['sandboxes'] = sandboxes.stats()
+    return JsonResponse(report)
+
+
+@login_required
+@require_http_methods(["GET"])
+def memory_stats_export(request):
+    """Export the per-endpoint memory profile of this worker as JSON (staff only)."""
+    if not request.user.is_staff:
+        return JsonResponse({"error": "❌ Permission denied."}, status=403)
+    
+    return JsonResponse(memory_stats.export())
+
+
+@login_required
+@require_http_methods(["GET"])
+def export_question_sets(request):
+    """Download every custom question set as JSONL or ZIP (staff only)."""
+    if not request.user.is_staff:
+        return JsonResponse({"error": "❌ Permission denied."}, status=403)
+    
+    export_format = request.GET.get('format', 'jsonl')
+    if export_format == 'jsonl':
+        response = StreamingHttpResponse(question_sets.iter_jsonl(), content_type='application/jsonl')
+    elif export_format == 'zip':
+        buffer = io.BytesIO()
+        question_sets.write_zip(buffer)
+        response = HttpResponse(buffer.getvalue(), content_type='application/zip')
+    else:
+        return JsonResponse({"error": "❌ format must be jsonl or zip."}, status=400)
+    
+    response['Content-Disposition'] = f'attachment; filename="{question_sets.EXPORT_NAME}.{export_format}"'
+    return response
+
+
+@login_required
+@require_http_methods(["POST"])
+def import_question_sets(request):
+    """
+    Import question sets from an uploaded JSONL or ZIP export (staff only).
+    
+    Every set is validated and its queries test-executed in parallel; the
+    valid sets are created, and the response reports the invalid ones.
+    Pass dry_run=1 to only validate.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({"error": "❌ Permission denied."}, status=403)
+    
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({"error": "❌ Upload a JSONL or ZIP file as 'file'."}, status=400)
+    if upload.size > settings.QUESTION_SET_IMPORT_MAX_BYTES:
+        return JsonResponse({"error": "❌ File is too large."}, status=400)
+    
+    try:
+        entries = question_sets.read_entries(upload.read(), upload.name)
+    except ValueError as e:
+        return JsonResponse({"error": f"❌ {e}"}, status=400)
+    
+    report = question_sets.QuestionSetImporter().run(
+        entries, user=request.user, dry_run=request.POST.get('dry_run') in ('1', 'true')
+    )
+    return JsonResponse(report.as_dict())
+
+
+@login_required
+@require_http_methods(["GET"])
+def job_status(request, pk):
+    """Report the status and result of a background job (staff only)."""
+    if not request.user.is_staff:
+        return JsonResponse({"error": "❌ Permission denied."}, status=403)
+    
+    job = get_object_or_404(Job, pk=pk)
+    return JsonResponse({
+        "id": job.pk,
+        "kind": job.kind,
+        "payload": job.payload,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    })
+
+
+@require_http_methods(["GET"])
+def readiness(request):
+    """
+    Report whether this worker has finished warming up.
+    
+    Returns 200 once warmup is done and 503 before that (or if it failed),
+    with the warmup timings, for load balancer readiness checks.
+    """
+    report = warmup_state.as_dict()
+    return JsonResponse(report, status=200 if report['ready'] else 503)
+
+
 @require_http_methods(["GET"])
 def custom_question_run_predict(request, pk):
     """
@@ -552,10 +968,12 @@ def custom_question_run_predict(request, pk):
         question_set = get_object_or_404(CustomQuestionSet, pk=pk)
         
         # Execute the predict query
-        success, result = QueryExecutor.execute_query(question_set.predict_query)
+        success, result = QueryExecutor.stream_query(
+            question_set.predict_query, exercise=f"custom:{pk}:predict", tables=question_set.tables
+        )
         
         if success:
-            return JsonResponse({"result": result})
+            return stream_result_response(*result)
         else:
             return JsonResponse({"error": result}, status=500)
     
@@ -570,45 +988,7 @@ def custom_question_run_modify(request, pk):
     Execute and validate the user's modified query.
     Compares user's query results with the expected correct query.
     """
-    try:
-        question_set = get_object_or_404(CustomQuestionSet, pk=pk)
-        
-        # Get user's query from request
-        data = json.loads(request.body)
-        user_query = data.get("query", "").strip()
-        
-        if not user_query:
-            return JsonResponse({"error": "❌ Query is empty. Please enter a valid SQL query.", "correct": False})
-        
-        # Validate the query
-        validator = SQLValidator(user_query)
-        is_valid, error_message = validator.validate()
-        
-        if not is_valid:
-            return JsonResponse({"error": error_message, "correct": False})
-        
-        # Execute user's query
-        success, user_result = QueryExecutor.execute_query(user_query)
-        if not success:
-            return JsonResponse({"error": f"❌ SQL Execution Error: {user_result}", "correct": False})
-        
-        # Execute expected query
-        success, expected_result = QueryExecutor.execute_query(question_set.modify_correct_query)
-        if not success:
-            return JsonResponse({"error": f"❌ Expected query failed: {expected_result}", "correct": False})
-        
-        # Compare results
-        is_correct = QueryComparator.compare_results(user_result, expected_result)
-        
-        return JsonResponse({
-            "result": user_result,
-            "correct": is_correct
-        })
-    
-    except json.JSONDecodeError:
-        return JsonResponse({"error": "❌ JSON Decode Error: Invalid request format.", "correct": False})
-    except Exception as e:
-        return JsonResponse({"error": f"❌ Query Processing Error: {str(e)}", "correct": False})
+    return _run_exercise(request, f"custom:{pk}:modify")
 
 
 @csrf_exempt
@@ -618,39 +998,4 @@ def custom_question_run_make(request, pk):
     Execute and validate the user's make query.
     Compares user's query results with the expected correct query.
     """
-    try:
-        question_set = get_object_or_404(CustomQuestionSet, pk=pk)
-        
-        # Get user's query from request
-        data = json.loads(request.body)
-        user_query = data.get("query", "").strip()
-        
-        if not user_query:
-            return JsonResponse({"error": "❌ Query is empty. Please enter a valid SQL query.", "correct": False})
-        
-        # Validate the query
-        validator = SQLValidator(user_query)
-        is_valid, error_message = validator.validate()
-        
-        if not is_valid:
-            return JsonResponse({"error": error_message, "correct": False})
-        
-        # Execute user's query
-        success, user_result = QueryExecutor.execute_query(user_query)
-        if not success:
-            return JsonResponse({"error": f"❌ SQL Execution Error: {user_result}", "correct": False})
-        
-        # Execute expected query
-        success, expected_result = QueryExecutor.execute_query(question_set.make_correct_query)
-        if not success:
-            return JsonResponse({"error": f"❌ Expected query failed: {expected_result}", "correct": False})
-        
-        # Compare results
-        is_correct = QueryComparator.compare_results(user_result, expected_result)
-        
-        return JsonResponse({"correct": is_correct})
-    
-    except json.JSONDecodeError:
-        return JsonResponse({"error": "❌ JSON Decode Error: Invalid request format.", "correct": False})
-    except Exception as e:
-        return JsonResponse({"error": f"❌ Query Processing Error: {str(e)}", "correct": False})
\ No newline at end of file
+    return _run_exercise(request, f"custom:{pk}:make")
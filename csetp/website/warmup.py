@@ -0,0 +1,244 @@
+"""
+Worker Warmup
+Pays the one-off startup costs before the first student request does.
+
+A fresh worker would otherwise import the grading modules, compile every exercise, open
+the exercise connection and compute every expected result while serving its
+first submissions. Warmup does all of that up front, records how long each step
+took, and flips the readiness flag served by the /ready/ endpoint when done.
+
+WebsiteConfig.ready starts it in a background thread (WARMUP_ON_STARTUP);
+`python manage.py warmup` runs it in the foreground and prints the report.
+"""
+
+import importlib
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.template.loader import get_template
+
+
+# Modules that are slow to import on a cold worker
+WARMUP_MODULES = [
+    'website.validators',
+    'website.executor',
+    'website.streaming',
+    'website.views',
+]
+
+# Templates rendered by student-facing pages
+WARMUP_TEMPLATES = [
+    'home.html',
+    'primm.html',
+    'primm1.html',
+    'primm2.html',
+    'primm3.html',
+    'all-questions.html',
+    'custom_question_set.html',
+]
+
+# Management commands that serve requests and so may run the warmup and job
+# threads; any other manage.py command (migrate, shell, ...) skips them
+WARMUP_COMMANDS = {'runserver'}
+
+# Server executables that serve requests; other programs that import Django
+# (scripts, test runners, celery, ...) skip the threads unless SERVES_REQUESTS is set
+WARMUP_SERVERS = {'gunicorn', 'uwsgi', 'daphne'}
+
+
+class WarmupState:
+    """Progress and timings of the warmup, shared with the readiness endpoint."""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.status = 'pending'  # pending, running, ready or failed
+        self.started_at = None
+        self.finished_at = None
+        self.steps = []
+        self.warnings = []
+        self.error = None
+    
+    @property
+    def ready(self):
+        return self.status == 'ready'
+    
+    def as_dict(self):
+        """
+        Describe the warmup for the readiness endpoint.
+        
+        Returns:
+            dict: Status, per-step timings in milliseconds, warnings and error
+        """
+        with self.lock:
+            total_ms = None
+            if self.started_at is not None and self.finished_at is not None:
+                total_ms = round((self.finished_at - self.started_at) * 1000, 1)
+            return {
+                'ready': self.ready,
+                'status': self.status,
+                'total_ms': total_ms,
+                'steps': [{'step': name, 'ms': ms} for name, ms in self.steps],
+                'warnings': list(self.warnings),
+                'error': self.error,
+            }
+    
+    def record(self, name, seconds):
+        """Add a timed step, in seconds, to the report."""
+        with self.lock:
+            self.steps.append((name, round(seconds * 1000, 1)))
+
+
+def _timed(state, name, func):
+    start = time.perf_counter()
+    result = func()
+    state.record(name, time.perf_counter() - start)
+    return result
+
+
+warmup_state = WarmupState()
+
+
+def _import_modules():
+    for module in WARMUP_MODULES:
+        importlib.import_module(module)
+
+
+def _load_templates():
+    for template in WARMUP_TEMPLATES:
+        get_template(template)
+
+
+def _open_connection():
+    from .executor import QueryExecutor
+    
+    # Also loads the in-memory dataset copy in 'memory' execution mode
+    with QueryExecutor.get_cursor() as cursor:
+        cursor.execute('SELECT 1 FROM employees LIMIT 1')
+        cursor.fetchall()
+
+
+def _compile_exercises(state):
+    from .exercises import exercise_registry
+    
+    for key in exercise_registry.keys():
+        exercise = exercise_registry.get(key)
+        if exercise.expected_query is not None:
+            continue
+        success, error = exercise.expected()
+        if not success:
+            with state.lock:
+                state.warnings.append(f"{key}: {error}")
+
+
+def _prime_caches():
+    from . import dataset
+    
+    dataset.current_version()
+
+
+def run_warmup(state=None):
+    """
+    Import, compile and precompute everything a first request would need.
+    
+    A failing expected query only adds a warning; the worker is still marked
+    ready, as it would serve every other exercise. Any other error marks the
+    warmup as failed.
+    
+    Args:
+        state (WarmupState): State to update, defaults to the process-wide one
+    
+    Returns:
+        WarmupState: The updated state
+    """
+    state = state or warmup_state
+    with state.lock:
+        state.status = 'running'
+        state.started_at = time.perf_counter()
+        state.finished_at = None
+        # Keep steps recorded before the warmup started (app imports)
+        state.steps = [step for step in state.steps if step[0] == 'app imports']
+        state.warnings = []
+        state.error = None
+    
+    try:
+        _timed(state, 'import modules', _import_modules)
+        _timed(state, 'load templates', _load_templates)
+        _timed(state, 'open exercise connection', _open_connection)
+        _timed(state, 'prime dataset version', _prime_caches)
+        _timed(state, 'compile exercises', lambda: _compile_exercises(state))
+        status, error = 'ready', None
+    except Exception as e:
+        status, error = 'failed', f"{type(e).__name__}: {e}"
+    
+    with state.lock:
+        state.status = status
+        state.error = error
+        state.finished_at = time.perf_counter()
+    return state
+
+
+def should_warm_up(argv=None):
+    """
+    Decide whether this process should start the background warmup.
+    
+    Args:
+        argv (list): Command line, defaults to sys.argv
+    
+    Returns:
+        bool: True if WARMUP_ON_STARTUP is set and the process serves requests
+    """
+    return settings.WARMUP_ON_STARTUP and serves_requests(argv)
+
+
+def serves_requests(argv=None):
+    """
+    Decide whether this process serves requests (and so runs background threads).
+    
+    Only known servers qualify: the runserver autoreloader's child (or
+    runserver --noreload), the WSGI/ASGI servers in WARMUP_SERVERS, or any
+    process started with SERVES_REQUESTS (CSETP_SERVES_REQUESTS=1), e.g. a
+    server not listed here.
+    
+    Args:
+        argv (list): Command line, defaults to sys.argv
+    
+    Returns:
+        bool: True if this process is known to serve requests
+    """
+    if settings.SERVES_REQUESTS:
+        return True
+    
+    argv = argv if argv is not None else sys.argv
+    if not argv:
+        return False
+    
+    program = Path(argv[0])
+    if program.name == 'manage.py':
+        if len(argv) < 2 or argv[1] not in WARMUP_COMMANDS:
+            return False
+        # Only the reloaded child process serves requests
+        return argv[1] != 'runserver' or '--noreload' in argv or bool(os.environ.get('RUN_MAIN'))
+    
+    # `python -m gunicorn` runs gunicorn/__main__.py
+    if program.name == '__main__.py':
+        return program.parent.name in WARMUP_SERVERS
+    return program.name in WARMUP_SERVERS
+
+
+def start_warmup():
+    """Run the warmup in a daemon thread so worker startup is not delayed."""
+    def target():
+        try:
+            run_warmup()
+        finally:
+            # The thread's own connections are never reused
+            connections.close_all()
+    
+    thread = threading.Thread(target=target, name='website-warmup', daemon=True)
+    thread.start()
+    return thread